@@ -6,11 +6,10 @@ This makes them available for client shopping
 
 from flask import Flask
 from database import db, Product, Movement, Counter
+import storage
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///pantry.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+storage.init_app(app)
 
 def add_inventory_to_all_products():
     with app.app_context():
@@ -20,8 +19,8 @@ def add_inventory_to_all_products():
         products = Product.query.all()
         
         # Add 50 units of each product to Pantry location
-        for product in products:
-            movement_id = Counter.get_next_id()
+        movement_ids = Counter.get_next_ids('movements', len(products))
+        for product, movement_id in zip(products, movement_ids):
             new_movement = Movement(
                 movement_id=movement_id,
                 product_id=product.product_id,
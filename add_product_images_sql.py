@@ -6,12 +6,11 @@ Uses free Unsplash images for food items
 
 from flask import Flask
 from database import db, Product
+import storage
 
 # Create app context
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///pantry.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+storage.init_app(app)
 
 # Image mapping for each product
 PRODUCT_IMAGES = {
@@ -82,7 +81,8 @@ def add_images_to_products():
         db.session.commit()
 
     print(f"\n✅ Successfully updated {updated_count} products with images!")
-    print("Refresh your browser to see the changes.")
+    print("Run 'python images.py mirror' to keep local copies of them,")
+    print("then refresh your browser to see the changes.")
 
 if __name__ == '__main__':
     add_images_to_products()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Static asset pipeline for SmartChoice Pantry System
+The build step copies every static file (except uploaded product images)
+into static/build under a name that carries a hash of its content, writes
+gzip and, when the brotli package is installed, brotli variants of the text
+files next to it, and records the mapping in static/build/manifest.json.
+
+Templates link assets with asset_url('js/script.js'), which resolves to the
+hashed copy when a current manifest exists and to the plain file otherwise
+(in debug mode, before any build, or after a static file changed). Hashed files never change, so they are
+served with a far-future immutable Cache-Control header, in the best
+precompressed variant the client accepts.
+
+Usage:
+  python assets.py build
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import sys
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip variants are written
+    brotli = None
+
+BUILD_DIR = 'build'
+MANIFEST = 'manifest.json'
+SKIP_DIRS = {BUILD_DIR, os.path.join('images', 'products')}  # Build output and uploads
+COMPRESSIBLE = {'.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.ico'}
+MIN_COMPRESS_BYTES = 256
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Preferred first; each is (Accept-Encoding token, file suffix)
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# A minified file names its source map relative to itself; the build points it at the hashed map
+_SOURCE_MAP = re.compile(rb'(sourceMappingURL=)([\w.-]+\.map)')
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_ROOT = os.path.join(ROOT, 'static')
+
+
+def _source_files(static_root):
+    for folder, dirs, files in os.walk(static_root):
+        relative = os.path.relpath(folder, static_root)
+        dirs[:] = sorted(d for d in dirs if os.path.normpath(os.path.join(relative, d)) not in SKIP_DIRS)
+        for name in sorted(files):
+            yield os.path.normpath(os.path.join(relative, name))
+
+
+def hashed_name(path, content):
+    """'js/script.js' -> 'js/script.<12 hex digits of sha256>.js'"""
+    stem, ext = os.path.splitext(path)
+    if ext == '.map':  # Keep 'mdb.min.css.map' recognisable as a map
+        stem, inner = os.path.splitext(stem)
+        ext = inner + ext
+    return f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(content)
+    os.replace(temporary, path)
+
+
+def _link_source_maps(path, content, manifest):
+    folder = os.path.dirname(path).replace(os.sep, '/')
+
+    def hashed_map(match):
+        name = f'{folder}/{match.group(2).decode()}' if folder else match.group(2).decode()
+        hashed = manifest.get(name)
+        return match.group(1) + (os.path.basename(hashed).encode() if hashed else match.group(2))
+    return _SOURCE_MAP.sub(hashed_map, content)
+
+
+def build(static_root=STATIC_ROOT):
+    """Fingerprint and precompress every static file; returns the manifest
+
+    Files whose hashed copy already exists are skipped, so rebuilding is cheap
+    and copies from earlier builds stay for pages still cached by browsers.
+    """
+    build_root = os.path.join(static_root, BUILD_DIR)
+    manifest = {}
+    # Source maps first, so the files that reference them can be pointed at their hashed names
+    paths = sorted(_source_files(static_root), key=lambda path: not path.endswith('.map'))
+    for path in paths:
+        with open(os.path.join(static_root, path), 'rb') as f:
+            content = f.read()
+        if path.endswith(('.css', '.js')):
+            content = _link_source_maps(path, content, manifest)
+        target = hashed_name(path, content)
+        manifest[path.replace(os.sep, '/')] = target.replace(os.sep, '/')
+        output = os.path.join(build_root, target)
+        if not os.path.exists(output):
+            _write(output, content)
+        if os.path.splitext(path)[1] in COMPRESSIBLE and len(content) >= MIN_COMPRESS_BYTES:
+            if not os.path.exists(output + '.gz'):
+                _write(output + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None and not os.path.exists(output + '.br'):
+                _write(output + '.br', brotli.compress(content, quality=11))
+    _write(os.path.join(build_root, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    return manifest
+
+
+def clean(static_root=STATIC_ROOT):
+    """Remove every built file"""
+    shutil.rmtree(os.path.join(static_root, BUILD_DIR), ignore_errors=True)
+
+
+def load_manifest(static_root):
+    try:
+        with open(os.path.join(static_root, BUILD_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def manifest_is_current(static_root):
+    """Whether the manifest was written after every static file last changed"""
+    try:
+        built_at = os.stat(os.path.join(static_root, BUILD_DIR, MANIFEST)).st_mtime
+    except OSError:
+        return False
+    return all(os.stat(os.path.join(static_root, path)).st_mtime <= built_at
+               for path in _source_files(static_root))
+
+
+def asset_url(filename):
+    """URL of a static file: its hashed build copy if there is one"""
+    hashed = current_app.extensions['assets'].get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=f'{BUILD_DIR}/{hashed}')
+
+
+def serve_build_file(filename):
+    """Serve a hashed file, precompressed if the client accepts it, cached for good"""
+    build_root = os.path.join(current_app.static_folder, BUILD_DIR)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] > 0 and os.path.isfile(os.path.join(build_root, filename + suffix)):
+            response = send_from_directory(build_root, filename + suffix, mimetype=mimetype)
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(build_root, filename, mimetype=mimetype)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Add asset_url() to templates and the route for hashed files
+
+    The manifest is read once here; run the build before starting the app.
+    It is left out in debug mode, and when a static file changed after the
+    last build, so edits show up instead of an old build's copies.
+    """
+    if app.debug or not manifest_is_current(app.static_folder):
+        app.extensions['assets'] = {}
+    else:
+        app.extensions['assets'] = load_manifest(app.static_folder)
+    app.add_template_global(asset_url)
+    app.add_url_rule(f'{app.static_url_path}/{BUILD_DIR}/<path:filename>', 'build_asset', serve_build_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build fingerprinted, precompressed static assets')
+    parser.add_argument('command', choices=['build', 'clean'])
+    args = parser.parse_args(argv)
+
+    if args.command == 'clean':
+        clean()
+        print('Removed static/build')
+        return 0
+    manifest = build()
+    print(f'Built {len(manifest)} assets into static/build')
+    if brotli is None:
+        print('brotli is not installed, so only gzip variants were written: pip install brotli')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
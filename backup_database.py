@@ -6,8 +6,27 @@ Creates a timestamped backup of the database AND product images before beta test
 
 import shutil
 import os
+import sqlite3
 from datetime import datetime
 
+
+def copy_database(source, destination):
+    """Copy a SQLite database with the online backup API
+    
+    The database runs in WAL mode, so recent commits can still be in the
+    -wal file; a plain file copy would miss them. This copy is consistent
+    even while the app is writing.
+    """
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(destination)
+    try:
+        with dst:
+            src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
 def backup_database():
     """Create a backup of the pantry.db database AND product images"""
     
@@ -35,7 +54,7 @@ def backup_database():
     
     # Copy the database
     try:
-        shutil.copy2(source_db, backup_file)
+        copy_database(source_db, backup_file)
         db_size = os.path.getsize(backup_file) / 1024  # Size in KB
         print(f"✅ Database backup created successfully!")
         print(f"   File: {backup_file}")
@@ -47,7 +66,9 @@ def backup_database():
     # Copy product images if they exist
     if os.path.exists(source_images):
         try:
-            shutil.copytree(source_images, backup_images_dir)
+            # Resized copies are left out: 'python images.py backfill' remakes them.
+            # Run 'python images.py gc' first to leave out images no product uses.
+            shutil.copytree(source_images, backup_images_dir, ignore=shutil.ignore_patterns('sized', '*.tmp'))
             
             # Count files and calculate total size
             image_count = len([f for f in os.listdir(backup_images_dir) if os.path.isfile(os.path.join(backup_images_dir, f))])
@@ -85,12 +106,12 @@ def restore_database(backup_file):
     # Create a backup of current database before restoring
     if os.path.exists(source_db):
         temp_backup = f'{source_db}.before_restore'
-        shutil.copy2(source_db, temp_backup)
+        copy_database(source_db, temp_backup)
         print(f"⚠️  Current database backed up to: {temp_backup}")
     
     # Restore the database
     try:
-        shutil.copy2(backup_file, source_db)
+        copy_database(backup_file, source_db)
         print(f"✅ Database restored successfully from: {backup_file}")
     except Exception as e:
         print(f"❌ Error restoring database: {e}")
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Server-side shopping carts for SmartChoice Pantry System
+A cart lives in the carts table under an opaque random id. The session
+cookie only holds that id and the cart's revision, so it stays a few dozen
+bytes however big the order gets. Every save bumps the revision in both.
+
+Each process keeps recently used carts in an LRU in front of the table. A
+cached cart is only used while its revision matches the one in the
+session, so a cart saved by another worker process is read again. A save
+only succeeds against the revision the session last saw; otherwise it
+raises CartConflict, so overlapping requests (two tabs, a kiosk and a
+phone) never silently undo each other.
+
+A cart expires TTL after its last change. Expired carts are never shown,
+and the sweeper deletes them: at most every SWEEP_SECONDS, after a cart is
+saved, or on demand with 'python carts.py sweep'.
+
+evaluate() prices a whole cart for the shop, the kiosk and checkout alike:
+points, MyPlate totals, allergen conflicts and stock shortfalls, from the
+in-memory catalog and at most one stock query however many lines it has.
+apply() runs a batch of add, remove and set operations against a cart, so
+/cart/apply can check them together and save once.
+
+Usage:
+  python carts.py sweep
+"""
+import json
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+from flask import session
+from sqlalchemy import delete, insert, select, update
+from database import db, get_eastern_time, Cart, Client
+import catalog
+import dietary
+import inventory
+
+SHOP = 'shop'
+KIOSK = 'kiosk'
+TTL = {SHOP: timedelta(days=2), KIOSK: timedelta(hours=2)}
+# Session keys per kind: cart id, cart revision, and the logged-in client the cart belongs to
+SESSION_KEYS = {
+    SHOP: ('cart_id', 'cart_rev', 'client_id'),
+    KIOSK: ('kiosk_cart_id', 'kiosk_cart_rev', 'kiosk_client_id'),
+}
+LEGACY_KEYS = {SHOP: 'cart', KIOSK: 'kiosk_cart'}  # Whole carts in the cookie, as sessions held them before
+MAX_CACHED = 4096
+SWEEP_SECONDS = 300.0
+MYPLATE = ('Fruits', 'Vegetables', 'Dairy', 'Proteins', 'Grains', 'Other')
+OPERATIONS = ('add', 'remove', 'set')
+MAX_OPERATIONS = 100  # Per batch
+
+CartSummary = namedtuple('CartSummary', [
+    'lines', 'points_used', 'points_remaining', 'myplate', 'conflicts', 'shortfalls',
+])
+Shortfall = namedtuple('Shortfall', 'product_id requested available')
+
+_carts = Cart.__table__
+
+
+class CartConflict(Exception):
+    """The cart was saved by another request since this session last read it
+
+    The session is moved on to the stored revision, so reading the cart
+    again gives the current lines to reapply changes to.
+    """
+
+    def __init__(self, revision):
+        super().__init__(f'Cart changed elsewhere (now at revision {revision})')
+        self.revision = revision
+
+
+def _now():
+    return get_eastern_time().replace(tzinfo=None)
+
+
+class CartCache:
+    """LRU map of cart id -> (revision, client id, expires at, lines)"""
+
+    def __init__(self, max_entries=MAX_CACHED):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cart_id):
+        with self._lock:
+            entry = self._entries.get(cart_id)
+            if entry is not None:
+                self._entries.move_to_end(cart_id)
+            return entry
+
+    def put(self, cart_id, entry):
+        with self._lock:
+            self._entries[cart_id] = entry
+            self._entries.move_to_end(cart_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, cart_id):
+        with self._lock:
+            self._entries.pop(cart_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = CartCache()
+_last_sweep = 0.0
+
+
+def get(kind=SHOP):
+    """The lines of the session's cart ([] if it has none), as a copy the caller may change
+
+    Only reads: safe on read-only routes. A cart from before the store (still
+    in the cookie) is returned as it is and moved into the store by save().
+    """
+    id_key, rev_key, client_key = SESSION_KEYS[kind]
+    if LEGACY_KEYS[kind] in session:
+        return [dict(line) for line in session[LEGACY_KEYS[kind]]]
+    cart_id = session.get(id_key)
+    if not cart_id:
+        return []
+    entry = _cache.get(cart_id)
+    if entry is None or entry[0] != session.get(rev_key):
+        row = db.session.execute(
+            select(_carts.c.revision, _carts.c.client_id, _carts.c.expires_at, _carts.c.lines)
+            .where(_carts.c.cart_id == cart_id)
+        ).first()
+        if row is None:  # Swept
+            return []
+        entry = (row.revision, row.client_id, row.expires_at, json.loads(row.lines))
+        _cache.put(cart_id, entry)
+    revision, client_id, expires_at, lines = entry
+    if client_id != session.get(client_key) or expires_at <= _now():
+        return []
+    return [dict(line) for line in lines]
+
+
+def save(lines, kind=SHOP):
+    """Store lines as the session's cart, creating the cart on first save; returns the new revision
+
+    Commits at once. Saving also restarts the cart's TTL. Raises CartConflict
+    if the stored cart is no longer at the session's revision.
+    """
+    id_key, rev_key, client_key = SESSION_KEYS[kind]
+    cart_id = session.get(id_key)
+    client_id = session.get(client_key)
+    now = _now()
+    expires_at = now + TTL[kind]
+    encoded = json.dumps(lines)
+    revision = None
+    if cart_id:
+        revision = db.session.execute(
+            update(_carts).where(_carts.c.cart_id == cart_id, _carts.c.revision == session.get(rev_key))
+            .values(lines=encoded, client_id=client_id, revision=_carts.c.revision + 1,
+                    updated_at=now, expires_at=expires_at)
+            .returning(_carts.c.revision)
+        ).scalar()
+    if revision is None and cart_id:
+        current = db.session.execute(select(_carts.c.revision).where(_carts.c.cart_id == cart_id)).scalar()
+        if current is not None:
+            db.session.rollback()
+            session[rev_key] = current
+            raise CartConflict(current)
+    if revision is None:  # First save, or the cart was swept
+        cart_id, revision = secrets.token_urlsafe(24), 1
+        db.session.execute(insert(_carts).values(
+            cart_id=cart_id, kind=kind, client_id=client_id, lines=encoded, revision=revision,
+            updated_at=now, expires_at=expires_at,
+        ))
+    db.session.commit()
+
+    session.pop(LEGACY_KEYS[kind], None)
+    session[id_key] = cart_id
+    session[rev_key] = revision
+    _cache.put(cart_id, (revision, client_id, expires_at, [dict(line) for line in lines]))
+    _sweep_now_and_then()
+    return revision
+
+
+def discard(kind=SHOP):
+    """Delete the session's cart (after checkout, or when the shopper leaves)"""
+    id_key, rev_key, client_key = SESSION_KEYS[kind]
+    session.pop(LEGACY_KEYS[kind], None)
+    session.pop(rev_key, None)
+    cart_id = session.pop(id_key, None)
+    if cart_id:
+        _cache.pop(cart_id)
+        db.session.execute(delete(_carts).where(_carts.c.cart_id == cart_id))
+        db.session.commit()
+
+
+def sweep():
+    """Delete expired carts; returns how many"""
+    global _last_sweep
+    _last_sweep = time.monotonic()
+    count = db.session.execute(delete(_carts).where(_carts.c.expires_at <= _now())).rowcount
+    db.session.commit()
+    return count
+
+
+def _sweep_now_and_then():
+    if time.monotonic() - _last_sweep >= SWEEP_SECONDS:
+        sweep()
+
+
+def apply(lines, operations):
+    """Apply a batch of operations to a copy of lines; returns (new lines, errors)
+
+    Operations are dicts: {'op': 'add', 'product_id', 'quantity' (default 1)},
+    {'op': 'remove', 'product_id'} or {'op': 'set', 'product_id', 'quantity'},
+    where setting 0 removes the line. Products must be in the catalog to be
+    added or set. errors lists {'index', 'product_id', 'error'} for the
+    operations that were refused; the caller should then keep the old cart.
+    Stock is not checked here: evaluate() the new lines.
+    """
+    lines = [dict(line) for line in lines]
+    errors = []
+    if len(operations) > MAX_OPERATIONS:
+        return lines, [{'index': None, 'product_id': None,
+                        'error': f'At most {MAX_OPERATIONS} changes at a time'}]
+
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            operation = {}
+        error = _apply_one(lines, operation)
+        if error:
+            errors.append({'index': index, 'product_id': operation.get('product_id'), 'error': error})
+    return lines, errors
+
+
+def _apply_one(lines, operation):
+    """Apply one operation to lines in place; returns why it was refused, or None"""
+    op, product_id = operation.get('op'), operation.get('product_id')
+    if op not in OPERATIONS or not isinstance(product_id, str):
+        return 'Unknown change'
+    line = next((line for line in lines if line['product_id'] == product_id), None)
+    if op == 'remove':
+        if line is not None:
+            lines.remove(line)
+        return None
+
+    try:
+        quantity = int(operation.get('quantity', 1 if op == 'add' else None))
+    except (TypeError, ValueError):
+        return 'Quantity must be a whole number'
+    if quantity < 0 or (op == 'add' and quantity == 0):
+        return 'Quantity must be positive'
+    product = catalog.get(product_id)
+    if product is None:
+        return 'Product not found'
+
+    if op == 'add' and line is not None:
+        line['quantity'] += quantity
+    elif quantity == 0:
+        if line is not None:
+            lines.remove(line)
+    elif line is not None:
+        line['quantity'] = quantity
+    else:
+        lines.append({
+            'product_id': product_id,
+            'name': product.product_id,
+            'quantity': quantity,
+            'points': product.points,
+            'category': product.category,
+        })
+    return None
+
+
+def evaluate(lines, client, stock=True):
+    """Price and check a whole cart for client (anything with points_per_visit and allergen_mask)
+
+    Lines are repriced from the catalog; a product no longer in it keeps its
+    points and counts as out of stock. conflicts maps product id -> allergen
+    keys the client marked; shortfalls lists the lines the pantry cannot fill,
+    in cart order. stock=False leaves out the stock query (shortfalls is then
+    empty), for pages that only show the totals.
+    """
+    priced = []
+    myplate = dict.fromkeys(MYPLATE, 0)
+    conflicts = {}
+    avoid = getattr(client, 'allergen_mask', 0) or 0
+    for line in lines:
+        line = dict(line)
+        product = catalog.get(line['product_id'])
+        if product is not None:
+            line['points'] = product.points or 0
+            line['category'] = product.category
+            if product.allergen_mask & avoid:
+                conflicts[product.product_id] = dietary.allergen_keys(product.allergen_mask & avoid)
+        category = line.get('category')
+        myplate[category if category in myplate else 'Other'] += line['points'] * line['quantity']
+        priced.append(line)
+
+    shortfalls = []
+    if stock and priced:
+        availability = inventory.get_availability(line['product_id'] for line in priced)
+        for line in priced:
+            available = availability[line['product_id']] if catalog.get(line['product_id']) else 0
+            if line['quantity'] > available:
+                shortfalls.append(Shortfall(line['product_id'], line['quantity'], available))
+
+    points_used = sum(myplate.values())
+    return CartSummary(
+        lines=priced,
+        points_used=points_used,
+        points_remaining=client.points_per_visit - points_used,
+        myplate=myplate,
+        conflicts=conflicts,
+        shortfalls=shortfalls,
+    )
+
+
+def in_progress():
+    """Unexpired carts with something in them, most recently changed first
+
+    Returns dicts with the cart's kind, client id and name, lines, points,
+    and when it was last changed and will expire.
+    """
+    rows = db.session.execute(
+        select(_carts, Client.name)
+        .outerjoin(Client, Client.client_id == _carts.c.client_id)
+        .where(_carts.c.expires_at > _now(), _carts.c.lines != '[]')
+        .order_by(_carts.c.updated_at.desc())
+    ).all()
+    carts = []
+    for row in rows:
+        lines = json.loads(row.lines)
+        carts.append({
+            'kind': row.kind,
+            'client_id': row.client_id,
+            'client_name': row.name,
+            'lines': lines,
+            'points': sum(line['points'] * line['quantity'] for line in lines),
+            'updated_at': row.updated_at,
+            'expires_at': row.expires_at,
+        })
+    return carts
+
+
+def clear():
+    """Forget cached carts, e.g. after the database is replaced"""
+    global _last_sweep
+    _cache.clear()
+    _last_sweep = 0.0
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv != ['sweep']:
+        print('Usage: python carts.py sweep')
+        return 1
+    from main import create_app
+    with create_app().app_context():
+        print(f'Deleted {sweep()} expired carts')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
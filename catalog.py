@@ -0,0 +1,182 @@
+"""
+In-process product catalog for SmartChoice Pantry System
+Holds every product as an immutable, already-decoded record, indexed by id,
+category and UPC, so shopper pages read the catalog without a database query.
+
+Any flush that writes a product bumps the catalog version (the 'catalog'
+counter row, see database.py) in the same transaction. A process reloads its
+copy when it sees a new version: immediately after its own commits, and at
+most RECHECK_SECONDS later for commits made by other processes.
+"""
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event, select
+from database import db, Product, CATALOG_VERSION, read_version
+import dietary
+
+RECHECK_SECONDS = 2.0
+FILTERED_LISTINGS = 1024  # Remembered diet-filtered category listings per version
+
+CatalogProduct = namedtuple('CatalogProduct', [
+    'product_id', 'price', 'purchase_price', 'category', 'description', 'upc', 'servings',
+    'points', 'nutrition_score', 'dietary_indicators', 'allergens', 'dietary_mask', 'allergen_mask',
+    'image_url', 'date_created',
+])
+
+
+class _Catalog:
+    """One loaded copy of the catalog at a version"""
+
+    def __init__(self, version, updated_at, products):
+        self.version = version
+        self.updated_at = updated_at
+        self.checked_at = time.monotonic()
+        # Best nutrition first, the order every shopper listing uses
+        self.products = sorted(products, key=lambda p: (-(p.nutrition_score or 0), p.product_id))
+        self.by_id = {p.product_id: p for p in self.products}
+        self.by_category = {}
+        self.by_upc = {}
+        self.filtered = {}  # (category, diet, avoid) -> product ids matching in SQL
+        for product in self.products:
+            self.by_category.setdefault(product.category, []).append(product)
+            if product.upc:
+                self.by_upc.setdefault(product.upc, product)
+
+
+_catalog = None
+_lock = threading.Lock()
+
+
+def _record(product):
+    return CatalogProduct(
+        product_id=product.product_id,
+        price=product.price,
+        purchase_price=product.purchase_price,
+        category=product.category,
+        description=product.description,
+        upc=product.upc,
+        servings=product.servings,
+        points=product.points,
+        nutrition_score=product.nutrition_score,
+        dietary_indicators=tuple(product.get_dietary_indicators()),
+        allergens=tuple(product.get_allergens()),
+        dietary_mask=product.dietary_mask or 0,
+        allergen_mask=product.allergen_mask or 0,
+        image_url=product.image_url,
+        date_created=product.date_created,
+    )
+
+
+def _current():
+    """The loaded catalog, reloaded if the stored version has moved on"""
+    global _catalog
+    catalog = _catalog
+    if catalog is not None and time.monotonic() - catalog.checked_at < RECHECK_SECONDS:
+        return catalog
+    with _lock:
+        catalog = _catalog
+        if catalog is not None and time.monotonic() - catalog.checked_at < RECHECK_SECONDS:
+            return catalog
+        version, updated_at = read_version(CATALOG_VERSION)
+        if catalog is not None and catalog.version == version:
+            catalog.checked_at = time.monotonic()
+            return catalog
+        _catalog = _Catalog(version, updated_at, [_record(p) for p in Product.query.all()])
+        return _catalog
+
+
+def load():
+    """Load the catalog now (e.g. before forking workers) and return its version"""
+    return _current().version
+
+
+def invalidate():
+    """Check the stored version on the next read instead of waiting for RECHECK_SECONDS"""
+    catalog = _catalog
+    if catalog is not None:
+        catalog.checked_at = float('-inf')
+
+
+def clear():
+    """Forget the loaded catalog, e.g. after the database is replaced"""
+    global _catalog
+    with _lock:
+        _catalog = None
+
+
+def version():
+    return _current().version
+
+
+def last_modified():
+    """UTC time the loaded catalog version was made, or None if products were never written"""
+    return _current().updated_at
+
+
+def get(product_id):
+    """Get one product record, or None"""
+    return _current().by_id.get(product_id)
+
+
+def get_many(product_ids):
+    """Get {product_id: record} for the ids that exist"""
+    by_id = _current().by_id
+    return {pid: by_id[pid] for pid in product_ids if pid in by_id}
+
+
+def by_upc(upc):
+    return _current().by_upc.get(upc)
+
+
+def in_category(category, diet=0, avoid=0):
+    """Products in a category, best nutrition score first
+
+    diet and avoid are dietary.py masks: keep products with every diet flag
+    and none of the avoided allergens. The match runs once per catalog
+    version as a mask predicate on the category index; repeats come from memory.
+    """
+    catalog = _current()
+    products = catalog.by_category.get(category, ())
+    if not diet and not avoid:
+        return list(products)
+    key = (category, diet, avoid)
+    matching = catalog.filtered.get(key)
+    if matching is None:
+        matching = frozenset(db.session.execute(
+            select(Product.product_id).where(
+                Product.category == category,
+                dietary.has_all(Product.dietary_mask, diet),
+                dietary.has_none(Product.allergen_mask, avoid),
+            )
+        ).scalars())
+        if len(catalog.filtered) >= FILTERED_LISTINGS:
+            catalog.filtered.clear()
+        catalog.filtered[key] = matching
+    return [p for p in products if p.product_id in matching]
+
+
+def categories():
+    return sorted(c for c in _current().by_category if c)
+
+
+def snapshot():
+    """(version, every product) from one loaded copy, for indexes built on top of the catalog"""
+    catalog = _current()
+    return catalog.version, catalog.products
+
+
+def all_products():
+    """Every product, best nutrition score first"""
+    return list(_current().products)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _reload_after_own_writes(session):
+    if session.info.pop('catalog_changed', False):
+        invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_rolled_back_writes(session):
+    session.info.pop('catalog_changed', None)
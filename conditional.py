@@ -0,0 +1,93 @@
+"""
+Conditional GET support for SmartChoice Pantry System
+Pages and JSON built from the catalog and stock get a strong ETag computed
+from the catalog and stock versions (plus whatever else the response
+depends on, such as the shopper's cart). A client that sends the ETag back
+in If-None-Match gets a 304 before any query or render is done.
+
+Workers trust the versions they read for a couple of seconds (see
+catalog.py and inventory.py). A request carrying validators re-reads them
+first, so a worker that has not seen another worker's commit yet cannot
+answer 304 for content that changed.
+
+Last-Modified is only sent on responses that depend on nothing but the
+versions it comes from. Per-client responses carry the ETag alone, since
+a date cannot tell that a cart changed.
+"""
+import hashlib
+import os
+from flask import current_app, make_response, request
+import catalog
+import inventory
+
+_release = None
+
+
+def init_app(app):
+    app.before_request(_recheck_versions)
+
+
+def _recheck_versions():
+    """Validate conditional requests against the stored versions, not this worker's recent copy"""
+    if request.method in ('GET', 'HEAD') and (request.if_none_match or request.if_modified_since):
+        catalog.invalidate()
+        inventory.recheck_stock_version()
+
+
+def _release_id():
+    """Fingerprint of the deployed code, templates and asset build, so an upgrade changes every ETag"""
+    global _release
+    if _release is None:
+        root = current_app.root_path
+        stamps = []
+        for folder in (root, os.path.join(root, current_app.template_folder or 'templates')):
+            for name in sorted(os.listdir(folder)):
+                if name.endswith(('.py', '.html')):
+                    stamps.append((name, os.stat(os.path.join(folder, name)).st_mtime_ns))
+        manifest = os.path.join(current_app.static_folder, 'build', 'manifest.json')
+        if os.path.exists(manifest):  # Pages link the hashed asset names listed there
+            stamps.append(('manifest.json', os.stat(manifest).st_mtime_ns))
+        _release = hashlib.sha1(repr(stamps).encode()).hexdigest()[:12]
+    return _release
+
+
+def etag_for(*parts):
+    """Strong ETag value for a response that depends exactly on parts"""
+    return hashlib.sha1(repr((_release_id(),) + parts).encode()).hexdigest()
+
+
+def _http_time(moment):
+    return moment.replace(microsecond=0) if moment else None
+
+
+def not_modified(etag, last_modified=None):
+    """A 304 response when the request's validators still match, else None
+
+    Only GET and HEAD are answered this way. If-None-Match wins when both are
+    sent (RFC 9110); If-Modified-Since is only looked at when the response has
+    a Last-Modified.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if request.if_none_match:
+        matched = request.if_none_match.contains(etag)
+    elif last_modified is not None and request.if_modified_since is not None:
+        matched = _http_time(last_modified) <= request.if_modified_since
+    else:
+        matched = False
+    if not matched:
+        return None
+    return with_validators(make_response('', 304), etag, last_modified)
+
+
+def with_validators(response, etag, last_modified=None):
+    """Add the ETag (and Last-Modified) to a response; clients must revalidate before reuse"""
+    response = make_response(response)
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _http_time(last_modified)
+    response.cache_control.no_cache = True
+    response.cache_control.private = True
+    response.vary.add('Cookie')
+    return response
+
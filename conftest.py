@@ -0,0 +1,53 @@
+"""
+Shared pytest setup for SmartChoice Pantry System
+Points the app at a throwaway database so tests never touch instance/pantry.db
+"""
+import os
+import tempfile
+import pytest
+
+_test_db_dir = tempfile.mkdtemp(prefix='pantry-test-')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_test_db_dir, 'pantry.db'))
+
+
+@pytest.fixture(scope='session', autouse=True)
+def pantry_app():
+    """One app for the whole run, on a bootstrapped throwaway database"""
+    from main import create_app, bootstrap
+    flask_app = create_app({'TESTING': True, 'MIRROR_REMOTE_IMAGES': False})  # No fetches from the internet
+    bootstrap(flask_app)
+    return flask_app
+
+
+@pytest.fixture
+def app(pantry_app):
+    """The Flask app with an empty database and the default locations"""
+    from main import bootstrap
+    from database import db, Counter
+    import carts
+    import catalog
+    import fragments
+    import images
+    import inventory
+    import suggest
+    import swaps
+
+    with pantry_app.app_context():
+        db.session.remove()
+        db.drop_all()
+        Counter.forget_blocks()
+        carts.clear()
+        catalog.clear()
+        fragments.clear()
+        images.clear()
+        inventory.forget_stock_version()
+        suggest.clear()
+        swaps.clear()
+        bootstrap(pantry_app)
+        yield pantry_app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
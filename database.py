@@ -2,12 +2,36 @@
 Database module for SmartChoice Pantry System
 Migrated from PKL files to SQLite with SQLAlchemy
 """
+from flask import has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, func, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import validates
+from collections import defaultdict, namedtuple
+from datetime import datetime, timezone
+import os
 import pytz
 import json
+import threading
+import dietary
 
-db = SQLAlchemy()
+
+class RoutingSession(Session):
+    """Session that sends a request's queries to the 'read' bind when its view is read-only
+    
+    Views opt in with storage.read_only; everything else uses the default bind.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context() and getattr(request, 'read_only', False):
+            engine = self._db.engines.get('read')
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 def get_eastern_time():
     """Get current time in Eastern timezone"""
@@ -46,20 +70,39 @@ class Product(db.Model):
     product_id = db.Column(db.String(200), unique=True, nullable=False)
     price = db.Column(db.Float, default=0)
     purchase_price = db.Column(db.Float, default=0)
-    category = db.Column(db.String(100), default='Other')
+    category = db.Column(db.String(100), default='Other', index=True)
     description = db.Column(db.Text, default='')
     upc = db.Column(db.String(100), default='')
     servings = db.Column(db.Integer, default=1)
     points = db.Column(db.Integer, default=1)
-    nutrition_score = db.Column(db.Integer, default=50)
+    nutrition_score = db.Column(db.Integer, default=50, index=True)
     dietary_indicators = db.Column(db.Text, default='[]')  # JSON array
     allergens = db.Column(db.Text, default='[]')  # JSON array
+    dietary_mask = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # Bits from dietary.DIETARY_FLAGS
+    allergen_mask = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # Bits from dietary.ALLERGEN_FLAGS
     image_url = db.Column(db.String(500), default='')
     date_created = db.Column(db.String(200), default=get_eastern_time_str)
     
     # Relationships
     movements = db.relationship('Movement', backref='product', lazy=True, foreign_keys='Movement.product_id')
     
+    __table_args__ = (
+        # Category pages and healthier swaps: category = ? ordered by nutrition score
+        # The masks ride along so diet filters are checked in the index, not the table
+        db.Index('ix_products_category_diet', 'category', 'nutrition_score', 'dietary_mask', 'allergen_mask',
+                 'product_id'),
+    )
+    
+    @validates('dietary_indicators')
+    def _sync_dietary_mask(self, key, value):
+        self.dietary_mask = dietary.dietary_mask(value)
+        return value
+    
+    @validates('allergens')
+    def _sync_allergen_mask(self, key, value):
+        self.allergen_mask = dietary.allergen_mask(value)
+        return value
+    
     def get_dietary_indicators(self):
         """Get dietary indicators as list"""
         try:
@@ -86,12 +129,43 @@ class Product(db.Model):
         return f'<Product {self.product_id}>'
 
 
+class StoredImage(db.Model):
+    """A file in the product image store (see images.py), named by its content hash
+    
+    Products refer to stored files through their image_url; a file no product
+    refers to is removed by 'python images.py gc'.
+    """
+    __tablename__ = 'stored_images'
+    
+    filename = db.Column(db.String(100), primary_key=True)  # Relative to the upload folder
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)  # One file per distinct content
+    size = db.Column(db.Integer, nullable=False)
+    stored_at = db.Column(db.DateTime, nullable=False, default=get_eastern_time)  # Last stored or reused
+    
+    def __repr__(self):
+        return f'<StoredImage {self.filename}>'
+
+
+class RemoteImage(db.Model):
+    """A remote image URL and the stored file mirroring it (see images.mirror)"""
+    __tablename__ = 'remote_images'
+    
+    url = db.Column(db.String(500), primary_key=True)
+    filename = db.Column(db.String(100), nullable=True)  # stored_images file; None until fetched
+    fetched_at = db.Column(db.DateTime, nullable=True)
+    failures = db.Column(db.Integer, nullable=False, default=0)  # Consecutive failed fetches
+    last_error = db.Column(db.String(200), nullable=True)
+    
+    def __repr__(self):
+        return f'<RemoteImage {self.url}>'
+
+
 class Client(db.Model):
     __tablename__ = 'clients'
     
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.String(100), unique=True, nullable=False)
-    name = db.Column(db.String(200), nullable=False)
+    name = db.Column(db.String(200), nullable=False, index=True)
     email = db.Column(db.String(200), default='')
     phone = db.Column(db.String(50), default='')
     address = db.Column(db.Text, default='')
@@ -102,6 +176,7 @@ class Client(db.Model):
     visits_per_period = db.Column(db.Integer, default=1)
     allergens = db.Column(db.Text, default='[]')  # JSON array
     dietary_prefs = db.Column(db.Text, default='[]')  # JSON array
+    allergen_mask = db.Column(db.Integer, default=0, server_default='0', nullable=False)  # Bits from dietary.ALLERGEN_FLAGS
     medical_conditions = db.Column(db.Text, default='')  # Medical nutrition needs
     special_instructions = db.Column(db.Text, default='')  # Delivery/medical instructions
     delivery_address = db.Column(db.Text, default='')  # Separate delivery address if different
@@ -131,6 +206,11 @@ class Client(db.Model):
     def set_allergens(self, allergen_list):
         self.allergens = json.dumps(allergen_list if allergen_list else [])
     
+    @validates('allergens')
+    def _sync_allergen_mask(self, key, value):
+        self.allergen_mask = dietary.allergen_mask(value)
+        return value
+    
     def get_dietary_prefs(self):
         try:
             return json.loads(self.dietary_prefs) if self.dietary_prefs else []
@@ -164,17 +244,65 @@ class Movement(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     movement_id = db.Column(db.Integer, unique=True, nullable=False)
-    product_id = db.Column(db.String(200), db.ForeignKey('products.product_id'), nullable=False)
+    product_id = db.Column(db.String(200), db.ForeignKey('products.product_id'), nullable=False, index=True)
     qty = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, default=0)
-    from_location = db.Column(db.String(200), db.ForeignKey('locations.location_id'), nullable=True)
-    to_location = db.Column(db.String(200), db.ForeignKey('locations.location_id'), nullable=True)
+    from_location = db.Column(db.String(200), db.ForeignKey('locations.location_id'), nullable=True, index=True)
+    to_location = db.Column(db.String(200), db.ForeignKey('locations.location_id'), nullable=True, index=True)
     movement_time = db.Column(db.String(200), default=get_eastern_time_str)
+    created_at = db.Column(db.DateTime, default=get_eastern_time, index=True)  # Sortable twin of movement_time
+    
+    # Not a column: when True, the flush refuses this movement unless
+    # from_location holds at least qty (see _update_stock_balances)
+    require_stock = False
     
     def __repr__(self):
         return f'<Movement {self.movement_id}>'
 
 
+class StockBalance(db.Model):
+    __tablename__ = 'stock_balances'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.String(200), nullable=False)
+    location_id = db.Column(db.String(200), nullable=False)
+    qty = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'location_id', name='uq_stock_balances_product_location'),
+    )
+    
+    def __repr__(self):
+        return f'<StockBalance {self.product_id} @ {self.location_id}: {self.qty}>'
+
+
+class StockSnapshot(db.Model):
+    __tablename__ = 'stock_snapshots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    watermark = db.Column(db.Integer, nullable=False, index=True)  # movements.id of the last movement included
+    taken_at = db.Column(db.DateTime, default=get_eastern_time)
+    
+    # Relationships
+    lines = db.relationship('StockSnapshotLine', backref='snapshot', lazy=True, cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<StockSnapshot {self.id} @ movement {self.watermark}>'
+
+
+class StockSnapshotLine(db.Model):
+    __tablename__ = 'stock_snapshot_lines'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    snapshot_id = db.Column(db.Integer, db.ForeignKey('stock_snapshots.id'), nullable=False, index=True)
+    product_id = db.Column(db.String(200), nullable=False)
+    location_id = db.Column(db.String(200), nullable=False)
+    qty = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<StockSnapshotLine {self.product_id} @ {self.location_id}: {self.qty}>'
+
+
 class Order(db.Model):
     __tablename__ = 'orders'
     
@@ -191,11 +319,17 @@ class Order(db.Model):
     delivery_driver = db.Column(db.String(200), nullable=True)  # Assigned driver
     delivery_notes = db.Column(db.Text, nullable=True)  # Delivery instructions
     note_to_staff = db.Column(db.Text, nullable=True)  # Client notes for staff
-    status = db.Column(db.String(50), default='Pending')
+    status = db.Column(db.String(50), default='Pending', index=True)
     pickup_time = db.Column(db.String(200), nullable=True)
-    created_at = db.Column(db.DateTime, default=get_eastern_time)
+    created_at = db.Column(db.DateTime, default=get_eastern_time, index=True)
     completed_at = db.Column(db.DateTime, nullable=True)
     
+    __table_args__ = (
+        # Client order history and the deliveries page, both newest first
+        db.Index('ix_orders_client_id_created_at', 'client_id', 'created_at'),
+        db.Index('ix_orders_fulfillment_method_created_at', 'fulfillment_method', 'created_at'),
+    )
+    
     def get_items(self):
         """Get items as list"""
         try:
@@ -231,10 +365,10 @@ class StaffMessage(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     message_id = db.Column(db.Integer, unique=True, nullable=False)
-    client_id = db.Column(db.String(100), db.ForeignKey('clients.client_id'), nullable=False)
+    client_id = db.Column(db.String(100), db.ForeignKey('clients.client_id'), nullable=False, index=True)
     message = db.Column(db.Text, nullable=False)
-    is_read = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=get_eastern_time)
+    is_read = db.Column(db.Boolean, default=False, index=True)
+    created_at = db.Column(db.DateTime, default=get_eastern_time, index=True)
     
     def __repr__(self):
         return f'<StaffMessage {self.message_id}>'
@@ -262,32 +396,338 @@ class Survey(db.Model):
         return f'<Survey {self.survey_id}>'
 
 
+class Cart(db.Model):
+    """A shopping cart in progress, kept server-side (see carts.py)"""
+    __tablename__ = 'carts'
+    
+    cart_id = db.Column(db.String(64), primary_key=True)  # Opaque random id held in the session
+    kind = db.Column(db.String(10), nullable=False)  # 'shop' or 'kiosk'
+    client_id = db.Column(db.String(100), nullable=True, index=True)
+    lines = db.Column(db.Text, nullable=False, default='[]')  # JSON array of cart lines
+    revision = db.Column(db.Integer, nullable=False, default=1)  # Bumped by every save
+    updated_at = db.Column(db.DateTime, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def get_lines(self):
+        try:
+            return json.loads(self.lines) if self.lines else []
+        except ValueError:
+            return []
+    
+    def __repr__(self):
+        return f'<Cart {self.kind} {self.client_id}>'
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), unique=True, nullable=False)
+    applied_at = db.Column(db.DateTime, default=get_eastern_time)
+    
+    def __repr__(self):
+        return f'<SchemaMigration {self.name}>'
+
+
+# Hi/lo ID allocation: each process reserves a block of ID_BLOCK_SIZE ids from
+# a sequence's counter row in one short transaction, then hands them out from
+# memory. Blocks never overlap across processes because the reservation is a
+# single UPDATE ... RETURNING; ids left in a block when a process exits are
+# skipped, so sequences can have gaps.
+ID_BLOCK_SIZE = 50
+ID_SEQUENCES = ('orders', 'movements', 'clients', 'messages')
+
+# Counter row holding the catalog version, bumped by every flush that writes
+# a product so processes caching the catalog (catalog.py) know to reload
+CATALOG_VERSION = 'catalog'
+STOCK_VERSION = 'stock'
+
+_id_blocks = {}  # sequence name -> [next id, last id] of the reserved block
+_id_blocks_lock = threading.Lock()
+_id_blocks_pid = os.getpid()
+
+
 class Counter(db.Model):
     __tablename__ = 'counter'
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False, default='main')
-    value = db.Column(db.Integer, default=0)
+    value = db.Column(db.Integer, default=0)  # Highest id handed to any process
     
     @staticmethod
-    def get_next_id():
-        """Get next ID and increment counter"""
-        counter = Counter.query.filter_by(name='main').first()
-        if not counter:
-            counter = Counter(name='main', value=100)
-            db.session.add(counter)
-            db.session.commit()
+    def get_next_id(sequence='main'):
+        """Get the next ID from a sequence (orders, movements, clients, messages)
         
-        counter.value += 1
-        db.session.commit()
-        return counter.value
+        Does not touch db.session. A block refill writes through its own
+        connection, so call this before flushing other writes in the same
+        request: once db.session holds SQLite's write lock the refill could
+        only wait for it and fail, so that raises RuntimeError instead.
+        """
+        return Counter.get_next_ids(sequence, 1)[0]
     
     @staticmethod
-    def get_current_id():
-        """Get current counter value without incrementing"""
-        counter = Counter.query.filter_by(name='main').first()
-        if not counter:
-            counter = Counter(name='main', value=100)
-            db.session.add(counter)
-            db.session.commit()
-        return counter.value
+    def get_next_ids(sequence, count):
+        """Get count IDs from a sequence, reserving new blocks as needed"""
+        global _id_blocks_pid
+        if db.session.info.get('flushed_writes'):
+            raise RuntimeError(
+                f"Counter.get_next_ids('{sequence}') called after db.session flushed writes; "
+                "reserve ids before the first flush of the transaction"
+            )
+        ids = []
+        with _id_blocks_lock:
+            if _id_blocks_pid != os.getpid():
+                # Forked worker: the parent's blocks are the parent's to use
+                _id_blocks.clear()
+                _id_blocks_pid = os.getpid()
+            while len(ids) < count:
+                block = _id_blocks.get(sequence)
+                if block is None or block[0] > block[1]:
+                    size = max(ID_BLOCK_SIZE, count - len(ids))
+                    last = Counter._reserve_block(sequence, size)
+                    block = _id_blocks[sequence] = [last - size + 1, last]
+                take = min(count - len(ids), block[1] - block[0] + 1)
+                ids.extend(range(block[0], block[0] + take))
+                block[0] += take
+        return ids
+    
+    @staticmethod
+    def _reserve_block(sequence, size):
+        """Claim the next size ids of a sequence, returning the last one"""
+        table = Counter.__table__
+        claim = (
+            update(table).where(table.c.name == sequence)
+            .values(value=table.c.value + size).returning(table.c.value)
+        )
+        with db.engine.begin() as connection:
+            last = connection.execute(claim).scalar()
+            if last is None:
+                # New sequence: continue from the shared counter so ids stay unique
+                seed = connection.execute(select(table.c.value).where(table.c.name == 'main')).scalar()
+                connection.execute(
+                    sqlite_insert(table).values(name=sequence, value=seed or 100)
+                    .on_conflict_do_nothing(index_elements=['name'])
+                )
+                last = connection.execute(claim).scalar()
+        return last
+    
+    @staticmethod
+    def forget_blocks():
+        """Drop the blocks this process holds, e.g. after the database is replaced"""
+        with _id_blocks_lock:
+            _id_blocks.clear()
+    
+    @staticmethod
+    def get_current_id(sequence='main'):
+        """Get the highest ID reserved from a sequence so far"""
+        counter = Counter.query.filter_by(name=sequence).first()
+        return counter.value if counter else 100
+
+
+class VersionStamp(db.Model):
+    """When a version counter (CATALOG_VERSION, STOCK_VERSION) was last bumped"""
+    __tablename__ = 'version_stamps'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    modified = db.Column(db.Integer, nullable=False)  # Unix seconds, database clock
+    
+    def __repr__(self):
+        return f'<VersionStamp {self.name}>'
+
+
+Shortage = namedtuple('Shortage', 'product_id location_id requested available')
+
+
+class InsufficientStock(Exception):
+    """Raised by a flush when movements with require_stock would overdraw a location"""
+    
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(', '.join(
+            f"{s.product_id} @ {s.location_id}: requested {s.requested}, available {s.available}"
+            for s in shortages
+        ))
+
+
+def _add_movement_legs(deltas, product_id, qty, from_location, to_location, sign):
+    """Add the two legs of a movement (into to_location, out of from_location) to deltas"""
+    qty = int(qty or 0) * sign
+    if to_location:
+        deltas[(product_id, to_location)] += qty
+    if from_location:
+        deltas[(product_id, from_location)] -= qty
+
+
+@event.listens_for(db.session, 'before_flush')
+def _update_stock_balances(session, flush_context, instances):
+    """Keep stock_balances in step with every movement insert, edit and delete
+    
+    New movements marked require_stock take their outgoing leg with a
+    conditional decrement (qty >= requested), so concurrent checkouts cannot
+    both take the last units; if any would overdraw, InsufficientStock is
+    raised and the caller rolls back.
+    """
+    deltas = defaultdict(int)
+    required = defaultdict(int)
+    for obj in session.new:
+        if isinstance(obj, Movement):
+            if obj.require_stock and obj.from_location:
+                _add_movement_legs(deltas, obj.product_id, obj.qty, None, obj.to_location, 1)
+                required[(obj.product_id, obj.from_location)] += int(obj.qty or 0)
+            else:
+                _add_movement_legs(deltas, obj.product_id, obj.qty, obj.from_location, obj.to_location, 1)
+    
+    # Edited and deleted movements are reversed using the row as it is stored,
+    # since expired attributes carry no history of their old values
+    changed = [obj for obj in session.dirty if isinstance(obj, Movement) and session.is_modified(obj)]
+    removed = [obj for obj in session.deleted if isinstance(obj, Movement)]
+    if not deltas and not required and not changed and not removed:
+        return
+    
+    connection = session.connection()
+    table = StockBalance.__table__
+    shortages = []
+    for (product_id, location_id), qty in sorted(required.items()):
+        key = (table.c.product_id == product_id) & (table.c.location_id == location_id)
+        taken = connection.execute(
+            table.update().where(key, table.c.qty >= qty).values(qty=table.c.qty - qty)
+        ).rowcount
+        if not taken:
+            available = connection.execute(select(table.c.qty).where(key)).scalar() or 0
+            shortages.append(Shortage(product_id, location_id, qty, max(available, 0)))
+    if shortages:
+        raise InsufficientStock(shortages)
+    
+    stored_ids = [obj.id for obj in changed + removed if obj.id is not None]
+    if stored_ids:
+        movements = Movement.__table__
+        stored = connection.execute(
+            select(movements.c.product_id, movements.c.qty, movements.c.from_location, movements.c.to_location)
+            .where(movements.c.id.in_(stored_ids))
+        )
+        for row in stored:
+            _add_movement_legs(deltas, row.product_id, row.qty, row.from_location, row.to_location, -1)
+        
+        # Snapshots that already include a rewritten movement no longer match the ledger
+        snapshots = StockSnapshot.__table__
+        snapshot_lines = StockSnapshotLine.__table__
+        stale = select(snapshots.c.id).where(snapshots.c.watermark >= min(stored_ids))
+        connection.execute(snapshot_lines.delete().where(snapshot_lines.c.snapshot_id.in_(stale)))
+        connection.execute(snapshots.delete().where(snapshots.c.watermark >= min(stored_ids)))
+    for obj in changed:
+        _add_movement_legs(deltas, obj.product_id, obj.qty, obj.from_location, obj.to_location, 1)
+    
+    for (product_id, location_id), delta in deltas.items():
+        if delta == 0:
+            continue
+        stmt = sqlite_insert(table).values(product_id=product_id, location_id=location_id, qty=delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.product_id, table.c.location_id],
+            set_={'qty': table.c.qty + stmt.excluded.qty}
+        )
+        connection.execute(stmt)
+    
+    if required or any(deltas.values()):
+        bump_version(connection, STOCK_VERSION)
+        session.info['stock_changed'] = True
+
+
+def bump_version(connection, name):
+    """Add one to a version counter row, creating it if needed
+    
+    Its version_stamps row is set to the time of the bump for Last-Modified
+    headers.
+    """
+    table = Counter.__table__
+    stmt = sqlite_insert(table).values(name=name, value=1)
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={'value': table.c.value + 1}
+    ))
+    stamps = VersionStamp.__table__
+    now = func.cast(func.strftime('%s', 'now'), db.Integer)
+    stmt = sqlite_insert(stamps).values(name=name, modified=now)
+    connection.execute(stmt.on_conflict_do_update(index_elements=[stamps.c.name], set_={'modified': now}))
+
+
+def read_version(name):
+    """(version, UTC datetime of its last bump or None) for a version counter"""
+    table = Counter.__table__
+    stamps = VersionStamp.__table__
+    row = db.session.execute(
+        select(table.c.value, stamps.c.modified)
+        .select_from(table.outerjoin(stamps, stamps.c.name == table.c.name))
+        .where(table.c.name == name)
+    ).first()
+    if row is None:
+        return 0, None
+    value, modified = row
+    return value or 0, datetime.fromtimestamp(modified, timezone.utc) if modified else None
+
+
+# FTS5 index over product name, description and category for search.py
+SEARCH_INDEX_DDL = [
+    # prefix='2 3' keeps prefix indexes so short 'ap*' terms need no full term scan
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        product_id, description, category,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, product_id, description, category)
+        VALUES (new.id, new.product_id, new.description, new.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, product_id, description, category)
+        VALUES ('delete', old.id, old.product_id, old.description, old.category);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF product_id, description, category
+    ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, product_id, description, category)
+        VALUES ('delete', old.id, old.product_id, old.description, old.category);
+        INSERT INTO products_fts(rowid, product_id, description, category)
+        VALUES (new.id, new.product_id, new.description, new.category);
+    END""",
+]
+
+
+def create_search_index(connection):
+    """Create the product search table and its triggers if they are missing"""
+    for statement in SEARCH_INDEX_DDL:
+        connection.exec_driver_sql(statement)
+
+
+def rebuild_search_index(connection):
+    """Re-read every product into the search index, e.g. after rows changed with the triggers missing"""
+    connection.exec_driver_sql("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def drop_search_index(connection):
+    connection.exec_driver_sql('DROP TABLE IF EXISTS products_fts')
+
+
+# create_all / drop_all build and remove the index along with the products table
+event.listen(Product.__table__, 'after_create', lambda table, connection, **kw: create_search_index(connection))
+event.listen(Product.__table__, 'after_drop', lambda table, connection, **kw: drop_search_index(connection))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _note_flushed_writes(session, flush_context):
+    """The session's transaction now holds the write lock (see Counter.get_next_ids)"""
+    session.info['flushed_writes'] = True
+
+
+@event.listens_for(db.session, 'after_transaction_end')
+def _forget_flushed_writes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('flushed_writes', None)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _bump_catalog_version(session, flush_context, instances):
+    """Bump the catalog version in the same transaction as any product write"""
+    written = [obj for obj in list(session.new) + list(session.deleted) if isinstance(obj, Product)]
+    written += [obj for obj in session.dirty if isinstance(obj, Product) and session.is_modified(obj)]
+    if written:
+        bump_version(session.connection(), CATALOG_VERSION)
+        session.info['catalog_changed'] = True
@@ -0,0 +1,116 @@
+"""
+Dietary indicator and allergen flags for SmartChoice Pantry System
+A fixed registry mapping each flag to one bit, so products and clients can
+store their JSON lists as integer masks too and filters can run in SQL as
+(mask & :want) = :want instead of decoding JSON row by row.
+
+Bits are part of the stored data: never renumber a flag, only append new ones.
+"""
+import json
+import re
+
+# (bit, key, label). The key is the normalized spelling used in URLs and
+# filters; the label is what the staff forms write.
+DIETARY_FLAGS = (
+    (1 << 0, 'vegan', 'Vegan'),
+    (1 << 1, 'vegetarian', 'Vegetarian'),
+    (1 << 2, 'gluten-free', 'Gluten-Free'),
+    (1 << 3, 'dairy-free', 'Dairy-Free'),
+    (1 << 4, 'low-sodium', 'Low Sodium'),
+    (1 << 5, 'sugar-free', 'Sugar-Free'),
+    (1 << 6, 'halal', 'Halal'),
+    (1 << 7, 'kosher', 'Kosher'),
+    (1 << 8, 'diabetic-friendly', 'Diabetic Friendly'),
+)
+
+ALLERGEN_FLAGS = (
+    (1 << 0, 'milk', 'Milk'),
+    (1 << 1, 'eggs', 'Eggs'),
+    (1 << 2, 'fish', 'Fish'),
+    (1 << 3, 'shellfish', 'Shellfish'),
+    (1 << 4, 'tree-nuts', 'Tree Nuts'),
+    (1 << 5, 'peanuts', 'Peanuts'),
+    (1 << 6, 'gluten', 'Gluten'),
+    (1 << 7, 'soybeans', 'Soybeans'),
+)
+
+# Other spellings in use: the client form records "Dairy", "Nuts" and "Soy"
+DIETARY_ALIASES = {}
+ALLERGEN_ALIASES = {
+    'dairy': ('milk',),
+    'egg': ('eggs',),
+    'nuts': ('tree-nuts', 'peanuts'),
+    'soy': ('soybeans',),
+    'wheat': ('gluten',),
+}
+
+
+def normalize(name):
+    """'Gluten Free', 'gluten-free' and ' GLUTEN_free ' all become 'gluten-free'"""
+    return re.sub(r'[\s_-]+', '-', str(name).strip().lower())
+
+
+def _bits(flags, aliases):
+    bits = {key: bit for bit, key, label in flags}
+    for alias, keys in aliases.items():
+        bits[alias] = 0
+        for key in keys:
+            bits[alias] |= bits[key]
+    return bits
+
+
+_DIETARY_BITS = _bits(DIETARY_FLAGS, DIETARY_ALIASES)
+_ALLERGEN_BITS = _bits(ALLERGEN_FLAGS, ALLERGEN_ALIASES)
+
+
+def _mask(bits, names):
+    if isinstance(names, str):
+        try:
+            names = json.loads(names) if names else []
+        except ValueError:
+            names = []
+    mask = 0
+    for name in names or ():
+        mask |= bits.get(normalize(name), 0)  # Unknown names stay in the JSON only
+    return mask
+
+
+def dietary_mask(names):
+    """Mask for a list (or JSON array) of dietary indicators"""
+    return _mask(_DIETARY_BITS, names)
+
+
+def allergen_mask(names):
+    """Mask for a list (or JSON array) of allergens"""
+    return _mask(_ALLERGEN_BITS, names)
+
+
+def dietary_filter(names):
+    """Mask for a ?diet= filter, or None if it names a flag no product can have
+
+    dietary_mask() drops unknown names, which for a filter would mean showing
+    everything; the caller should show nothing instead.
+    """
+    if any(normalize(name) not in _DIETARY_BITS for name in names):
+        return None
+    return dietary_mask(names)
+
+
+def dietary_keys(mask):
+    """Normalized keys of the dietary flags set in mask, in registry order"""
+    return [key for bit, key, label in DIETARY_FLAGS if mask & bit]
+
+
+def allergen_keys(mask):
+    """Normalized keys of the allergen flags set in mask, in registry order"""
+    return [key for bit, key, label in ALLERGEN_FLAGS if mask & bit]
+
+
+def has_all(column, mask):
+    """SQL predicate: every flag in mask is set"""
+    return column.op('&')(mask) == mask
+
+
+def has_none(column, mask):
+    """SQL predicate: no flag in mask is set"""
+    return column.op('&')(mask) == 0
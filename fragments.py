@@ -0,0 +1,85 @@
+"""
+Rendered-fragment cache for SmartChoice Pantry System
+Holds pieces of HTML that are the same for every shopper, such as the
+product grid of a category page, so they are rendered once and reused.
+
+Keys carry the catalog and stock versions the fragment was rendered at, so
+a fragment is never invalidated explicitly: after a change, requests ask
+for a new key and the old entries age out. Entries are evicted least
+recently used first once their total size passes MAX_BYTES.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from markupsafe import Markup
+
+MAX_BYTES = 16 * 1024 * 1024
+
+
+class FragmentCache:
+    """LRU map of key -> rendered HTML, capped by the memory the strings take"""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def put(self, key, html):
+        size = sys.getsizeof(html)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= sys.getsizeof(previous)
+            self._entries[key] = html
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= sys.getsizeof(evicted)
+
+    def get_or_render(self, key, render):
+        """The cached fragment for key, calling render() to make it on a miss"""
+        html = self.get(key)
+        if html is None:
+            html = Markup(render())
+            self.put(key, html)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = FragmentCache()
+
+
+def get_or_render(key, render):
+    return _cache.get_or_render(key, render)
+
+
+def clear():
+    _cache.clear()
+
+
+def stats():
+    """Entries, bytes held and hit counts, for monitoring"""
+    return {'entries': len(_cache), 'bytes': _cache.size, 'max_bytes': _cache.max_bytes,
+            'hits': _cache.hits, 'misses': _cache.misses}
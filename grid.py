@@ -0,0 +1,231 @@
+"""
+Server-side grids for the staff tables
+Answers DataTables serverSide requests one page at a time: sorting is limited
+to indexed columns, search is a LIKE filter, and paging forward uses a keyset
+cursor instead of OFFSET so deep pages cost the same as the first one.
+"""
+import json
+from datetime import datetime
+from sqlalchemy import and_, func, or_, select
+from database import db, Product, Client, Location, Movement, Order
+
+MAX_PAGE_LENGTH = 100
+
+
+class Grid:
+    """How one staff table is queried, sorted, searched and serialized"""
+
+    def __init__(self, model, sort_columns, default_sort, search_columns, row, query=None):
+        self.model = model
+        self.sort_columns = sort_columns  # DataTables column name -> indexed column
+        self.default_sort = default_sort  # (column name, 'asc' or 'desc')
+        self.search_columns = search_columns
+        self.row = row  # result row -> JSON-ready dict
+        self.query = query or (lambda: select(model))
+
+
+def _movement_row(row):
+    movement = row[0]
+    return {
+        'movement_id': movement.movement_id,
+        'product_id': movement.product_id,
+        'qty': movement.qty,
+        'from_location': movement.from_location,
+        'to_location': movement.to_location,
+        'movement_time': movement.movement_time,
+    }
+
+
+def _order_row(row):
+    order, client_name = row
+    return {
+        'order_id': order.order_id,
+        'client_id': order.client_id,
+        'client_name': client_name or order.client_id,
+        'created_at': order.created_at.strftime('%Y-%m-%d %H:%M') if order.created_at else '',
+        'items': [{'name': item.get('name'), 'quantity': item.get('quantity'), 'points': item.get('points')}
+                  for item in order.get_items()],
+        'total_points': order.total_points,
+        'fulfillment_method': order.fulfillment_method,
+        'satellite_location': order.satellite_location,
+        'status': order.status,
+        'note_to_staff': order.note_to_staff,
+    }
+
+
+def _client_row(row):
+    client = row[0]
+    return {
+        'client_id': client.client_id,
+        'name': client.name,
+        'email': client.email,
+        'phone': client.phone,
+        'household_size': client.household_size,
+        'language': client.language,
+        'points_per_visit': client.points_per_visit,
+    }
+
+
+def _product_row(row):
+    product = row[0]
+    return {
+        'product_id': product.product_id,
+        'category': product.category,
+        'points': product.points,
+        'nutrition_score': product.nutrition_score,
+        'servings': product.servings,
+        'date_created': product.date_created,
+    }
+
+
+def _location_row(row):
+    location = row[0]
+    return {
+        'location_id': location.location_id,
+        'date_created': location.date_created,
+    }
+
+
+GRIDS = {
+    'movements': Grid(
+        Movement,
+        sort_columns={'movement_id': Movement.movement_id, 'product_id': Movement.product_id,
+                      'movement_time': Movement.created_at},
+        default_sort=('movement_id', 'desc'),
+        search_columns=[Movement.product_id, Movement.from_location, Movement.to_location],
+        row=_movement_row,
+    ),
+    'orders': Grid(
+        Order,
+        sort_columns={'order_id': Order.order_id, 'created_at': Order.created_at, 'status': Order.status},
+        default_sort=('created_at', 'desc'),
+        search_columns=[Order.invoice_number, Order.client_id, Client.name, Order.status, Order.fulfillment_method],
+        row=_order_row,
+        query=lambda: select(Order, Client.name).outerjoin(Client, Client.client_id == Order.client_id),
+    ),
+    'clients': Grid(
+        Client,
+        sort_columns={'client_id': Client.client_id, 'name': Client.name},
+        default_sort=('client_id', 'asc'),
+        search_columns=[Client.client_id, Client.name, Client.email, Client.phone],
+        row=_client_row,
+    ),
+    'products': Grid(
+        Product,
+        sort_columns={'product_id': Product.product_id, 'category': Product.category,
+                      'nutrition_score': Product.nutrition_score, 'date_created': Product.id},
+        default_sort=('product_id', 'asc'),
+        search_columns=[Product.product_id, Product.category, Product.upc],
+        row=_product_row,
+    ),
+    'locations': Grid(
+        Location,
+        sort_columns={'location_id': Location.location_id, 'date_created': Location.id},
+        default_sort=('location_id', 'asc'),
+        search_columns=[Location.location_id],
+        row=_location_row,
+    ),
+}
+
+
+def _requested_sort(grid, args):
+    """Read DataTables' order[0][...] parameters, falling back to the grid default"""
+    column_index = args.get('order[0][column]')
+    name = args.get(f'columns[{column_index}][data]') if column_index is not None else None
+    direction = args.get('order[0][dir]', '').lower()
+    if name not in grid.sort_columns:
+        return grid.default_sort
+    return name, 'desc' if direction == 'desc' else 'asc'
+
+
+def _encode_cursor(sort, search, value, key):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    return json.dumps({'sort': sort, 'search': search, 'value': value, 'key': key})
+
+
+def _decode_cursor(raw, sort, search, column):
+    """Get (value, key) from a cursor, or None if it does not fit this request"""
+    if not raw:
+        return None
+    try:
+        cursor = json.loads(raw)
+        if cursor['sort'] != sort or cursor['search'] != search:
+            return None
+        value = cursor['value']
+        if value is not None and isinstance(column.type, db.DateTime):
+            value = datetime.fromisoformat(value)
+        return value, int(cursor['key'])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _after(sort_column, key_column, direction, value, key):
+    """Rows that come after (value, key) in the grid's order
+
+    SQLite sorts NULL below every value: NULL rows come first ascending and
+    last descending, and a comparison with NULL is never true, so they get
+    their own IS NULL terms.
+    """
+    if direction == 'desc':
+        if value is None:
+            return and_(sort_column.is_(None), key_column < key)
+        return or_(sort_column < value, and_(sort_column == value, key_column < key), sort_column.is_(None))
+    if value is None:
+        return or_(sort_column.is_not(None), and_(sort_column.is_(None), key_column > key))
+    return or_(sort_column > value, and_(sort_column == value, key_column > key))
+
+
+def query_grid(name, args):
+    """Answer one DataTables serverSide request for the named grid
+
+    Besides the standard DataTables fields, the response carries a 'cursor'
+    for the last row; sending it back as 'after' fetches the next page with
+    a keyset seek. Without it (e.g. jumping to a page) OFFSET is used.
+    """
+    grid = GRIDS[name]
+    draw = args.get('draw', 0, type=int)
+    start = max(args.get('start', 0, type=int), 0)
+    length = args.get('length', 25, type=int)
+    if length <= 0 or length > MAX_PAGE_LENGTH:
+        length = MAX_PAGE_LENGTH
+    search = args.get('search[value]', '').strip()
+
+    sort_name, direction = _requested_sort(grid, args)
+    sort_column = grid.sort_columns[sort_name]
+    key_column = grid.model.id
+
+    stmt = grid.query()
+    if search:
+        pattern = f'%{search}%'
+        stmt = stmt.where(or_(*[column.ilike(pattern) for column in grid.search_columns]))
+
+    records_total = db.session.execute(select(func.count()).select_from(grid.model)).scalar()
+    if search:
+        records_filtered = db.session.execute(select(func.count()).select_from(stmt.subquery())).scalar()
+    else:
+        records_filtered = records_total
+
+    sort = f'{sort_name}:{direction}'
+    cursor = _decode_cursor(args.get('after'), sort, search, sort_column)
+    if cursor:
+        stmt = stmt.where(_after(sort_column, key_column, direction, *cursor))
+    else:
+        stmt = stmt.offset(start)
+
+    if direction == 'desc':
+        stmt = stmt.order_by(sort_column.desc(), key_column.desc())
+    else:
+        stmt = stmt.order_by(sort_column.asc(), key_column.asc())
+
+    rows = db.session.execute(stmt.limit(length)).all()
+    response = {
+        'draw': draw,
+        'recordsTotal': records_total,
+        'recordsFiltered': records_filtered,
+        'data': [grid.row(row) for row in rows],
+    }
+    if rows:
+        last = rows[-1][0]
+        response['cursor'] = _encode_cursor(sort, search, getattr(last, sort_column.key), last.id)
+    return response
@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""
+Product image store and derivatives for SmartChoice Pantry System
+Uploads are stored once per distinct content, named by their SHA-256, and
+recorded in the stored_images table; uploading a photo that is already
+stored reuses the file. Resized copies are made next to each file in WebP
+and JPEG at a few widths:
+
+  static/images/products/<sha256>.jpg
+  static/images/products/sized/<sha256>/240.webp, 240.jpg, 480.webp, ...
+
+Files no product refers to any more (the product was deleted or given
+another image) are removed by the gc command, after a grace period that
+protects uploads whose product is still being saved.
+
+Remote image URLs (product images set by URL, the placeholder, category
+pictures) are mirrored into the same store by a background job, once per
+URL, and products are pointed at the local copy. Templates wrap remote URLs
+in local_image(), which answers with the local copy once there is one and
+queues the fetch otherwise. Failed fetches are retried with backoff.
+
+Resizing runs on a small thread pool, so an upload request returns as soon
+as the original is saved. When a product's derivatives are written, the
+catalog version is bumped, so cached grids and page ETags pick them up.
+Templates call image_variants(product.image_url) to get srcset values. It
+returns None until the derivatives exist, and for images stored elsewhere,
+which are then shown as before.
+
+Needs Pillow; without it uploads are only kept at full size.
+
+Usage:
+  python images.py backfill [--force]   # Make derivatives for existing uploads
+  python images.py gc [--dry-run]       # Remove images no product uses
+  python images.py mirror               # Copy remote product images into the store
+"""
+import argparse
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import shutil
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlparse
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Optional: without Pillow images are served at full size
+    Image = None
+
+WIDTHS = (240, 480, 960)  # Cards are 250-400 CSS px wide, 180 px tall; 960 covers 2x screens
+SIZES = '(max-width: 600px) 100vw, 320px'
+FORMATS = [
+    ('webp', {'quality': 80, 'method': 4}),
+    ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+SIZED_DIR = 'sized'
+MANIFEST = 'sizes.json'  # Written last: the derivatives are complete once it exists
+SOURCE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp'}
+UPLOAD_URL = '/static/images/products/'
+WORKERS = 2
+GC_GRACE = timedelta(hours=1)  # Unreferenced files younger than this may belong to a product being saved
+
+PLACEHOLDER_URL = 'https://images.unsplash.com/photo-1498837167922-ddd27525d352?w=400'  # Products without an image
+FETCH_TIMEOUT = 10
+FETCH_WORKERS = 4
+MAX_FETCH_BYTES = 16 * 1024 * 1024  # Same cap as uploads
+RETRY_AFTER = timedelta(minutes=10)  # Doubled after every further failure
+MAX_FAILURES = 6  # Then the URL is left alone until the mirror command is run with --retry
+LOCAL_RECHECK_SECONDS = 60.0  # How often local_image() queues the same unmirrored URL again
+USER_AGENT = 'SmartChoice-Pantry image cache'
+PIL_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.path.join(ROOT, 'static', 'images', 'products')
+
+_pool = None
+_pool_lock = threading.Lock()
+_known = {}  # image_url -> variants; derivatives are never rewritten, so these stay valid
+_mirrors = (None, {})  # (catalog version, {remote url: local image_url}) as local_image() last read them
+_queued = {}  # remote url -> time.monotonic() its mirroring was last queued by local_image()
+
+
+def sized_dir(source_path):
+    """Folder holding the derivatives of an uploaded image"""
+    folder, name = os.path.split(source_path)
+    return os.path.join(folder, SIZED_DIR, os.path.splitext(name)[0])
+
+
+def _save(image, path, fmt, options):
+    temporary = f'{path}.tmp'
+    image.save(temporary, format='JPEG' if fmt == 'jpg' else fmt.upper(), **options)
+    os.replace(temporary, path)
+
+
+def make_derivatives(source_path):
+    """Write the resized copies of one image; returns the widths made
+
+    Widths larger than the original are not made (the original width is used
+    instead), so small uploads are never scaled up.
+    """
+    output = sized_dir(source_path)
+    os.makedirs(output, exist_ok=True)
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode != 'RGB':  # Flatten transparency onto white; JPEG has no alpha
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, 'white')
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        widths = sorted({min(width, image.width) for width in WIDTHS})
+        for width in widths:
+            height = max(round(image.height * width / image.width), 1)
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            for fmt, options in FORMATS:
+                _save(resized, os.path.join(output, f'{width}.{fmt}'), fmt, options)
+    manifest = os.path.join(output, MANIFEST)
+    with open(f'{manifest}.tmp', 'w') as f:
+        json.dump({'widths': widths, 'source': os.path.basename(source_path)}, f)
+    os.replace(f'{manifest}.tmp', manifest)
+    return widths
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:  # Made on first use, so each forked worker gets its own threads
+            _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='images')
+        return _pool
+
+
+def _announce(app):
+    """Bump the catalog version so pages rendered without the derivatives are rebuilt"""
+    import catalog
+    from database import db, bump_version, CATALOG_VERSION
+    with app.app_context():
+        with db.engine.begin() as connection:
+            bump_version(connection, CATALOG_VERSION)
+    catalog.invalidate()
+
+
+def _process(source_path, app):
+    try:
+        make_derivatives(source_path)
+    except Exception as e:  # The original is still served; the backfill can retry
+        print(f"Error resizing {source_path}: {e}")
+        return
+    if app is not None:
+        _announce(app)
+
+
+def submit(source_path, app=None):
+    """Make an uploaded image's derivatives in the background; returns a Future (or None without Pillow)
+
+    With app given, the catalog version is bumped once they are written.
+    """
+    if Image is None:
+        return None
+    return _executor().submit(_process, source_path, app)
+
+
+def image_variants(image_url, static_folder=None):
+    """srcset data for an uploaded image, or None if it has no derivatives (yet)
+
+    Returns a dict with 'webp' and 'jpg' srcset strings, 'src' (a mid-sized
+    JPEG for browsers without srcset) and 'sizes'.
+    """
+    if not image_url or not image_url.startswith(UPLOAD_URL):
+        return None
+    variants = _known.get(image_url)
+    if variants is not None:
+        return variants
+    if static_folder is None:
+        from flask import current_app
+        static_folder = current_app.static_folder
+    name = image_url[len(UPLOAD_URL):]
+    try:
+        with open(os.path.join(sized_dir(os.path.join(static_folder, 'images', 'products', name)), MANIFEST)) as f:
+            widths = json.load(f)['widths']
+    except (OSError, ValueError, KeyError):
+        return None
+    base = f'{UPLOAD_URL}{SIZED_DIR}/{os.path.splitext(name)[0]}/'
+    variants = {fmt: ', '.join(f'{base}{width}.{fmt} {width}w' for width in widths) for fmt, _ in FORMATS}
+    variants['src'] = f'{base}{widths[min(1, len(widths) - 1)]}.jpg'
+    variants['sizes'] = SIZES
+    _known[image_url] = variants
+    return variants
+
+
+def _is_image(filename):
+    return os.path.splitext(filename)[1].lower() in SOURCE_EXTENSIONS
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _register(filename, sha256, size):
+    """Record a stored file unless its content is already stored; returns the filename that holds it"""
+    from database import db, get_eastern_time, StoredImage
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    db.session.execute(sqlite_insert(StoredImage).values(
+        filename=filename, sha256=sha256, size=size, stored_at=get_eastern_time(),
+    ).on_conflict_do_nothing())
+    return db.session.query(StoredImage.filename).filter_by(sha256=sha256).scalar()
+
+
+def store_image(content, ext, upload_folder, app=None):
+    """Store image bytes once per content; returns the image_url of the file holding them
+
+    Content that is already stored reuses that file, whatever it was called.
+    New files get their derivatives made in the background. The
+    stored_images row joins the caller's transaction, so commit it together
+    with whatever uses the image.
+    """
+    from database import db, get_eastern_time, StoredImage
+    sha256 = hashlib.sha256(content).hexdigest()
+    stored = db.session.query(StoredImage).filter_by(sha256=sha256).first()
+    if stored is not None and os.path.exists(os.path.join(upload_folder, stored.filename)):
+        stored.stored_at = get_eastern_time()  # Restart the GC grace period
+        return UPLOAD_URL + stored.filename
+    if stored is not None:  # Row left behind by a file removed by hand
+        db.session.delete(stored)
+        db.session.flush()
+
+    ext = ext.lower()
+    filename = sha256 + ('.jpg' if ext == '.jpeg' else ext)
+    path = os.path.join(upload_folder, filename)
+    if not os.path.exists(path):
+        with open(f'{path}.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(f'{path}.tmp', path)
+    filename = _register(filename, sha256, len(content))  # Another worker may have stored it meanwhile
+    if not os.path.exists(os.path.join(sized_dir(path), MANIFEST)):
+        submit(os.path.join(upload_folder, filename), app)
+    return UPLOAD_URL + filename
+
+
+def store_upload(file, upload_folder, app=None):
+    """Store an uploaded image (a werkzeug FileStorage); returns its image_url"""
+    return store_image(file.read(), os.path.splitext(file.filename or '')[1], upload_folder, app)
+
+
+def is_remote(url):
+    return bool(url) and url.startswith(('http://', 'https://'))
+
+
+def fetch(url):
+    """(content, file extension) of a remote image; raises OSError or ValueError if it is not one"""
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT, 'Accept': 'image/*'})
+    with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+        content_type = response.headers.get_content_type()
+        content = response.read(MAX_FETCH_BYTES + 1)
+    if not content_type.startswith('image/'):
+        raise ValueError(f'not an image ({content_type})')
+    if len(content) > MAX_FETCH_BYTES:
+        raise ValueError('image too large')
+    if Image is not None:
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                ext = PIL_EXTENSIONS.get(image.format)
+                image.verify()
+        except Exception as e:
+            raise ValueError(f'unreadable image: {e}') from e
+    else:
+        ext = mimetypes.guess_extension(content_type) or os.path.splitext(urlparse(url).path)[1]
+    if not ext or ext.lower() not in SOURCE_EXTENSIONS:
+        raise ValueError(f'unsupported image type ({content_type})')
+    return content, ext
+
+
+def _try_fetch(url):
+    try:
+        return fetch(url)
+    except Exception as e:  # One dead link must not stop the rest
+        return e
+
+
+def _retry_due(record, now, retry=False):
+    """Whether a remote image should be fetched (again)"""
+    if record.filename is not None:
+        return False
+    if record.failures >= MAX_FAILURES and not retry:
+        return False
+    if record.fetched_at is None or retry:
+        return True
+    return record.fetched_at + RETRY_AFTER * 2 ** max(record.failures - 1, 0) <= now
+
+
+def mirror(urls, upload_folder=None, app=None, retry=False):
+    """Fetch remote images into the store, each URL once; returns {url: local image_url}
+
+    Runs inside an app context. URLs mirrored before are answered from the
+    remote_images table without a fetch; failed URLs are only tried again
+    once their backoff has passed (or always with retry).
+    """
+    import catalog
+    from flask import current_app
+    from sqlalchemy.exc import IntegrityError
+    from database import db, bump_version, get_eastern_time, CATALOG_VERSION, RemoteImage
+    upload_folder = upload_folder or current_app.config['UPLOAD_FOLDER']
+    now = get_eastern_time().replace(tzinfo=None)
+    urls = sorted({url for url in urls if is_remote(url)})
+    records = {r.url: r for r in RemoteImage.query.filter(RemoteImage.url.in_(urls))} if urls else {}
+
+    local, due = {}, []
+    for url in urls:
+        record = records.get(url)
+        if record is not None and record.filename and not os.path.exists(os.path.join(upload_folder, record.filename)):
+            record.filename = None  # The file was removed by hand: fetch it again
+        if record is not None and record.filename:
+            local[url] = UPLOAD_URL + record.filename
+        elif record is None or _retry_due(record, now, retry):
+            due.append(url)
+    if not due:
+        return local
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:  # Fetch in parallel, store from this thread
+        results = list(pool.map(_try_fetch, due))
+    for url, result in zip(due, results):
+        record = records.get(url)
+        if record is None:
+            record = RemoteImage(url=url, failures=0)
+            db.session.add(record)
+        record.fetched_at = now
+        if isinstance(result, Exception):
+            record.failures = (record.failures or 0) + 1
+            record.last_error = str(result)[:200]
+            continue
+        image_url = store_image(*result, upload_folder, app)
+        record.filename = image_url[len(UPLOAD_URL):]
+        record.failures = 0
+        record.last_error = None
+        local[url] = image_url
+    fetched = any(not isinstance(result, Exception) for result in results)
+    if fetched:  # Pages showing these URLs (see local_image) are rendered again
+        bump_version(db.session.connection(), CATALOG_VERSION)
+    try:
+        db.session.commit()
+    except IntegrityError:  # Another process mirrored the same URL first; its copy wins
+        db.session.rollback()
+        return {}
+    if fetched:
+        catalog.invalidate()
+    return local
+
+
+def mirror_products(urls=None, upload_folder=None, app=None, retry=False):
+    """Mirror remote product images (all, or only urls) and point the products at the copies
+
+    Returns how many products now use a local copy. Runs inside an app context.
+    """
+    from sqlalchemy import or_
+    from database import db, Product
+    if urls is None:
+        remote = db.session.query(Product.image_url).filter(
+            or_(Product.image_url.startswith('http://'), Product.image_url.startswith('https://'))).distinct()
+        urls = [url for url, in remote]
+    local = mirror(urls, upload_folder, app, retry)
+    if not local:
+        return 0
+    products = Product.query.filter(Product.image_url.in_(list(local))).all()
+    for product in products:
+        product.image_url = local[product.image_url]
+    db.session.commit()
+    return len(products)
+
+
+def _mirror_job(urls, app):
+    with app.app_context():
+        try:
+            mirror_products(urls, app=app)
+        except Exception as e:  # The remote URL keeps being used; the next page view queues it again
+            print(f"Error mirroring {', '.join(urls)}: {e}")
+        finally:
+            from database import db
+            db.session.remove()
+
+
+def mirror_later(urls, app):
+    """Mirror remote image URLs on the background pool, then point products using them at the copies
+
+    Does nothing when the app's MIRROR_REMOTE_IMAGES setting is false.
+    """
+    urls = [url for url in urls if is_remote(url)]
+    if urls and app.config.get('MIRROR_REMOTE_IMAGES', True):
+        return _executor().submit(_mirror_job, urls, app)
+    return None
+
+
+def local_image(url):
+    """The local copy of a remote image URL, or the URL itself until it is mirrored
+
+    The URLs mirrored so far are read in one query whenever the catalog
+    version has moved on (mirroring bumps it), so pages never look them up
+    one by one. A URL without a copy has its mirroring queued, at most once
+    every LOCAL_RECHECK_SECONDS per process. Local URLs are returned unchanged.
+    """
+    global _mirrors
+    if not is_remote(url):
+        return url
+    import catalog
+    from flask import current_app
+    from database import db, RemoteImage
+    version, mirrors = _mirrors
+    if version != catalog.version():
+        version = catalog.version()
+        rows = db.session.query(RemoteImage.url, RemoteImage.filename).filter(RemoteImage.filename.isnot(None))
+        mirrors = {remote: UPLOAD_URL + filename for remote, filename in rows}
+        _mirrors = (version, mirrors)
+    if url in mirrors:
+        return mirrors[url]
+    now = time.monotonic()
+    if now - _queued.get(url, -LOCAL_RECHECK_SECONDS) >= LOCAL_RECHECK_SECONDS:
+        _queued[url] = now
+        mirror_later([url], current_app._get_current_object())
+    return url
+
+
+def collect_garbage(upload_folder=None, grace=GC_GRACE, dry_run=False):
+    """Remove stored images no product refers to; returns (files removed, bytes freed)
+
+    Runs inside an app context. Files uploaded before the store existed are
+    registered when a product uses them; one whose content is already stored
+    under another name is deduplicated by pointing its products at that file.
+    """
+    from flask import current_app
+    from database import db, get_eastern_time, Product, RemoteImage, StoredImage
+    upload_folder = upload_folder or current_app.config['UPLOAD_FOLDER']
+
+    def referenced():
+        urls = db.session.query(Product.image_url).filter(Product.image_url.startswith(UPLOAD_URL))
+        mirrors = db.session.query(RemoteImage.filename).filter(RemoteImage.filename.isnot(None))
+        return {url[len(UPLOAD_URL):] for url, in urls} | {filename for filename, in mirrors}
+
+    stored = {row.filename: row for row in StoredImage.query}
+    for filename in sorted(referenced() - stored.keys()):
+        path = os.path.join(upload_folder, filename)
+        if not os.path.isfile(path):
+            continue
+        holder = _register(filename, _sha256_file(path), os.path.getsize(path))
+        if holder != filename and not dry_run:
+            for product in Product.query.filter_by(image_url=UPLOAD_URL + filename):
+                product.image_url = UPLOAD_URL + holder
+    db.session.flush()
+
+    in_use = referenced()
+    stored = {row.filename: row for row in StoredImage.query}
+    cutoff = (get_eastern_time() - grace).replace(tzinfo=None)
+    removed, freed = 0, 0
+    for filename in sorted(os.listdir(upload_folder)):
+        path = os.path.join(upload_folder, filename)
+        if filename in in_use or not os.path.isfile(path) or not _is_image(filename):
+            continue
+        row = stored.pop(filename, None)
+        if row is not None and row.stored_at.replace(tzinfo=None) > cutoff:
+            continue
+        # No row yet: the upload's row may still be uncommitted, so go by the file's age
+        if row is None and time.time() - os.path.getmtime(path) < grace.total_seconds():
+            continue
+        removed += 1
+        freed += os.path.getsize(path)
+        if not dry_run:
+            os.remove(path)
+            shutil.rmtree(sized_dir(path), ignore_errors=True)
+            if row is not None:
+                db.session.delete(row)
+    for filename, row in stored.items():  # Rows whose file is gone
+        if filename not in in_use and not os.path.exists(os.path.join(upload_folder, filename)) and not dry_run:
+            db.session.delete(row)
+
+    sized_root = os.path.join(upload_folder, SIZED_DIR)
+    if os.path.isdir(sized_root):  # Derivatives whose original is gone
+        originals = {os.path.splitext(name)[0] for name in os.listdir(upload_folder)}
+        for name in os.listdir(sized_root):
+            if name not in originals and not dry_run:
+                shutil.rmtree(os.path.join(sized_root, name), ignore_errors=True)
+
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
+    return removed, freed
+
+
+def clear():
+    """Forget what is known about derivatives and mirrors, e.g. after the database is replaced"""
+    global _mirrors
+    _known.clear()
+    _mirrors = (None, {})
+    _queued.clear()
+
+
+def init_app(app):
+    """Make image_variants(), local_image() and placeholder_image_url available to templates"""
+    app.add_template_global(image_variants)
+    app.add_template_global(local_image)
+    app.add_template_global(PLACEHOLDER_URL, 'placeholder_image_url')
+
+
+def backfill(upload_folder=UPLOAD_FOLDER, force=False):
+    """Make derivatives for every upload that has none, on the worker pool; returns how many"""
+    sources = []
+    for name in sorted(os.listdir(upload_folder)):
+        path = os.path.join(upload_folder, name)
+        if os.path.isfile(path) and _is_image(name):
+            if force or not os.path.exists(os.path.join(sized_dir(path), MANIFEST)):
+                sources.append(path)
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or WORKERS) as pool:
+        for path, result in zip(sources, pool.map(_try_derivatives, sources)):
+            if isinstance(result, Exception):
+                print(f'  {os.path.basename(path)}: {result}')
+    return len(sources)
+
+
+def _try_derivatives(path):
+    try:
+        return make_derivatives(path)
+    except Exception as e:  # One unreadable upload must not stop the rest
+        return e
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Product image store: resized copies and garbage collection')
+    parser.add_argument('command', choices=['backfill', 'gc', 'mirror'])
+    parser.add_argument('--force', action='store_true', help='backfill: remake derivatives that already exist')
+    parser.add_argument('--dry-run', action='store_true', help='gc: report what would be removed')
+    parser.add_argument('--retry', action='store_true', help='mirror: fetch URLs that failed before right away')
+    args = parser.parse_args(argv)
+
+    if args.command == 'mirror':
+        from main import create_app
+        app = create_app()
+        with app.app_context():
+            count = mirror_products(upload_folder=UPLOAD_FOLDER, app=app, retry=args.retry)
+        print(f'{count} products now use a local copy of their image')
+        return 0
+
+    if args.command == 'gc':
+        from main import create_app
+        with create_app().app_context():
+            removed, freed = collect_garbage(UPLOAD_FOLDER, dry_run=args.dry_run)
+        action = 'Would remove' if args.dry_run else 'Removed'
+        print(f'{action} {removed} unused images ({freed / 1024:.1f} KB)')
+        return 0
+    if Image is None:
+        print('Pillow is not installed: pip install -r requirements.txt')
+        return 1
+    count = backfill(force=args.force)
+    print(f'Processed {count} images')
+    if count:
+        # Let running servers re-render pages with the new srcsets
+        from main import create_app
+        _announce(create_app())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+Inventory service for SmartChoice Pantry System
+Current stock is answered from the stock_balances table, which database.py
+keeps in step with every write to the movements ledger. Historical stock is
+answered from the nearest stock snapshot plus the movements recorded after it.
+"""
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select, union_all
+from database import db, Product, Movement, StockBalance, StockSnapshot, StockSnapshotLine
+from database import bump_version, read_version, STOCK_VERSION
+
+# Stock a shopper can take: it is on the pantry shelves and not reserved for
+# another order. Checkout and kiosk orders draw from these locations.
+AVAILABLE_LOCATIONS = ('Pantry',)
+
+# How long a process trusts the stock version it last read. Its own commits
+# refresh it at once; other processes' commits are seen within this time.
+STOCK_RECHECK_SECONDS = 2.0
+
+_stock_version = None  # (version, last modified) as last read
+_stock_checked_at = float('-inf')
+
+
+def _stock_version_row():
+    global _stock_version, _stock_checked_at
+    if _stock_version is None or time.monotonic() - _stock_checked_at >= STOCK_RECHECK_SECONDS:
+        _stock_version = read_version(STOCK_VERSION)
+        _stock_checked_at = time.monotonic()
+    return _stock_version
+
+
+def stock_version():
+    """The stock version (bumped with every stock balance change), re-read at most every STOCK_RECHECK_SECONDS
+
+    Caches built from stock levels key their entries on this.
+    """
+    return _stock_version_row()[0]
+
+
+def stock_last_modified():
+    """UTC time of the stock_version() bump, or None if stock was never written"""
+    return _stock_version_row()[1]
+
+
+def forget_stock_version():
+    """Re-read the stock version on next use, e.g. after the database is replaced"""
+    global _stock_version
+    _stock_version = None
+
+
+def recheck_stock_version():
+    """Check the stored stock version on next use instead of waiting for STOCK_RECHECK_SECONDS"""
+    global _stock_checked_at
+    _stock_checked_at = float('-inf')
+
+
+@event.listens_for(db.session, 'after_commit')
+def _refresh_after_own_stock_writes(session):
+    if session.info.pop('stock_changed', False):
+        forget_stock_version()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_rolled_back_stock_writes(session):
+    session.info.pop('stock_changed', None)
+
+
+def get_stock(product_id):
+    """Get {location: qty} for a single product"""
+    rows = StockBalance.query.filter_by(product_id=product_id).all()
+    return {row.location_id: row.qty for row in rows}
+
+
+def get_location_qty(product_id, location_id):
+    """Get the quantity of a product held at one location"""
+    row = StockBalance.query.filter_by(product_id=product_id, location_id=location_id).first()
+    return row.qty if row else 0
+
+
+def get_stock_levels(product_ids=None):
+    """Get {product_id: {location: qty}} for the given products (all products if None)"""
+    query = StockBalance.query
+    if product_ids is not None:
+        query = query.filter(StockBalance.product_id.in_(product_ids))
+
+    levels = defaultdict(dict)
+    for row in query.order_by(StockBalance.product_id, StockBalance.location_id):
+        levels[row.product_id][row.location_id] = row.qty
+    return levels
+
+
+def get_availability(product_ids):
+    """Get {product_id: available qty} for a set of products in one query
+
+    Every product asked for is in the result; products with no stock map to 0.
+    """
+    product_ids = list(product_ids)
+    availability = dict.fromkeys(product_ids, 0)
+    if not product_ids:
+        return availability
+
+    rows = db.session.execute(
+        select(StockBalance.product_id, func.sum(StockBalance.qty))
+        .where(StockBalance.product_id.in_(product_ids),
+               StockBalance.location_id.in_(AVAILABLE_LOCATIONS))
+        .group_by(StockBalance.product_id)
+    )
+    for product_id, qty in rows:
+        availability[product_id] = qty or 0
+    return availability
+
+
+def get_available_totals():
+    """Get {product_id: available qty} for every product that has any available stock"""
+    total = func.sum(StockBalance.qty)
+    rows = db.session.execute(
+        select(StockBalance.product_id, total)
+        .where(StockBalance.location_id.in_(AVAILABLE_LOCATIONS))
+        .group_by(StockBalance.product_id)
+        .having(total > 0)
+    )
+    return {product_id: qty for product_id, qty in rows}
+
+
+def _ledger_totals(snapshot=None, through_id=None, before=None):
+    """SQL aggregate of the movements ledger: one row per (product, location)
+
+    With a snapshot, starts from its lines and only adds the movements after
+    its watermark. through_id and before cut the ledger off at a movement id
+    or at a point in time.
+    """
+    conditions = []
+    if snapshot is not None:
+        conditions.append(Movement.id > snapshot.watermark)
+    if through_id is not None:
+        conditions.append(Movement.id <= through_id)
+    if before is not None:
+        conditions.append(Movement.created_at < before)
+
+    inflow = select(
+        Movement.product_id.label('product_id'),
+        Movement.to_location.label('location_id'),
+        Movement.qty.label('qty')
+    ).where(Movement.to_location.isnot(None), *conditions)
+    outflow = select(
+        Movement.product_id.label('product_id'),
+        Movement.from_location.label('location_id'),
+        (-Movement.qty).label('qty')
+    ).where(Movement.from_location.isnot(None), *conditions)
+    parts = [inflow, outflow]
+    if snapshot is not None:
+        parts.append(select(
+            StockSnapshotLine.product_id.label('product_id'),
+            StockSnapshotLine.location_id.label('location_id'),
+            StockSnapshotLine.qty.label('qty')
+        ).where(StockSnapshotLine.snapshot_id == snapshot.id))
+    legs = union_all(*parts).subquery()
+    return select(
+        legs.c.product_id,
+        legs.c.location_id,
+        func.sum(legs.c.qty).label('qty')
+    ).group_by(legs.c.product_id, legs.c.location_id)
+
+
+def rebuild_balances():
+    """Recompute every stock balance from the movements ledger"""
+    StockBalance.query.delete()
+    db.session.execute(
+        StockBalance.__table__.insert().from_select(['product_id', 'location_id', 'qty'], _ledger_totals())
+    )
+    bump_version(db.session.connection(), STOCK_VERSION)
+    db.session.commit()
+    return StockBalance.query.count()
+
+
+def latest_snapshot(before=None):
+    """Get the most recent stock snapshot, optionally only those taken before a time"""
+    query = StockSnapshot.query
+    if before is not None:
+        query = query.filter(StockSnapshot.taken_at < before)
+    return query.order_by(StockSnapshot.watermark.desc()).first()
+
+
+def take_snapshot():
+    """Checkpoint every balance at the newest movement
+
+    The snapshot is built from the previous snapshot plus the movements since
+    it, so it never depends on stock_balances being correct.
+    """
+    watermark = db.session.query(func.max(Movement.id)).scalar() or 0
+    previous = latest_snapshot()
+    if previous and previous.watermark == watermark:
+        return previous
+
+    totals = db.session.execute(_ledger_totals(snapshot=previous, through_id=watermark)).all()
+    snapshot = StockSnapshot(watermark=watermark)
+    db.session.add(snapshot)
+    db.session.flush()
+    db.session.add_all(
+        StockSnapshotLine(snapshot_id=snapshot.id, product_id=row.product_id, location_id=row.location_id, qty=row.qty)
+        for row in totals if row.qty
+    )
+    db.session.commit()
+    return snapshot
+
+
+def parse_as_of(value):
+    """Turn an 'as of' date (YYYY-MM-DD) into the moment that day ends"""
+    return datetime.strptime(value, '%Y-%m-%d') + timedelta(days=1)
+
+
+def get_stock_levels_as_of(before):
+    """Get {product_id: {location: qty}} as it stood just before a point in time"""
+    snapshot = latest_snapshot(before=before)
+    levels = defaultdict(dict)
+    for row in db.session.execute(_ledger_totals(snapshot=snapshot, before=before)):
+        if row.qty:
+            levels[row.product_id][row.location_id] = row.qty
+    return dict(sorted(levels.items()))
+
+
+def iter_balance_rows(before=None, location=None, category=None, min_qty=None, max_qty=None, chunk_size=500):
+    """Stream (product_id, category, location_id, qty) rows for the balance report
+
+    Current stock reads stock_balances; with before, the grouped snapshot plus
+    ledger aggregate is used instead. Filtering happens in SQL and rows are
+    fetched chunk_size at a time, so memory stays flat however long the ledger is.
+    Locations holding nothing are left out.
+    """
+    if before is None:
+        balances = select(
+            StockBalance.product_id.label('product_id'),
+            StockBalance.location_id.label('location_id'),
+            StockBalance.qty.label('qty')
+        ).subquery()
+    else:
+        balances = _ledger_totals(snapshot=latest_snapshot(before=before), before=before).subquery()
+
+    stmt = select(
+        balances.c.product_id,
+        Product.category,
+        balances.c.location_id,
+        balances.c.qty
+    ).outerjoin(Product, Product.product_id == balances.c.product_id).where(balances.c.qty != 0)
+    if location:
+        stmt = stmt.where(balances.c.location_id == location)
+    if category:
+        stmt = stmt.where(Product.category == category)
+    if min_qty is not None:
+        stmt = stmt.where(balances.c.qty >= min_qty)
+    if max_qty is not None:
+        stmt = stmt.where(balances.c.qty <= max_qty)
+    stmt = stmt.order_by(balances.c.product_id, balances.c.location_id)
+
+    result = db.session.execute(stmt.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        yield from partition
+
+
+def check_balances():
+    """Compare stock_balances with the ledger
+
+    The ledger side is the latest snapshot plus the movements since it.
+    Returns a list of (product_id, location_id, stored_qty, ledger_qty) for
+    every balance that disagrees; an empty list means the table can be trusted
+    """
+    snapshot = latest_snapshot()
+    ledger = {(row.product_id, row.location_id): row.qty
+              for row in db.session.execute(_ledger_totals(snapshot=snapshot))}
+    stored = {(row.product_id, row.location_id): row.qty for row in StockBalance.query.all()}
+
+    mismatches = []
+    for key in sorted(set(ledger) | set(stored)):
+        stored_qty = stored.get(key, 0)
+        ledger_qty = ledger.get(key, 0)
+        if stored_qty != ledger_qty:
+            mismatches.append((key[0], key[1], stored_qty, ledger_qty))
+    return mismatches
+
+
+if __name__ == '__main__':
+    import sys
+    from main import create_app, bootstrap
+
+    app = create_app()
+    bootstrap(app)
+    command = sys.argv[1].lower() if len(sys.argv) > 1 else 'check'
+
+    with app.app_context():
+        if command == 'rebuild':
+            count = rebuild_balances()
+            print(f"Rebuilt {count} stock balances from the movements ledger")
+        elif command == 'snapshot':
+            snapshot = take_snapshot()
+            print(f"Stock snapshot {snapshot.id} taken at movement {snapshot.watermark}")
+        elif command == 'check':
+            mismatches = check_balances()
+            if not mismatches:
+                print("Stock balances match the movements ledger")
+            else:
+                print(f"{len(mismatches)} stock balances disagree with the ledger:")
+                for product_id, location_id, stored_qty, ledger_qty in mismatches:
+                    print(f"  {product_id} @ {location_id}: stored {stored_qty}, ledger {ledger_qty}")
+                print("Run 'python inventory.py rebuild' to repair them")
+                sys.exit(1)
+        else:
+            print(f"Unknown command: {command}")
+            print("\nUsage:")
+            print("  python inventory.py check    - Compare stock balances with the movements ledger")
+            print("  python inventory.py rebuild  - Recompute stock balances from the movements ledger")
+            print("  python inventory.py snapshot - Checkpoint current balances (run periodically, e.g. nightly)")
@@ -0,0 +1,151 @@
+"""
+Schema migrations for SmartChoice Pantry System
+db.create_all() only creates missing tables; everything else an older
+database needs (new columns, indexes, backfills) is a step here. Each step
+runs once per database and is recorded in the schema_migrations table.
+"""
+from datetime import datetime
+from sqlalchemy import text
+from database import db, Counter, SchemaMigration, ID_SEQUENCES, CATALOG_VERSION, STOCK_VERSION
+from database import create_search_index, rebuild_search_index
+import dietary
+
+
+def _column_names(table):
+    """Names of the columns a table has in the database (not the model)"""
+    return {row[1] for row in db.session.execute(text(f'PRAGMA table_info({table})'))}
+
+
+def _add_column(table, column, ddl_type):
+    """Add a column to an existing table if it is not there yet"""
+    if column not in _column_names(table):
+        db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+
+
+def create_missing_indexes():
+    """Create every index the models declare that the database does not have yet"""
+    connection = db.session.connection()
+    for table in db.metadata.sorted_tables:
+        existing = _column_names(table.name)
+        for index in table.indexes:
+            # Indexes on columns a later migration adds are created by that migration
+            if all(column.name in existing for column in index.columns):
+                index.create(bind=connection, checkfirst=True)
+
+
+def hot_filter_indexes():
+    """Create the composite indexes for the route queries, dropping the one they replace"""
+    db.session.execute(text('DROP INDEX IF EXISTS ix_orders_fulfillment_method'))
+    create_missing_indexes()
+
+
+def backfill_stock_balances():
+    """Build stock_balances from the movements ledger"""
+    from inventory import rebuild_balances
+    rebuild_balances()
+
+
+def add_movement_created_at():
+    """Give movements a sortable timestamp, parsed from the display string for old rows"""
+    _add_column('movements', 'created_at', 'DATETIME')
+    rows = db.session.execute(text(
+        'SELECT id, movement_time FROM movements WHERE created_at IS NULL'
+    )).all()
+    updates = []
+    for movement_pk, movement_time in rows:
+        try:
+            created_at = datetime.strptime(movement_time, "%A, %B %d, %Y %I:%M %p")
+        except (TypeError, ValueError):
+            continue
+        updates.append({'id': movement_pk, 'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S.%f')})
+    if updates:
+        db.session.execute(text('UPDATE movements SET created_at = :created_at WHERE id = :id'), updates)
+
+
+def seed_id_sequences():
+    """Give orders, movements, clients and messages their own counter rows
+
+    Each starts above both the old shared counter and the highest id already
+    in its table, so block allocation never reissues an existing id.
+    """
+    highest = {
+        'orders': 'SELECT MAX(order_id) FROM orders',
+        'movements': 'SELECT MAX(movement_id) FROM movements',
+        'clients': "SELECT MAX(CAST(SUBSTR(client_id, 2) AS INTEGER)) FROM clients WHERE client_id GLOB 'C[0-9]*'",
+        'messages': 'SELECT MAX(message_id) FROM staff_messages',
+    }
+    main = Counter.query.filter_by(name='main').first()
+    floor = main.value if main and main.value else 100
+    for sequence in ID_SEQUENCES:
+        value = max(floor, db.session.execute(text(highest[sequence])).scalar() or 0)
+        counter = Counter.query.filter_by(name=sequence).first()
+        if counter is None:
+            db.session.add(Counter(name=sequence, value=value))
+        elif (counter.value or 0) < value:
+            counter.value = value
+
+
+def add_dietary_masks():
+    """Store dietary indicators and allergens as bitmasks next to their JSON"""
+    _add_column('products', 'dietary_mask', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column('products', 'allergen_mask', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column('clients', 'allergen_mask', 'INTEGER NOT NULL DEFAULT 0')
+    products = [
+        {'id': pk, 'dietary_mask': dietary.dietary_mask(indicators), 'allergen_mask': dietary.allergen_mask(allergens)}
+        for pk, indicators, allergens in db.session.execute(
+            text('SELECT id, dietary_indicators, allergens FROM products'))
+    ]
+    if products:
+        db.session.execute(text(
+            'UPDATE products SET dietary_mask = :dietary_mask, allergen_mask = :allergen_mask WHERE id = :id'
+        ), products)
+    clients = [
+        {'id': pk, 'allergen_mask': dietary.allergen_mask(allergens)}
+        for pk, allergens in db.session.execute(text('SELECT id, allergens FROM clients'))
+    ]
+    if clients:
+        db.session.execute(text('UPDATE clients SET allergen_mask = :allergen_mask WHERE id = :id'), clients)
+    # The diet index covers category + nutrition score, so it replaces that index
+    db.session.execute(text('DROP INDEX IF EXISTS ix_products_category_nutrition_score'))
+    create_missing_indexes()
+
+
+def add_product_search_index():
+    """Create the FTS5 product search index and fill it from the existing products"""
+    connection = db.session.connection()
+    create_search_index(connection)
+    rebuild_search_index(connection)
+
+
+def move_version_stamps():
+    """Move the '<name>_modified' counter rows into version_stamps"""
+    for name in (CATALOG_VERSION, STOCK_VERSION):
+        db.session.execute(text(
+            'INSERT OR REPLACE INTO version_stamps (name, modified) '
+            'SELECT :name, value FROM counter WHERE name = :stamp AND value IS NOT NULL'
+        ), {'name': name, 'stamp': name + '_modified'})
+        db.session.execute(text('DELETE FROM counter WHERE name = :stamp'), {'stamp': name + '_modified'})
+
+
+MIGRATIONS = [
+    ('0001_backfill_stock_balances', backfill_stock_balances),
+    ('0002_add_movement_created_at', add_movement_created_at),
+    ('0003_grid_sort_indexes', create_missing_indexes),
+    ('0004_hot_filter_indexes', hot_filter_indexes),
+    ('0005_seed_id_sequences', seed_id_sequences),
+    ('0006_dietary_masks', add_dietary_masks),
+    ('0007_product_search_index', add_product_search_index),
+    ('0008_version_stamps', move_version_stamps),
+]
+
+
+def run_migrations():
+    """Apply every migration this database has not seen yet"""
+    applied = {m.name for m in SchemaMigration.query.all()}
+    for name, step in MIGRATIONS:
+        if name in applied:
+            continue
+        step()
+        db.session.add(SchemaMigration(name=name))
+        db.session.commit()
+        print(f"Applied migration {name}")
@@ -0,0 +1,1888 @@
+# SmartChoice Pantry System - Food Pantry Management Software
+# SQL Database Version
+"""
+Routes for SmartChoice Pantry System
+Every page and API endpoint, on one blueprint that main.create_app registers.
+"""
+from flask import Blueprint, current_app, render_template, request, redirect, jsonify, flash, session, url_for
+from flask import Response, stream_template, stream_with_context
+from collections import defaultdict
+from datetime import datetime, timedelta
+import os
+import re
+import pytz
+from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.utils import secure_filename
+from database import db, User, Product as DBProduct, Client as DBClient, Location as DBLocation
+from database import Movement as DBMovement, Order as DBOrder, Appointment as DBAppointment, Counter, StaffMessage
+from database import InsufficientStock
+import carts
+import catalog
+import conditional
+import dietary
+import fragments
+import inventory
+import grid
+import images
+import search
+import suggest
+import swaps
+import storage
+
+bp = Blueprint('pantry', __name__)
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+# Helper function to remove specific locations
+def remove_specific_locations(locations, names_to_remove):
+    return [location for location in locations if location.location_id not in names_to_remove]
+
+
+# Helper to convert DB Product to dict-like object for templates
+class ProductProxy:
+    def __init__(self, db_product):
+        self.product_id = db_product.product_id
+        self.price = db_product.price
+        self.purchase_price = db_product.purchase_price
+        self.category = db_product.category
+        self.description = db_product.description
+        self.upc = db_product.upc
+        self.servings = db_product.servings
+        self.points = db_product.points
+        self.nutrition_score = db_product.nutrition_score
+        self.dietary_indicators = db_product.get_dietary_indicators()
+        self.allergens = db_product.get_allergens()
+        self.dietary_mask = db_product.dietary_mask or 0
+        self.allergen_mask = db_product.allergen_mask or 0
+        self.image_url = db_product.image_url
+        self.date_created = db_product.date_created
+        self.available_qty = 0  # Will be set by inventory calculation
+    
+    @classmethod
+    def from_catalog(cls, record):
+        """Proxy for a catalog.CatalogProduct: no query, no JSON decoding"""
+        proxy = cls.__new__(cls)
+        proxy.__dict__.update(record._asdict())
+        proxy.available_qty = 0
+        return proxy
+    
+    @property
+    def diet_keys(self):
+        """Normalized dietary keys ('vegan', 'gluten-free', ...) whatever spelling was stored"""
+        return dietary.dietary_keys(self.dietary_mask)
+
+
+def render_fragment(template, key, build_context):
+    """Render a template fragment that is the same for every shopper, or reuse it
+
+    The fragment is cached under the template, key and the current catalog and
+    stock versions; build_context() runs only when it has to be rendered.
+    """
+    cache_key = (template, catalog.version(), inventory.stock_version()) + tuple(key)
+    return fragments.get_or_render(cache_key, lambda: render_template(template, **build_context()))
+
+
+class ClientProxy:
+    def __init__(self, db_client):
+        self.client_id = db_client.client_id
+        self.name = db_client.name
+        self.email = db_client.email
+        self.phone = db_client.phone
+        self.address = db_client.address
+        self.household_size = db_client.household_size
+        self.language = db_client.language
+        self.eligibility_groups = db_client.get_eligibility_groups()
+        self.points_per_visit = db_client.points_per_visit
+        self.visits_per_period = db_client.visits_per_period
+        self.allergens = db_client.get_allergens()
+        self.allergen_mask = db_client.allergen_mask or 0
+        self.dietary_prefs = db_client.get_dietary_prefs()
+        self.medical_conditions = db_client.medical_conditions
+        self.special_instructions = db_client.special_instructions
+        self.delivery_address = db_client.delivery_address
+        self.delivery_notes = db_client.delivery_notes
+        self.date_created = db_client.date_created
+        self.last_visit = db_client.last_visit
+        self.dietary_prefs = db_client.get_dietary_prefs()
+        self.date_created = db_client.date_created
+        self.last_visit = db_client.last_visit
+
+
+class LocationProxy:
+    def __init__(self, db_location):
+        self.location_id = db_location.location_id
+        self.date_created = db_location.date_created
+
+
+class MovementProxy:
+    def __init__(self, db_movement):
+        self.movement_id = db_movement.movement_id
+        self.product_id = db_movement.product_id
+        self.qty = db_movement.qty
+        self.price = db_movement.price
+        self.from_location = db_movement.from_location
+        self.to_location = db_movement.to_location
+        self.movement_time = db_movement.movement_time
+
+
+class OrderProxy:
+    def __init__(self, db_order):
+        self.order_id = db_order.order_id
+        self.invoice_number = db_order.invoice_number
+        self.client_id = db_order.client_id
+        self.items = db_order.get_items()
+        self.total_points = db_order.total_points
+        self.fulfillment_method = db_order.fulfillment_method
+        self.satellite_location = db_order.satellite_location
+        self.delivery_address = db_order.delivery_address
+        self.delivery_status = db_order.delivery_status
+        self.delivery_driver = db_order.delivery_driver
+        self.delivery_notes = db_order.delivery_notes
+        self.note_to_staff = db_order.note_to_staff
+        self.status = db_order.status
+        self.pickup_time = db_order.pickup_time
+        self.created_at = db_order.created_at
+        self.completed_at = db_order.completed_at
+
+
+@bp.route('/', methods=['GET', 'POST'])
+def login_register():
+    if request.method == 'POST':
+        form_type = request.form['form_type']
+        if form_type == 'login':
+            username_or_email = request.form['username_or_email']
+            password = request.form['password']
+            user = User.query.filter(
+                (User.username == username_or_email) | (User.email == username_or_email)
+            ).first()
+
+            if user and check_password_hash(user.password, password):
+                session['user_id'] = user.username
+                session['user_role'] = user.role
+                return redirect('/home')
+            else:
+                flash('Invalid username/email or password')
+        elif form_type == 'register':
+            name = request.form['name']
+            username = request.form['username']
+            email = request.form['email']
+            password = request.form['password']
+
+            if User.query.filter_by(username=username).first():
+                flash('Username already exists')
+            elif User.query.filter_by(email=email).first():
+                flash('Email already exists')
+            else:
+                hashed_password = generate_password_hash(password)
+                new_user = User(name=name, username=username, email=email, 
+                              password=hashed_password, role='staff')
+                db.session.add(new_user)
+                db.session.commit()
+                flash('Registration successful. Please login.')
+                return redirect('/')
+
+    return render_template('login.html')
+
+
+@bp.route('/logout')
+def logout():
+    """Logout staff user"""
+    session.pop('user_id', None)
+    session.pop('user_role', None)
+    flash('You have been logged out successfully')
+    return redirect('/')
+
+
+@bp.route('/healthz', methods=['GET'])
+@storage.read_only
+def health_check():
+    """Liveness and database check for the load balancer and serve.py"""
+    try:
+        db.session.execute(db.text('SELECT 1'))
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e), 'pid': os.getpid()}), 503
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+
+# Client Shopping Portal
+@bp.route('/shop', methods=['GET'])
+def client_shop_login():
+    """Client login page for shopping"""
+    return render_template('client_login.html')
+
+
+@bp.route('/shop/login', methods=['POST'])
+def client_login():
+    """Handle client login"""
+    client_id = request.form.get('client_id')
+    client = DBClient.query.filter_by(client_id=client_id).first()
+    
+    if client:
+        session['client_id'] = client.client_id
+        session['client_name'] = client.name
+        session['client_language'] = client.language
+        return redirect('/shop/categories')
+    else:
+        flash('Client ID not found')
+        return redirect('/shop')
+
+
+@bp.route('/shop/categories', methods=['GET'])
+@storage.read_only
+def shop_categories():
+    """Display MyPlate categories for shopping"""
+    if 'client_id' not in session:
+        return redirect('/shop')
+    
+    client_id = session['client_id']
+    db_client = DBClient.query.filter_by(client_id=client_id).first()
+    client = ClientProxy(db_client)
+    
+    summary = carts.evaluate(carts.get(), client)
+    
+    return render_template('shop_categories.html', client=client, cart=summary.lines,
+                         points_used=summary.points_used, points_remaining=summary.points_remaining,
+                         myplate_points=summary.myplate, shortages=shortage_map(summary))
+
+
+@bp.route('/shop/category/<category>', methods=['GET'])
+@storage.read_only
+def shop_category_items(category):
+    """Display items in a specific category"""
+    if 'client_id' not in session:
+        return redirect('/shop')
+    
+    client_id = session['client_id']
+    db_client = DBClient.query.filter_by(client_id=client_id).first()
+    client = ClientProxy(db_client)
+    
+    # Dietary filters (?diet=vegan) and allergens to leave out (?avoid=peanuts), as masks.
+    # A diet no product can have matches nothing; an unknown allergen is in nothing to avoid.
+    diet = dietary.dietary_filter(request.args.getlist('diet'))
+    avoid = dietary.allergen_mask(request.args.getlist('avoid'))
+    
+    cart = carts.get()
+    etag = conditional.etag_for('category', category, diet, avoid, catalog.version(), inventory.stock_version(),
+                                client.points_per_visit, cart)
+    unchanged = conditional.not_modified(etag)
+    if unchanged:
+        return unchanged
+    
+    def grid_context():
+        # Filter products by category (already sorted by nutrition score, highest first)
+        records = catalog.in_category(category, diet=diet, avoid=avoid) if diet is not None else []
+        availability = inventory.get_availability(p.product_id for p in records)
+        
+        category_products = []
+        for record in records:
+            product = ProductProxy.from_catalog(record)
+            if availability[product.product_id] > 0:
+                product.available_qty = availability[product.product_id]
+                category_products.append(product)
+        return {'products': category_products}
+    
+    product_grid = render_fragment('shop_items_grid.html', (category, diet, avoid), grid_context)
+    summary = carts.evaluate(cart, client, stock=False)
+    
+    return conditional.with_validators(
+        render_template('shop_items.html', category=category, product_grid=product_grid,
+                        client=client, cart=summary.lines, points_remaining=summary.points_remaining),
+        etag
+    )
+
+
+@bp.route('/shop/add-to-cart', methods=['POST'])
+def add_to_cart():
+    """Add item to shopping cart"""
+    if 'client_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    
+    product_id = request.json.get('product_id')
+    quantity = int(request.json.get('quantity', 1))
+    
+    product = catalog.get(product_id)
+    
+    if not product:
+        return jsonify({'success': False, 'error': 'Product not found'})
+    
+    client = shopper_pricing(session['client_id'])
+    if client is None:
+        return jsonify({'success': False, 'error': 'Client not found'})
+    cart = carts.get()
+    
+    # Add to the line already in the cart, if any
+    existing_item = next((item for item in cart if item['product_id'] == product_id), None)
+    if existing_item:
+        existing_item['quantity'] += quantity
+    else:
+        cart.append({
+            'product_id': product_id,
+            'name': product.product_id,
+            'quantity': quantity,
+            'points': product.points,
+            'category': product.category
+        })
+    
+    # Validate the whole cart at once; the new quantity must not exceed available stock
+    summary = carts.evaluate(cart, client)
+    shortfall = next((s for s in summary.shortfalls if s.product_id == product_id), None)
+    if shortfall:
+        if existing_item:
+            return jsonify({
+                'success': False,
+                'error': f'Cannot add {quantity} more. Only {shortfall.available} units available total, and you already have {shortfall.requested - quantity} in your cart.'
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'error': f'Cannot add {quantity} units. Only {shortfall.available} units available.'
+            })
+    
+    try:
+        carts.save(summary.lines)
+    except carts.CartConflict:
+        return jsonify({'success': False, 'error': 'Your cart was changed elsewhere, please try again'})
+    conflicting_allergens = summary.conflicts.get(product_id)
+    
+    # Return warning if allergens conflict
+    if conflicting_allergens:
+        return jsonify({
+            'success': True,
+            'warning': True,
+            'allergens': conflicting_allergens,
+            'message': f"Warning: This product contains {', '.join(conflicting_allergens)} which you marked as an allergen."
+        })
+    
+    return jsonify({'success': True})
+
+
+@bp.route('/shop/remove-from-cart', methods=['POST'])
+def remove_from_cart():
+    """Remove item from cart"""
+    if 'client_id' not in session:
+        return jsonify({'success': False})
+    
+    product_id = request.json.get('product_id')
+    cart = carts.get()
+    cart = [item for item in cart if item['product_id'] != product_id]
+    try:
+        carts.save(cart)
+    except carts.CartConflict:
+        return jsonify({'success': False, 'error': 'Your cart was changed elsewhere, please try again'})
+    
+    return jsonify({'success': True})
+
+
+@bp.route('/cart/apply', methods=['POST'])
+def apply_cart_changes():
+    """Apply a batch of add/remove/set changes to the shop or kiosk cart, all or nothing
+    
+    Body: {"cart": "shop" or "kiosk", "operations": [...]} (see carts.apply).
+    The changes are checked together against the client's allergens and the
+    stock, and saved in one transaction; the response carries the new cart.
+    """
+    payload = request.get_json(silent=True) or {}
+    kind = payload.get('cart', carts.SHOP)
+    if kind not in carts.SESSION_KEYS:
+        return jsonify({'success': False, 'error': 'Unknown cart'}), 400
+    client_key = carts.SESSION_KEYS[kind][2]
+    if client_key not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    operations = payload.get('operations')
+    if not isinstance(operations, list):
+        return jsonify({'success': False, 'error': 'Expected a list of operations'}), 400
+    
+    client = shopper_pricing(session[client_key])
+    if client is None:
+        return jsonify({'success': False, 'error': 'Client not found'})
+    before = carts.get(kind)
+    lines, errors = carts.apply(before, operations)
+    if errors:
+        return jsonify({'success': False, 'error': errors[0]['error'], 'errors': errors,
+                        'cart': cart_state(carts.evaluate(before, client, stock=False))}), 400
+    
+    # Only lines this batch grew must be in stock; shoppers can always take things out
+    summary = carts.evaluate(lines, client)
+    held = {line['product_id']: line['quantity'] for line in before}
+    grown = {line['product_id'] for line in summary.lines if line['quantity'] > held.get(line['product_id'], 0)}
+    shortfalls = [s for s in summary.shortfalls if s.product_id in grown]
+    if shortfalls:
+        return jsonify({
+            'success': False,
+            'error': '; '.join(f'Only {s.available} units of {s.product_id} available' for s in shortfalls),
+            'shortages': [{'product_id': s.product_id, 'requested': s.requested, 'available': s.available}
+                          for s in shortfalls],
+            'cart': cart_state(carts.evaluate(before, client, stock=False))
+        }), 409
+    
+    if summary.lines != before:
+        try:
+            carts.save(summary.lines, kind)
+        except carts.CartConflict:
+            # Another batch was saved since this one read the cart: send the cart as it is now to apply again
+            return jsonify({'success': False, 'conflict': True, 'error': 'Your cart was changed elsewhere',
+                            'cart': cart_state(carts.evaluate(carts.get(kind), client, stock=False))}), 409
+    warnings = [{
+        'product_id': product_id,
+        'allergens': allergens,
+        'message': f"Warning: {product_id} contains {', '.join(allergens)} which you marked as an allergen."
+    } for product_id, allergens in summary.conflicts.items() if product_id in grown]
+    
+    return jsonify({'success': True, 'cart': cart_state(summary), 'warnings': warnings})
+
+
+def cart_state(summary):
+    """JSON for a carts.evaluate summary"""
+    return {
+        'lines': summary.lines,
+        'points_used': summary.points_used,
+        'points_remaining': summary.points_remaining,
+        'myplate': summary.myplate,
+        'shortages': [{'product_id': s.product_id, 'requested': s.requested, 'available': s.available}
+                      for s in summary.shortfalls],
+    }
+
+
+@bp.route('/shop/checkout', methods=['GET', 'POST'])
+def shop_checkout():
+    """Checkout and select fulfillment method"""
+    if 'client_id' not in session:
+        return redirect('/shop')
+    
+    client_id = session['client_id']
+    db_client = DBClient.query.filter_by(client_id=client_id).first()
+    client = ClientProxy(db_client)
+    
+    cart = carts.get()
+    if not cart:
+        flash('Your cart is empty')
+        return redirect('/shop/categories')
+    
+    # Reprice and recheck the whole cart: stock may have run out or points changed since it was filled
+    summary = carts.evaluate(cart, client)
+    cart = summary.lines
+    
+    if request.method == 'POST':
+        if summary.shortfalls:
+            return short_cart_response(client, summary, summary.shortfalls)
+        if summary.points_remaining < 0:
+            return render_checkout(client, summary), 409
+        
+        fulfillment_method = request.form.get('fulfillment_method')
+        pickup_time = request.form.get('pickup_time')
+        pickup_date = request.form.get('pickup_date')
+        pickup_time_only = request.form.get('pickup_time_only')
+        satellite_location = request.form.get('satellite_location', '')
+        note_to_staff = request.form.get('note_to_staff', '')
+        delivery_address = request.form.get('delivery_address', '')
+        delivery_notes = request.form.get('delivery_notes', '')
+        
+        # Validate pickup time is at least 3 hours from now
+        if pickup_date and pickup_time_only:
+            try:
+                selected_datetime = datetime.strptime(f"{pickup_date} {pickup_time_only}", "%Y-%m-%d %H:%M")
+                min_datetime = datetime.now() + timedelta(hours=3)
+                
+                if selected_datetime < min_datetime:
+                    flash('Please select a pickup time at least 3 hours from now to allow us time to prepare your order.')
+                    return redirect('/shop/checkout')
+            except ValueError:
+                pass  # If parsing fails, continue without validation
+        
+        try:
+            # Create order (ids first: nothing may be flushed while a block is reserved)
+            order_id = Counter.get_next_id('orders')
+            movement_ids = Counter.get_next_ids('movements', len(cart))
+            total_points = summary.points_used
+            
+            # Generate invoice number
+            invoice_number = f"INV-{datetime.now().strftime('%Y%m%d')}-{order_id:05d}"
+            
+            # Use client's delivery address if home delivery and no custom address provided
+            if fulfillment_method == 'Delivery':
+                if not delivery_address.strip() and client.delivery_address:
+                    delivery_address = client.delivery_address
+                elif not delivery_address.strip() and client.address:
+                    delivery_address = client.address
+            
+            order = DBOrder(
+                order_id=order_id,
+                invoice_number=invoice_number,
+                client_id=client_id,
+                total_points=total_points,
+                fulfillment_method=fulfillment_method,
+                satellite_location=satellite_location if fulfillment_method == 'Satellite' else None,
+                delivery_address=delivery_address if fulfillment_method == 'Delivery' else None,
+                delivery_status='Pending' if fulfillment_method == 'Delivery' else None,
+                delivery_notes=delivery_notes if fulfillment_method == 'Delivery' and delivery_notes.strip() else None,
+                note_to_staff=note_to_staff if note_to_staff.strip() else None,
+                pickup_time=pickup_time
+            )
+            order.set_items(cart)
+            db.session.add(order)
+            
+            # Update inventory - reserve items. The flush only takes each line
+            # if the pantry still holds it, in the same transaction as the order
+            for item, movement_id in zip(cart, movement_ids):
+                new_movement = DBMovement(
+                    movement_id=movement_id,
+                    product_id=item['product_id'],
+                    qty=item['quantity'],
+                    price=0,
+                    from_location='Pantry',
+                    to_location='Reserved'
+                )
+                new_movement.require_stock = True
+                db.session.add(new_movement)
+            
+            db.session.commit()
+            
+            # Clear cart
+            carts.discard()
+            
+            flash(f'Order #{order.order_id} placed successfully!')
+            return redirect('/shop/order-confirmation/' + str(order.order_id))
+        
+        except InsufficientStock as e:
+            db.session.rollback()
+            return short_cart_response(client, summary, e.shortages)
+        
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error creating order: {e}")
+            flash(f'Error placing order: {str(e)}')
+            return redirect('/shop/checkout')
+    
+    return render_checkout(client, summary)
+
+
+def render_checkout(client, summary, shortages=None):
+    """The checkout page for a carts.evaluate summary"""
+    return render_template('shop_checkout.html', client=client, cart=summary.lines,
+                           points_used=summary.points_used, points_remaining=summary.points_remaining,
+                           conflicts=summary.conflicts,
+                           shortages=shortage_map(summary) if shortages is None else shortages)
+
+
+def short_cart_response(client, summary, shortages):
+    """409 listing each line the pantry cannot fill, as JSON or as the checkout page"""
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({
+            'success': False,
+            'error': 'Some items are no longer available in the quantity in your cart',
+            'shortages': [{'product_id': s.product_id, 'requested': s.requested, 'available': s.available}
+                          for s in shortages]
+        }), 409
+    return render_checkout(client, summary, {s.product_id: s.available for s in shortages}), 409
+
+
+@bp.route('/shop/search', methods=['GET'])
+@storage.read_only
+def shop_search():
+    """Search for products across all categories"""
+    if 'client_id' not in session:
+        return redirect('/shop')
+    
+    client_id = session['client_id']
+    db_client = DBClient.query.filter_by(client_id=client_id).first()
+    client = ClientProxy(db_client)
+    
+    query = request.args.get('q', '').strip().lower()
+    
+    if not query:
+        return redirect('/shop/categories')
+    
+    cart = carts.get()
+    etag = conditional.etag_for('search', query, catalog.version(), inventory.stock_version(),
+                                client.points_per_visit, cart)
+    unchanged = conditional.not_modified(etag)
+    if unchanged:
+        return unchanged
+    
+    def results_context():
+        # Full-text search over name, description and category, most relevant first,
+        # with the stock check in the same query (see search.py)
+        matches = search.search_products(query)
+        records = catalog.get_many(product_id for product_id, available in matches)
+        
+        search_results = []
+        for product_id, available in matches:
+            if product_id in records:
+                product = ProductProxy.from_catalog(records[product_id])
+                product.available_qty = available
+                search_results.append(product)
+        return {'query': query, 'products': search_results}
+    
+    product_grid = render_fragment('shop_search_grid.html', (query,), results_context)
+    summary = carts.evaluate(cart, client, stock=False)
+    
+    return conditional.with_validators(
+        render_template('shop_search.html', query=query, product_grid=product_grid,
+                        client=client, cart=summary.lines, points_remaining=summary.points_remaining),
+        etag
+    )
+
+
+@bp.route('/shop/suggest', methods=['GET'])
+@storage.read_only
+def shop_suggest():
+    """Type-ahead suggestions for the search box, from the in-memory prefix index"""
+    if 'client_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    
+    query = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', suggest.DEFAULT_LIMIT, type=int), 1), 20)
+    products, terms = suggest.suggest(query, limit)
+    
+    return jsonify({
+        'success': True,
+        'query': query,
+        'products': [{
+            'product_id': record.product_id,
+            'category': record.category,
+            'points': record.points,
+            'image_url': record.image_url,
+            'available_qty': available,
+        } for record, available in products],
+        'terms': terms,
+    })
+
+
+def swap_alternatives(alternatives):
+    """JSON for healthier-swap results: [(catalog record, available qty)]"""
+    return [{
+        'product_id': alt.product_id,
+        'description': alt.description,
+        'nutrition_score': alt.nutrition_score,
+        'points': alt.points,
+        'dietary_indicators': list(alt.dietary_indicators),
+        'image_url': images.local_image(alt.image_url or images.PLACEHOLDER_URL),
+        'available_qty': available
+    } for alt, available in alternatives]
+
+
+def shopper_pricing(client_id):
+    """Just what carts.evaluate needs of a client (points_per_visit, allergen_mask), or None"""
+    return DBClient.query.with_entities(DBClient.points_per_visit, DBClient.allergen_mask) \
+        .filter_by(client_id=client_id).first()
+
+
+def shortage_map(summary):
+    """{product_id: available} for the lines of a carts.evaluate summary the pantry cannot fill"""
+    return {s.product_id: s.available for s in summary.shortfalls}
+
+
+def client_allergen_mask(client_id):
+    """The logged-in client's allergens as a dietary.py mask"""
+    return DBClient.query.with_entities(DBClient.allergen_mask).filter_by(client_id=client_id).scalar() or 0
+
+
+@bp.route('/shop/healthier-swap/<product_id>', methods=['GET'])
+@storage.read_only
+def get_healthier_swap(product_id):
+    """Get healthier alternatives for a product, leaving out the client's allergens"""
+    if 'client_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    
+    avoid = client_allergen_mask(session['client_id'])
+    etag = conditional.etag_for('swap', product_id, avoid, catalog.version(), inventory.stock_version())
+    unchanged = conditional.not_modified(etag)
+    if unchanged:
+        return unchanged
+    
+    alternatives = swaps.healthier(product_id, avoid=avoid)
+    if alternatives is None:
+        return jsonify({'success': False, 'error': 'Product not found'})
+    
+    return conditional.with_validators(jsonify({
+        'success': True,
+        'current_score': catalog.get(product_id).nutrition_score,
+        'alternatives': swap_alternatives(alternatives)
+    }), etag)
+
+
+@bp.route('/shop/healthier-swaps', methods=['GET'])
+@storage.read_only
+def get_healthier_swaps():
+    """Healthier alternatives for every line in the cart, in one round trip"""
+    if 'client_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    
+    cart_ids = [item['product_id'] for item in carts.get()]
+    avoid = client_allergen_mask(session['client_id'])
+    etag = conditional.etag_for('swaps', cart_ids, avoid, catalog.version(), inventory.stock_version())
+    unchanged = conditional.not_modified(etag)
+    if unchanged:
+        return unchanged
+    
+    found = swaps.healthier_many(cart_ids, avoid=avoid, exclude=cart_ids)
+    
+    return conditional.with_validators(jsonify({
+        'success': True,
+        'swaps': {
+            product_id: {
+                'current_score': catalog.get(product_id).nutrition_score,
+                'alternatives': swap_alternatives(alternatives)
+            } for product_id, alternatives in found.items()
+        }
+    }), etag)
+
+
+@bp.route('/shop/order-confirmation/<int:order_id>')
+@storage.read_only
+def order_confirmation(order_id):
+    """Order confirmation page"""
+    if 'client_id' not in session:
+        return redirect('/shop')
+    
+    db_order = DBOrder.query.filter_by(order_id=order_id).first()
+    
+    if not db_order:
+        flash('Order not found')
+        return redirect('/shop/categories')
+    
+    order = OrderProxy(db_order)
+    return render_template('order_confirmation.html', order=order)
+
+
+@bp.route('/shop/logout')
+def client_logout():
+    """Logout client"""
+    session.pop('client_id', None)
+    session.pop('client_name', None)
+    session.pop('client_language', None)
+    carts.discard()
+    return redirect('/shop')
+
+
+@bp.route('/shop/message-staff', methods=['POST'])
+def message_staff():
+    """Send a message to staff"""
+    if 'client_id' not in session:
+        return jsonify({'success': False, 'error': 'Not logged in'})
+    
+    message_text = request.json.get('message', '').strip()
+    
+    # Validate message
+    if not message_text:
+        return jsonify({'success': False, 'error': 'Message cannot be empty'})
+    
+    # Limit message length to 2000 characters
+    MAX_MESSAGE_LENGTH = 2000
+    if len(message_text) > MAX_MESSAGE_LENGTH:
+        return jsonify({'success': False, 'error': f'Message is too long. Maximum {MAX_MESSAGE_LENGTH} characters allowed.'})
+    
+    message_id = Counter.get_next_id('messages')
+    new_message = StaffMessage(
+        message_id=message_id,
+        client_id=session['client_id'],
+        message=message_text
+    )
+    
+    try:
+        db.session.add(new_message)
+        db.session.commit()
+        return jsonify({'success': True, 'message': 'Message sent to staff!'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Failed to send message. Please try again.'})
+
+
+@bp.route('/staff-messages/', methods=['GET'])
+def view_staff_messages():
+    """View all client messages (staff only)"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    messages = StaffMessage.query.order_by(StaffMessage.created_at.desc()).all()
+    
+    # Get full client info
+    clients = {c.client_id: c for c in DBClient.query.all()}
+    
+    return render_template('staff_messages.html', messages=messages, clients=clients)
+
+
+@bp.route('/carts/', methods=['GET'])
+@storage.read_only
+def view_carts():
+    """Carts clients are filling right now, online and at the kiosk (staff only)"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    return render_template('carts.html', carts=carts.in_progress())
+
+
+@bp.route('/staff-messages/<int:message_id>/mark-read', methods=['POST'])
+def mark_message_read(message_id):
+    """Mark a message as read"""
+    if 'user_id' not in session:
+        return jsonify({'success': False})
+    
+    message = StaffMessage.query.filter_by(message_id=message_id).first()
+    if message:
+        message.is_read = True
+        db.session.commit()
+        return jsonify({'success': True})
+    
+    return jsonify({'success': False})
+
+
+@bp.route('/home', methods=["POST", "GET"])
+def index():
+    """Staff dashboard"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    products = [ProductProxy.from_catalog(p) for p in catalog.all_products()]
+    
+    db_locations = DBLocation.query.all()
+    locations = [LocationProxy(l) for l in db_locations]
+    
+    db_clients = DBClient.query.all()
+    clients = [ClientProxy(c) for c in db_clients]
+    
+    db_orders = DBOrder.query.order_by(DBOrder.created_at.desc()).limit(10).all()
+    recent_orders = [OrderProxy(o) for o in db_orders]
+    
+    # Get pending orders count
+    pending_orders = DBOrder.query.filter_by(status='Pending').count()
+    
+    # Get unread messages count
+    unread_messages = StaffMessage.query.filter_by(is_read=False).count()
+    
+    return render_template("index.html", products=products, locations=locations,
+                         clients=clients, recent_orders=recent_orders, 
+                         pending_orders=pending_orders, unread_messages=unread_messages)
+
+
+@bp.route('/support')
+def support():
+    """Support and contact information"""
+    if 'user_id' not in session:
+        return redirect('/')
+    return render_template('support.html')
+
+
+@bp.route('/clients/', methods=["POST", "GET"])
+def view_clients():
+    """View and manage clients"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    if request.method == "POST":
+        name = request.form["client_name"]
+        email = request.form.get("client_email", "")
+        phone = request.form.get("client_phone", "")
+        household_size = int(request.form.get("household_size", 1))
+        language = request.form.get("language", "English")
+        
+        # Generate client ID
+        counter = Counter.get_next_id('clients')
+        client_id = f"C{counter:05d}"
+        
+        new_client = DBClient(
+            client_id=client_id,
+            name=name,
+            email=email,
+            phone=phone,
+            household_size=household_size,
+            language=language
+        )
+        
+        try:
+            db.session.add(new_client)
+            db.session.commit()
+            flash(f'Client {name} added successfully! Client ID: {client_id}')
+            return redirect("/clients/")
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error adding client: {e}")
+    
+    # Rows are paged in from /grid/clients
+    return render_template("clients.html")
+
+
+@bp.route('/clients/bulk-upload', methods=['POST'])
+def bulk_upload_clients():
+    """Bulk upload clients from CSV file"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    if 'csv_file' not in request.files:
+        flash('No file uploaded')
+        return redirect('/clients/')
+    
+    file = request.files['csv_file']
+    if file.filename == '':
+        flash('No file selected')
+        return redirect('/clients/')
+    
+    if not file.filename.endswith('.csv'):
+        flash('Please upload a CSV file')
+        return redirect('/clients/')
+    
+    import csv
+    import io
+    
+    try:
+        # Read CSV content
+        stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
+        reader = csv.DictReader(stream)
+        
+        # Normalize column names (lowercase, strip whitespace)
+        reader.fieldnames = [name.lower().strip() for name in reader.fieldnames]
+        rows = list(reader)
+        
+        # Reserve generated ids up front: the duplicate check below flushes
+        # pending clients, and a block refill must not wait on that write
+        new_ids = iter(Counter.get_next_ids(
+            'clients', sum(1 for row in rows if row.get('name', '').strip() and not row.get('client_id', '').strip())
+        ))
+        
+        added = 0
+        skipped = 0
+        errors = []
+        
+        for row in rows:
+            # Get values with flexible column names
+            client_id = row.get('client_id', '').strip()
+            name = row.get('name', '').strip()
+            email = row.get('email', '').strip()
+            phone = row.get('phone', '').strip()
+            household_size = row.get('household_size', '1').strip()
+            language = row.get('language', 'English').strip()
+            points_per_visit = row.get('points_per_visit', '100').strip()
+            
+            # Name is required
+            if not name:
+                errors.append(f"Row skipped: missing name")
+                skipped += 1
+                continue
+            
+            # Generate client_id if not provided
+            if not client_id:
+                counter = next(new_ids)
+                client_id = f"C{counter:05d}"
+            
+            # Check for duplicate client_id
+            existing = DBClient.query.filter_by(client_id=client_id).first()
+            if existing:
+                errors.append(f"Skipped duplicate ID: {client_id}")
+                skipped += 1
+                continue
+            
+            # Create new client
+            try:
+                new_client = DBClient(
+                    client_id=client_id,
+                    name=name,
+                    email=email,
+                    phone=phone,
+                    household_size=int(household_size) if household_size else 1,
+                    language=language if language else 'English',
+                    points_per_visit=int(points_per_visit) if points_per_visit else 100
+                )
+                db.session.add(new_client)
+                added += 1
+            except Exception as e:
+                errors.append(f"Error with {name}: {str(e)}")
+                skipped += 1
+        
+        db.session.commit()
+        
+        message = f"Import complete: {added} clients added, {skipped} skipped."
+        if errors and len(errors) <= 5:
+            message += " " + "; ".join(errors)
+        elif errors:
+            message += f" First 5 errors: " + "; ".join(errors[:5])
+        
+        flash(message)
+        
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error processing CSV: {str(e)}")
+    
+    return redirect('/clients/')
+
+
+@bp.route('/clients/download-template')
+def download_client_template():
+    """Download CSV template for bulk client upload"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    import io
+    import csv
+    from flask import Response
+    
+    output = io.StringIO()
+    writer = csv.writer(output)
+    
+    # Header row
+    writer.writerow(['client_id', 'name', 'email', 'phone', 'household_size', 'language', 'points_per_visit'])
+    
+    # Example rows
+    writer.writerow(['', 'Jane Doe', 'jane@email.com', '555-123-4567', '3', 'English', '100'])
+    writer.writerow(['C99999', 'John Smith', 'john@email.com', '555-987-6543', '2', 'Spanish', '150'])
+    writer.writerow(['', 'Maria Garcia', '', '555-456-7890', '4', 'Spanish', '100'])
+    
+    output.seek(0)
+    return Response(
+        output.getvalue(),
+        mimetype='text/csv',
+        headers={'Content-Disposition': 'attachment; filename=client_import_template.csv'}
+    )
+
+
+@bp.route('/clients/<client_id>', methods=["GET", "POST"])
+def view_client_detail(client_id):
+    """View and edit client details"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    db_client = DBClient.query.filter_by(client_id=client_id).first()
+    
+    if not db_client:
+        flash('Client not found')
+        return redirect('/clients/')
+    
+    if request.method == "POST":
+        db_client.name = request.form["client_name"]
+        db_client.email = request.form.get("client_email", "")
+        db_client.phone = request.form.get("client_phone", "")
+        db_client.household_size = int(request.form.get("household_size", 1))
+        db_client.language = request.form.get("language", "English")
+        db_client.points_per_visit = int(request.form.get("points_per_visit", 100))
+        
+        # Allergens and dietary preferences
+        allergens = request.form.getlist("allergens")
+        dietary_prefs = request.form.getlist("dietary_prefs")
+        db_client.set_allergens(allergens)
+        db_client.set_dietary_prefs(dietary_prefs)
+        
+        # Medical & Nutrition fields
+        db_client.medical_conditions = request.form.get("medical_conditions", "")
+        db_client.special_instructions = request.form.get("special_instructions", "")
+        
+        # Delivery fields
+        db_client.delivery_address = request.form.get("delivery_address", "")
+        db_client.delivery_notes = request.form.get("delivery_notes", "")
+        
+        db.session.commit()
+        flash('Client updated successfully')
+        return redirect('/clients/')
+    
+    client = ClientProxy(db_client)
+    
+    # Get client's order history
+    db_orders = DBOrder.query.filter_by(client_id=client_id).order_by(DBOrder.created_at.desc()).all()
+    client_orders = [OrderProxy(o) for o in db_orders]
+    
+    return render_template("client_detail.html", client=client, orders=client_orders)
+
+
+@bp.route('/clients/<client_id>/delete', methods=["POST"])
+def delete_client(client_id):
+    """Delete a client"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    db_client = DBClient.query.filter_by(client_id=client_id).first()
+    
+    if not db_client:
+        flash('Client not found')
+        return redirect('/clients/')
+    
+    try:
+        # Delete associated orders first
+        DBOrder.query.filter_by(client_id=client_id).delete()
+        # Delete associated messages
+        StaffMessage.query.filter_by(client_id=client_id).delete()
+        # Delete the client
+        db.session.delete(db_client)
+        db.session.commit()
+        flash(f'Client {db_client.name} deleted successfully')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error deleting client: {e}')
+    
+    return redirect('/clients/')
+
+
+@bp.route('/orders/', methods=["GET"])
+def view_orders():
+    """View all orders"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    # Rows are paged in from /grid/orders
+    return render_template("orders.html")
+
+
+@bp.route('/orders/<int:order_id>/update-status', methods=["POST"])
+def update_order_status(order_id):
+    """Update order status"""
+    if 'user_id' not in session:
+        return jsonify({'success': False})
+    
+    new_status = request.json.get('status')
+    order = DBOrder.query.filter_by(order_id=order_id).first()
+    
+    if order:
+        order.status = new_status
+        if new_status == 'Completed':
+            order.completed_at = datetime.now(pytz.timezone('America/New_York'))
+            
+            # Move items from Reserved to Customer
+            items = order.get_items()
+            for item, movement_id in zip(items, Counter.get_next_ids('movements', len(items))):
+                new_movement = DBMovement(
+                    movement_id=movement_id,
+                    product_id=item['product_id'],
+                    qty=item['quantity'],
+                    price=0,
+                    from_location='Reserved',
+                    to_location='Customer'
+                )
+                db.session.add(new_movement)
+        
+        db.session.commit()
+        return jsonify({'success': True})
+    
+    return jsonify({'success': False})
+
+
+@bp.route('/orders/<int:order_id>/print')
+@storage.read_only
+def print_order(order_id):
+    """Print order for workers"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    db_order = DBOrder.query.filter_by(order_id=order_id).first()
+    
+    if not db_order:
+        flash('Order not found')
+        return redirect('/orders/')
+    
+    order = OrderProxy(db_order)
+    
+    # Get client info
+    db_client = DBClient.query.filter_by(client_id=order.client_id).first()
+    client = ClientProxy(db_client) if db_client else None
+    
+    # Get current time for print timestamp
+    now = datetime.now(pytz.timezone('America/New_York'))
+    
+    return render_template('print_order.html', order=order, client=client, now=now)
+
+
+@bp.route('/orders/<int:order_id>/invoice')
+@storage.read_only
+def view_invoice(order_id):
+    """View/print invoice for order"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    db_order = DBOrder.query.filter_by(order_id=order_id).first()
+    
+    if not db_order:
+        flash('Order not found')
+        return redirect('/orders/')
+    
+    order = OrderProxy(db_order)
+    
+    # Get client info
+    db_client = DBClient.query.filter_by(client_id=order.client_id).first()
+    client = ClientProxy(db_client) if db_client else None
+    
+    # Get current time for invoice timestamp
+    now = datetime.now(pytz.timezone('America/New_York'))
+    
+    return render_template('invoice.html', order=order, client=client, now=now)
+
+
+@bp.route('/deliveries/', methods=["GET"])
+@storage.read_only
+def view_deliveries():
+    """View all delivery orders"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    # Get all orders with delivery fulfillment method
+    db_orders = DBOrder.query.filter_by(fulfillment_method='Delivery').order_by(DBOrder.created_at.desc()).all()
+    orders = [OrderProxy(o) for o in db_orders]
+    
+    # Create client lookup
+    client_lookup = {}
+    for order in orders:
+        if order.client_id not in client_lookup:
+            db_client = DBClient.query.filter_by(client_id=order.client_id).first()
+            if db_client:
+                client_lookup[order.client_id] = ClientProxy(db_client)
+    
+    return render_template("deliveries.html", orders=orders, client_lookup=client_lookup)
+
+
+@bp.route('/deliveries/<int:order_id>/update-status', methods=["POST"])
+def update_delivery_status(order_id):
+    """Update delivery status"""
+    if 'user_id' not in session:
+        return jsonify({'success': False})
+    
+    new_status = request.json.get('status')
+    order = DBOrder.query.filter_by(order_id=order_id).first()
+    
+    if order:
+        order.delivery_status = new_status
+        db.session.commit()
+        return jsonify({'success': True})
+    
+    return jsonify({'success': False})
+
+
+@bp.route('/deliveries/<int:order_id>/update-driver', methods=["POST"])
+def update_delivery_driver(order_id):
+    """Update delivery driver"""
+    if 'user_id' not in session:
+        return jsonify({'success': False})
+    
+    driver_name = request.json.get('driver')
+    order = DBOrder.query.filter_by(order_id=order_id).first()
+    
+    if order:
+        order.delivery_driver = driver_name
+        db.session.commit()
+        return jsonify({'success': True})
+    
+    return jsonify({'success': False})
+
+
+@bp.route('/locations/', methods=["POST", "GET"])
+def viewLocation():
+    if (request.method == "POST") and ('location_name' in request.form):
+        location_name = request.form["location_name"]
+        new_location = DBLocation(location_id=location_name)
+
+        try:
+            db.session.add(new_location)
+            db.session.commit()
+            return redirect("/locations/")
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error adding location: {e}")
+    
+    # Rows are paged in from /grid/locations
+    return render_template("locations.html")
+
+
+@bp.route('/products/', methods=["POST", "GET"])
+def viewProduct():
+    """View and manage products"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    if (request.method == "POST") and ('product_name' in request.form):
+        product_name = request.form["product_name"]
+        product_price = request.form.get("product_price", 0)
+        purchase_price = request.form.get("purchase_price", 0)
+        category = request.form.get("category", "Other")
+        description = request.form.get("description", "")
+        upc = request.form.get("upc", "")
+        servings = int(request.form.get("servings", 1))
+        points = int(request.form.get("points", 1))
+        nutrition_score = int(request.form.get("nutrition_score", 50))
+        image_url = request.form.get("image_url", "")
+        
+        # Handle file upload
+        if 'product_image' in request.files:
+            file = request.files['product_image']
+            if file and file.filename and allowed_file(file.filename):
+                # Stored once per content; resized copies are made off the request
+                image_url = images.store_upload(file, current_app.config['UPLOAD_FOLDER'],
+                                                current_app._get_current_object())
+
+        # Handle dietary indicators
+        dietary_indicators = []
+        if request.form.get("vegan"): dietary_indicators.append("Vegan")
+        if request.form.get("vegetarian"): dietary_indicators.append("Vegetarian")
+        if request.form.get("gluten_free"): dietary_indicators.append("Gluten-Free")
+        if request.form.get("low_sodium"): dietary_indicators.append("Low Sodium")
+        if request.form.get("sugar_free"): dietary_indicators.append("Sugar-Free")
+        if request.form.get("dairy_free"): dietary_indicators.append("Dairy-Free")
+        
+        # Handle allergens
+        allergens = []
+        if request.form.get("milk"): allergens.append("milk")
+        if request.form.get("eggs"): allergens.append("eggs")
+        if request.form.get("fish"): allergens.append("fish")
+        if request.form.get("shellfish"): allergens.append("shellfish")
+        if request.form.get("tree_nuts"): allergens.append("tree nuts")
+        if request.form.get("peanuts"): allergens.append("peanuts")
+        if request.form.get("gluten"): allergens.append("gluten")
+        if request.form.get("soybeans"): allergens.append("soybeans")
+        
+        new_product = DBProduct(
+            product_id=product_name,
+            price=product_price,
+            purchase_price=purchase_price,
+            category=category,
+            description=description,
+            upc=upc,
+            servings=servings,
+            points=points,
+            nutrition_score=nutrition_score,
+            image_url=image_url
+        )
+        new_product.set_dietary_indicators(dietary_indicators)
+        new_product.set_allergens(allergens)
+
+        try:
+            db.session.add(new_product)
+            db.session.commit()
+            images.mirror_later([image_url], current_app._get_current_object())  # Remote image: keep a local copy
+            flash('Product added successfully')
+            return redirect("/products/")
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error adding product: {e}")
+    
+    # Rows are paged in from /grid/products
+    return render_template("products.html")
+
+
+@bp.route("/update-product/<path:name>", methods=["POST", "GET"])
+def updateProduct(name):
+    """Update product details"""
+    if 'user_id' not in session:
+        return redirect('/')
+    
+    # URL decode the name in case it has special characters
+    from urllib.parse import unquote
+    name = unquote(name)
+    
+    product = DBProduct.query.filter_by(product_id=name).first()
+
+    if not product:
+        flash(f"Product '{name}' not found")
+        return redirect("/products/")
+
+    old_product_id = product.product_id
+    if request.method == "POST":
+        new_product_id = request.form['product_name']
+        new_price = request.form.get('product_price', 0)
+        new_purchase_price = request.form.get('purchase_price', 0)
+        category = request.form.get("category", "Other")
+        description = request.form.get("description", "")
+        upc = request.form.get("upc", "")
+        servings = int(request.form.get("servings", 1))
+        points = int(request.form.get("points", 1))
+        nutrition_score = int(request.form.get("nutrition_score", 50))
+        image_url = request.form.get("image_url", "")
+        
+        # Handle file upload
+        if 'product_image' in request.files:
+            file = request.files['product_image']
+            if file and file.filename and allowed_file(file.filename):
+                # Stored once per content; resized copies are made off the request
+                image_url = images.store_upload(file, current_app.config['UPLOAD_FOLDER'],
+                                                current_app._get_current_object())
+
+        # Handle dietary indicators
+        dietary_indicators = []
+        if request.form.get("vegan"): dietary_indicators.append("Vegan")
+        if request.form.get("vegetarian"): dietary_indicators.append("Vegetarian")
+        if request.form.get("gluten_free"): dietary_indicators.append("Gluten-Free")
+        if request.form.get("low_sodium"): dietary_indicators.append("Low Sodium")
+        if request.form.get("sugar_free"): dietary_indicators.append("Sugar-Free")
+        if request.form.get("dairy_free"): dietary_indicators.append("Dairy-Free")
+        
+        # Handle allergens
+        allergens = []
+        if request.form.get("milk"): allergens.append("milk")
+        if request.form.get("eggs"): allergens.append("eggs")
+        if request.form.get("fish"): allergens.append("fish")
+        if request.form.get("shellfish"): allergens.append("shellfish")
+        if request.form.get("tree_nuts"): allergens.append("tree nuts")
+        if request.form.get("peanuts"): allergens.append("peanuts")
+        if request.form.get("gluten"): allergens.append("gluten")
+        if request.form.get("soybeans"): allergens.append("soybeans")
+        
+        product.product_id = new_product_id
+        product.price = new_price
+        product.purchase_price = new_purchase_price
+        product.category = category
+        product.description = description
+        product.upc = upc
+        product.servings = servings
+        product.points = points
+        product.nutrition_score = nutrition_score
+        product.image_url = image_url
+        product.set_dietary_indicators(dietary_indicators)
+        product.set_allergens(allergens)
+
+        try:
+            # Update product_id in movements if changed
+            if old_product_id != new_product_id:
+                movements = DBMovement.query.filter_by(product_id=old_product_id).all()
+                for mov in movements:
+                    mov.product_id = new_product_id
+            
+            db.session.commit()
+            images.mirror_later([image_url], current_app._get_current_object())  # Remote image: keep a local copy
+            flash('Product updated successfully')
+            return redirect("/products/")
+        except Exception as e:
+            db.session.rollback()
+            flash(f"Error updating product: {e}")
+    
+    product_proxy = ProductProxy(product)
+    return render_template("update-product.html", product=product_proxy)
+
+
+@bp.route("/delete-product/<path:name>")
+def deleteProduct(name):
+    """Deletes a product"""
+    try:
+        # URL decode the name in case it has special characters
+        from urllib.parse import unquote
+        name = unquote(name)
+        
+        product = DBProduct.query.filter_by(product_id=name).first()
+
+        if not product:
+            flash(f"Product '{name}' not found")
+            return redirect("/products/")
+
+        db.session.delete(product)
+        db.session.commit()
+        flash(f"Product '{name}' deleted successfully")
+        return redirect("/products/")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error deleting product: {str(e)}")
+        return redirect("/products/")
+
+
+@bp.route("/update-location/<name>", methods=["POST", "GET"])
+def updateLocation(name):
+    """Updates a location"""
+    try:
+        location = DBLocation.query.filter_by(location_id=name).first()
+
+        if not location:
+            return "Location not found", 404
+
+        old_location = location.location_id
+        if request.method == "POST":
+            new_location_id = request.form['location_name']
+            location.location_id = new_location_id
+
+            try:
+                # Update location_id in movements if changed
+                if old_location != new_location_id:
+                    movements_from = DBMovement.query.filter_by(from_location=old_location).all()
+                    for mov in movements_from:
+                        mov.from_location = new_location_id
+                    
+                    movements_to = DBMovement.query.filter_by(to_location=old_location).all()
+                    for mov in movements_to:
+                        mov.to_location = new_location_id
+                
+                db.session.commit()
+                return redirect("/locations/")
+            except Exception as e:
+                db.session.rollback()
+                return f"There was an issue while updating the Location: {str(e)}"
+        else:
+            location_proxy = LocationProxy(location)
+            return render_template("update-location.html", location=location_proxy)
+    except Exception as e:
+        return f"There was an issue while loading the Location: {str(e)}"
+
+
+@bp.route("/delete-location/<name>")
+def deleteLocation(name):
+    try:
+        location = DBLocation.query.filter_by(location_id=name).first()
+
+        if not location:
+            return "Location not found", 404
+
+        db.session.delete(location)
+        db.session.commit()
+        return redirect("/locations/")
+    except Exception as e:
+        db.session.rollback()
+        return f"There was an issue while deleting the Location: {str(e)}"
+
+
+@bp.route("/movements/", methods=["POST", "GET"])
+def viewMovements():
+    products = [ProductProxy.from_catalog(p) for p in catalog.all_products()]
+    
+    if request.method == "POST":
+        product_id = request.form["productId"]
+        product = catalog.get(product_id)
+        price = product.price if product else 0
+        
+        qty = request.form["qty"]
+        fromLocation = request.form["fromLocation"]
+        toLocation = request.form["toLocation"]
+        
+        movement_id = Counter.get_next_id('movements')
+        new_movement = DBMovement(
+            movement_id=movement_id,
+            product_id=product_id,
+            qty=qty,
+            price=price,
+            from_location=fromLocation if fromLocation else None,
+            to_location=toLocation if toLocation else None
+        )
+        
+        try:
+            db.session.add(new_movement)
+            db.session.commit()
+            return redirect("/movements/")
+        except Exception as e:
+            db.session.rollback()
+            return f"There was an issue while adding a new Movement: {str(e)}"
+    else:
+        # Log rows are paged in from /grid/movements
+        db_locations = DBLocation.query.all()
+        locations = remove_specific_locations([LocationProxy(l) for l in db_locations], ["Customer"])
+        
+        return render_template("movements.html", products=products, locations=locations)
+
+
+@bp.route("/grid/<name>", methods=["GET"])
+@storage.read_only
+def staffGrid(name):
+    """Server-side DataTables endpoint for the staff tables"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    if name not in grid.GRIDS:
+        return jsonify({'error': f"Unknown grid '{name}'"}), 404
+    return jsonify(grid.query_grid(name, request.args))
+
+
+@bp.route("/update-movement/<int:id>", methods=["POST", "GET"])
+def updateMovement(id):
+    try:
+        movement = DBMovement.query.filter_by(movement_id=id).first()
+        if not movement:
+            return "Movement not found", 404
+
+        products = [ProductProxy.from_catalog(p) for p in catalog.all_products()]
+        
+        db_locations = DBLocation.query.all()
+        locations = [LocationProxy(l) for l in db_locations]
+
+        if request.method == "POST":
+            product_id = request.form["productId"]
+            product = DBProduct.query.filter_by(product_id=product_id).first()
+            
+            movement.price = product.price if product else 0
+            movement.product_id = product_id
+            movement.qty = int(request.form["qty"])
+            movement.from_location = request.form["fromLocation"] if request.form["fromLocation"] else None
+            movement.to_location = request.form["toLocation"] if request.form["toLocation"] else None
+
+            try:
+                db.session.commit()
+                return redirect("/movements/")
+            except Exception as e:
+                db.session.rollback()
+                return f"There was an issue while updating the Product Movement: {str(e)}"
+        else:
+            movement_proxy = MovementProxy(movement)
+            return render_template("update-movement.html", movement=movement_proxy, locations=locations, products=products)
+    except Exception as e:
+        return f"There was an issue while loading the data: {str(e)}"
+
+
+@bp.route("/delete-movement/<int:id>")
+def deleteMovement(id):
+    try:
+        movement = DBMovement.query.filter_by(movement_id=id).first()
+
+        if not movement:
+            return "Movement not found", 404
+
+        db.session.delete(movement)
+        db.session.commit()
+        return redirect("/movements/")
+    except Exception as e:
+        db.session.rollback()
+        return f"There was an issue while deleting the Product Movement: {str(e)}"
+
+
+def _balance_report_filters():
+    """Read the product balance report filters from the query string
+
+    Returns (filters, query, errors): invalid values are dropped from the
+    filters and described in errors, for the page to show.
+    """
+    filters = {
+        'as_of': request.args.get('as_of', '').strip(),
+        'location': request.args.get('location', '').strip(),
+        'category': request.args.get('category', '').strip(),
+        'min_qty': request.args.get('min_qty', '').strip(),
+        'max_qty': request.args.get('max_qty', '').strip(),
+    }
+    query = {
+        'location': filters['location'] or None,
+        'category': filters['category'] or None,
+    }
+    errors = []
+    if filters['as_of']:
+        try:
+            query['before'] = inventory.parse_as_of(filters['as_of'])
+        except ValueError:
+            errors.append(f"Invalid date '{filters['as_of']}', showing current inventory")
+            filters['as_of'] = ''
+    for name in ('min_qty', 'max_qty'):
+        if filters[name]:
+            try:
+                query[name] = int(filters[name])
+            except ValueError:
+                errors.append(f"Invalid quantity '{filters[name]}' ignored")
+                filters[name] = ''
+    return filters, query, errors
+
+
+@bp.route("/product-balance/", methods=["POST", "GET"])
+@storage.read_only
+def productBalanceReport():
+    """Shows inventory per product and location, filtered and streamed in chunks
+
+    Supports ?as_of=YYYY-MM-DD for stock at the end of a past day, plus
+    location, category, min_qty and max_qty filters.
+    """
+    filters, query, errors = _balance_report_filters()
+    try:
+        locations = [l.location_id for l in DBLocation.query.order_by(DBLocation.location_id).all()]
+        categories = [c for (c,) in db.session.query(DBProduct.category).distinct().order_by(DBProduct.category)]
+    except Exception as e:
+        return f"There was an issue while loading the data: {str(e)}"
+
+    # Rows are read while the page streams, after the headers are sent
+    return stream_template("product-balance.html", rows=inventory.iter_balance_rows(**query),
+                           filters=filters, errors=errors, locations=locations, categories=categories)
+
+
+@bp.route("/product-balance/csv", methods=["GET"])
+@storage.read_only
+def productBalanceCsv():
+    """Download the product balance report as CSV, with the same filters as the page"""
+    import csv
+    import io
+
+    filters, query, errors = _balance_report_filters()  # Invalid filters are left out of the CSV
+
+    def generate():
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['product', 'category', 'location', 'qty'])
+        for i, row in enumerate(inventory.iter_balance_rows(**query), 1):
+            writer.writerow([row.product_id, row.category or '', row.location_id, row.qty])
+            if i % 500 == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+        yield output.getvalue()
+
+    filename = f"product_balance_{filters['as_of'] or 'current'}.csv"
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+@bp.route("/revenue-report/", methods=["POST", "GET"])
+@storage.read_only
+def revenueReport():
+    movements = DBMovement.query.filter_by(to_location='Customer').all()
+    revenue = 0
+    products_dict = {}
+    
+    for mov in movements:
+        product = catalog.get(mov.product_id)
+        if product:
+            product_proxy = ProductProxy.from_catalog(product)
+            products_dict[product_proxy] = mov.qty
+            revenue += (float(product.price) - float(product.purchase_price)) * int(mov.qty)
+    
+    return render_template("revenue-report.html", revenue_data="{:.2f}".format(revenue), products=products_dict)
+
+
+@bp.route("/movements/get-from-locations", methods=["GET", "POST"])
+@storage.read_only
+def getLocations():
+    product_id = request.values["productId"]
+    etag = conditional.etag_for('from-locations', product_id, inventory.stock_version())
+    last_modified = inventory.stock_last_modified()
+    unchanged = conditional.not_modified(etag, last_modified)
+    if unchanged:
+        return unchanged
+    
+    stock = inventory.get_stock(product_id)
+
+    # Filter out "Customer" and "Remove", and locations with nothing to move
+    filtered_locations = {loc: {"qty": qty} for loc, qty in stock.items()
+                          if qty > 0 and loc not in ["Customer", "Remove"]}
+    return conditional.with_validators(filtered_locations, etag, last_modified)
+
+
+@bp.route("/dup-locations/", methods=["POST", "GET"])
+def getDuplicate():
+    """Checks if there are any duplicate locations"""
+    location = request.form["location"]
+    if len(location) == 0:
+        return {"output": False}
+    
+    existing = DBLocation.query.filter_by(location_id=location).first()
+    return {"output": not bool(existing)}
+
+
+def is_valid_price(price):
+    """Checks if the price is valid"""
+    price_pattern = re.compile(r'^\d+\.\d{2}$')
+    return bool(price_pattern.match(price))
+
+
+@bp.route("/dup-products/", methods=["POST", "GET"])
+def getPDuplicate():
+    """Checks if there are any duplicate product names"""
+    product_name = request.form["product_name"]
+    product_price = request.form["product_price"]
+    purchase_price = request.form["purchase_price"]
+    
+    existing = DBProduct.query.filter_by(product_id=product_name).first()
+    duplicate = bool(existing)
+
+    return {"output": ((not duplicate) and is_valid_price(product_price) and is_valid_price(purchase_price))}
+
+
+@bp.route('/kiosk', methods=['GET'])
+def kiosk_mode():
+    """Kiosk shopping interface"""
+    return render_template('kiosk_login.html')
+
+
+@bp.route('/kiosk/start', methods=['POST'])
+def kiosk_start():
+    """Start kiosk shopping session"""
+    client_id = request.form.get('client_id')
+    client = DBClient.query.filter_by(client_id=client_id).first()
+    
+    if client:
+        carts.discard(carts.KIOSK)  # Nothing left over from the previous shopper
+        session['kiosk_client_id'] = client.client_id
+        session['kiosk_mode'] = True
+        return redirect('/kiosk/categories')
+    else:
+        flash('Client ID not found')
+        return redirect('/kiosk')
+
+
+@bp.route('/kiosk/categories', methods=['GET'])
+def kiosk_categories():
+    """Kiosk category selection screen"""
+    if 'kiosk_client_id' not in session:
+        return redirect('/kiosk')
+    
+    client_id = session['kiosk_client_id']
+    db_client = DBClient.query.filter_by(client_id=client_id).first()
+    client = ClientProxy(db_client)
+    
+    summary = carts.evaluate(carts.get(carts.KIOSK), client)
+    
+    return render_template('kiosk_categories.html', client=client, cart=summary.lines,
+                         points_used=summary.points_used, points_remaining=summary.points_remaining,
+                         myplate_points=summary.myplate, shortages=shortage_map(summary))
+
+
+@bp.route('/kiosk/complete', methods=['POST'])
+def kiosk_complete():
+    """Complete kiosk order"""
+    if 'kiosk_client_id' not in session:
+        return redirect('/kiosk')
+    
+    client_id = session['kiosk_client_id']
+    cart = carts.get(carts.KIOSK)
+    
+    if not cart:
+        flash('Cart is empty')
+        return redirect('/kiosk/categories')
+    
+    client = shopper_pricing(client_id)
+    if client is None:
+        return redirect('/kiosk')
+    summary = carts.evaluate(cart, client)
+    cart = summary.lines
+    if summary.shortfalls:
+        flash('Not enough stock: ' + '; '.join(
+            f'{s.product_id} has {s.available} left (cart has {s.requested})' for s in summary.shortfalls
+        ))
+        return redirect('/kiosk/categories')
+    if summary.points_remaining < 0:
+        flash(f'This order needs {summary.points_used} points, {-summary.points_remaining} more than you have')
+        return redirect('/kiosk/categories')
+    
+    try:
+        # Create order (ids first: nothing may be flushed while a block is reserved)
+        order_id = Counter.get_next_id('orders')
+        movement_ids = Counter.get_next_ids('movements', len(cart))
+        total_points = summary.points_used
+        
+        order = DBOrder(
+            order_id=order_id,
+            client_id=client_id,
+            total_points=total_points,
+            fulfillment_method='In-Person Pickup',
+            status='Completed'
+        )
+        order.set_items(cart)
+        db.session.add(order)
+        
+        # Update inventory, refusing lines the pantry no longer holds
+        for item, movement_id in zip(cart, movement_ids):
+            new_movement = DBMovement(
+                movement_id=movement_id,
+                product_id=item['product_id'],
+                qty=item['quantity'],
+                price=0,
+                from_location='Pantry',
+                to_location='Customer'
+            )
+            new_movement.require_stock = True
+            db.session.add(new_movement)
+        
+        db.session.commit()
+        
+        # Clear session
+        carts.discard(carts.KIOSK)
+        session.pop('kiosk_client_id', None)
+        session.pop('kiosk_mode', None)
+        
+        order_proxy = OrderProxy(order)
+        return render_template('kiosk_complete.html', order=order_proxy)
+    
+    except InsufficientStock as e:
+        db.session.rollback()
+        flash('Not enough stock: ' + '; '.join(
+            f'{s.product_id} has {s.available} left (cart has {s.requested})' for s in e.shortages
+        ))
+        return redirect('/kiosk/categories')
+    
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error completing kiosk order: {e}")
+        flash(f'Error completing order: {str(e)}')
+        return redirect('/kiosk/categories')
+
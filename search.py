@@ -0,0 +1,77 @@
+"""
+Full-text product search for SmartChoice Pantry System
+An SQLite FTS5 index (products_fts) over product name, description and
+category. It is an external-content index: it stores only the search terms
+and reads the text from the products table, and triggers on products keep it
+in sync with every insert, update and delete, whoever makes them. The index
+and triggers are defined in database.py, next to the products table, so
+create_all builds them whether or not this module was imported.
+
+search_products() answers a query in one statement: the FTS match ranked by
+BM25, joined with the stock balances so only products in stock come back.
+"""
+import re
+from sqlalchemy import bindparam, text
+from database import db
+from inventory import AVAILABLE_LOCATIONS
+
+DEFAULT_LIMIT = 100
+WINDOW_FACTOR = 4
+
+# BM25 column weights: a hit in the name counts most, then category, then description
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+CATEGORY_WEIGHT = 2.0
+
+# Rank the matches in the FTS index first, then look up stock only for the
+# best-ranked window rather than for every match
+SEARCH_SQL = text(f"""
+    WITH ranked AS (
+        SELECT rowid, bm25(products_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}, {CATEGORY_WEIGHT}) AS score
+        FROM products_fts
+        WHERE products_fts MATCH :match
+        ORDER BY score
+        LIMIT :window
+    )
+    SELECT products.product_id, (
+        SELECT COALESCE(SUM(stock_balances.qty), 0) FROM stock_balances
+        WHERE stock_balances.product_id = products.product_id AND stock_balances.location_id IN :locations
+    ) AS available
+    FROM ranked
+    JOIN products ON products.id = ranked.rowid
+    ORDER BY ranked.score, products.nutrition_score DESC
+""").bindparams(bindparam('locations', expanding=True))
+
+_TERM = re.compile(r'\w+', re.UNICODE)
+
+
+def match_expression(query):
+    """FTS5 query for what a shopper typed: every word must match, each as a prefix
+
+    'peanut butt' becomes '"peanut"* "butt"*'. Only word characters are kept,
+    so quotes and FTS operators typed by the shopper cannot break the query.
+    Returns None when nothing searchable is left.
+    """
+    terms = _TERM.findall(query.lower())
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_products(query, limit=DEFAULT_LIMIT):
+    """[(product_id, available qty)] for in-stock matches, most relevant first
+
+    Stock is checked for the best limit * WINDOW_FACTOR matches. Only when
+    too few of those are in stock is the query repeated over every match.
+    """
+    match = match_expression(query)
+    if match is None:
+        return []
+    params = {'match': match, 'locations': list(AVAILABLE_LOCATIONS), 'window': limit * WINDOW_FACTOR}
+    rows = db.session.execute(SEARCH_SQL, params).all()
+    in_stock = [(product_id, available) for product_id, available in rows if available > 0]
+    if len(in_stock) < limit and len(rows) == params['window']:
+        params['window'] = -1  # No limit
+        rows = db.session.execute(SEARCH_SQL, params).all()
+        in_stock = [(product_id, available) for product_id, available in rows if available > 0]
+    return in_stock[:limit]
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Production server for SmartChoice Pantry System
+Runs the app under gunicorn with several pre-forked worker processes instead
+of the single-threaded debug server. The master process builds the static
+assets and the app, bootstraps the database and warms the caches once; the
+workers are forked from it and start serving immediately.
+
+Usage:
+  python serve.py [--bind HOST:PORT] [--workers N] [--threads N]
+
+Signals (sent to the master process):
+  HUP   graceful reload: new workers are forked, old ones finish their requests
+  TERM  graceful shutdown
+  TTIN / TTOU  add / remove a worker
+"""
+import argparse
+import os
+import sys
+
+DEFAULT_BIND = '0.0.0.0:8000'
+
+
+def default_workers():
+    """Worker processes for this machine: WEB_CONCURRENCY if set, else 2 per CPU plus one"""
+    if os.environ.get('WEB_CONCURRENCY'):
+        return max(int(os.environ['WEB_CONCURRENCY']), 1)
+    return (os.cpu_count() or 1) * 2 + 1
+
+
+def warm_caches(app):
+    """Do once in the master what every worker would otherwise do on its first request"""
+    import catalog
+    import suggest
+    import swaps
+    from database import db, Location
+
+    # Compile every template; forked workers share the compiled code
+    for name in app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            app.jinja_env.get_template(name)
+
+    # Load the product catalog; workers inherit it and only reload on a new version
+    with app.app_context():
+        catalog.load()
+        suggest.load()
+        swaps.load()
+        Location.query.all()
+        db.session.remove()
+
+
+def post_fork(server, worker):
+    """Give each worker its own database connections
+
+    SQLite connections must never be shared across a fork, so the pools
+    inherited from the master are dropped (without closing the master's).
+    """
+    from database import db
+    with worker.app.wsgi().app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def server_options(bind=DEFAULT_BIND, workers=None, threads=1):
+    """gunicorn settings for the pantry"""
+    return {
+        'bind': bind,
+        'workers': workers or default_workers(),
+        'threads': threads,
+        'worker_class': 'gthread' if threads > 1 else 'sync',
+        'preload_app': True,
+        'graceful_timeout': 30,
+        'timeout': 60,
+        'post_fork': post_fork,
+        'accesslog': '-',
+        'errorlog': '-',
+    }
+
+
+def run(options):
+    from gunicorn.app.base import BaseApplication
+
+    class PantryServer(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    import assets
+    from main import create_app, bootstrap
+    assets.build()  # Before the app is built, so it picks up the new manifest
+    app = create_app()
+    bootstrap(app)
+    warm_caches(app)
+    PantryServer(app, options).run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the pantry app under a multi-process server')
+    parser.add_argument('--bind', default=os.environ.get('BIND', DEFAULT_BIND), help='HOST:PORT to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: 2 per CPU plus one)')
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker')
+    args = parser.parse_args(argv)
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print("gunicorn is not installed: pip install -r requirements.txt")
+        print("For development, 'python main.py' runs the single-process debug server")
+        return 1
+
+    run(server_options(args.bind, args.workers, args.threads))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,11 +7,10 @@ Run this after first launch to populate with example products and a test client
 from flask import Flask
 from werkzeug.security import generate_password_hash
 from database import db, User, Product, Client, Location, Counter
+import storage
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///pantry.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
+storage.init_app(app)
 
 def setup_sample_data():
     with app.app_context():
@@ -0,0 +1,72 @@
+// Batched cart changes for the shop and kiosk pages
+// Taps queue operations; once the taps pause for CART_BATCH_DELAY ms, the
+// queue goes to /cart/apply in one request, which applies it all or nothing.
+var CART_BATCH_DELAY = 300;
+var CART_CONFLICT_RETRIES = 3;
+
+// cart is 'shop' or 'kiosk'. onApplied(data, operations) gets each batch's
+// response: data.cart is the cart afterwards (unchanged if data.success is
+// false) and data.warnings lists allergen warnings for the lines it grew.
+// A batch refused because the cart was saved elsewhere in the meantime
+// (data.conflict) is sent again, ahead of any newer taps.
+function cartBatch(cart, onApplied) {
+  var pending = [];
+  var timer = null;
+  var inFlight = false;
+  var conflicts = 0;
+
+  function flush() {
+    timer = null;
+    if (inFlight || !pending.length) {
+      return;
+    }
+    var operations = pending;
+    pending = [];
+    inFlight = true;
+    fetch('/cart/apply', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json'},
+      body: JSON.stringify({cart: cart, operations: operations})
+    }).then(function(response) {
+      return response.json();
+    }).catch(function() {
+      return {success: false, error: 'Could not reach the pantry. Please try again.'};
+    }).then(function(data) {
+      inFlight = false;
+      if (data.conflict && conflicts < CART_CONFLICT_RETRIES) {
+        conflicts += 1;
+        pending = operations.concat(pending);
+        clearTimeout(timer);
+        flush();
+        return;
+      }
+      conflicts = 0;
+      onApplied(data, operations);
+      // Taps made while this batch was on its way go next, in order
+      if (pending.length && timer === null) {
+        timer = setTimeout(flush, CART_BATCH_DELAY);
+      }
+    });
+  }
+
+  return {
+    queue: function(operation) {
+      pending.push(operation);
+      clearTimeout(timer);
+      timer = setTimeout(flush, CART_BATCH_DELAY);
+    },
+    pending: function() {
+      return pending.length > 0 || inFlight || timer !== null;
+    }
+  };
+}
+
+// How much a batch added to one product, to take it back after a warning
+function cartBatchAdded(operations, productId) {
+  return operations.reduce(function(total, operation) {
+    if (operation.product_id === productId && operation.op === 'add') {
+      return total + (operation.quantity || 1);
+    }
+    return total;
+  }, 0);
+}
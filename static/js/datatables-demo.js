@@ -1,4 +1,5 @@
 // Call the dataTables jQuery plugin
+// Tables marked data-grid are paged by the server instead (see grid.js)
 $(document).ready(function() {
-  $('#dataTable').DataTable();
+  $('#dataTable:not([data-grid])').DataTable();
 });
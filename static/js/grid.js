@@ -0,0 +1,68 @@
+// Server-side DataTables for the staff tables
+// A page declares <table data-grid="movements"> and registers its column
+// definitions in window.gridColumns.movements; rows come from /grid/movements.
+window.gridColumns = window.gridColumns || {};
+
+function escapeHtml(value) {
+  if (value === null || value === undefined) {
+    return '';
+  }
+  return String(value)
+    .replace(/&/g, '&amp;')
+    .replace(/</g, '&lt;')
+    .replace(/>/g, '&gt;')
+    .replace(/"/g, '&quot;')
+    .replace(/'/g, '&#39;');
+}
+
+function toggleGridDetails(id) {
+  var div = document.getElementById(id);
+  div.style.display = div.style.display === 'none' ? 'block' : 'none';
+}
+
+$(document).ready(function() {
+  $('table[data-grid]').each(function() {
+    var table = $(this);
+    var name = table.data('grid');
+    // Plain columns are shown as text, never as HTML
+    var columns = window.gridColumns[name].map(function(column) {
+      if (column.data !== null && !column.render) {
+        column.render = escapeHtml;
+      }
+      return column;
+    });
+
+    // Cursor for the row before each page start, so paging forward is a keyset seek
+    var cursors = {};
+    var cursorKey = null;
+    var pendingStart = null;
+
+    table.on('xhr.dt', function(e, settings, json) {
+      if (json && json.cursor && pendingStart !== null) {
+        cursors[pendingStart] = json.cursor;
+      }
+    });
+
+    table.DataTable({
+      serverSide: true,
+      processing: true,
+      searchDelay: 400,
+      order: [[table.data('order-column') || 0, table.data('order-dir') || 'asc']],
+      columns: columns,
+      ajax: {
+        url: '/grid/' + name,
+        data: function(d) {
+          var key = JSON.stringify([d.order, d.search.value, d.length]);
+          if (key !== cursorKey) {
+            cursors = {};
+            cursorKey = key;
+          }
+          if (cursors[d.start]) {
+            d.after = cursors[d.start];
+          }
+          pendingStart = d.start + d.length;
+        }
+      }
+    });
+  });
+});
@@ -111,7 +111,7 @@ $(document).ready(function() {
           productId: $("#productId").val(),
           location: $("#fromLocation").val(),
         },
-        type: "POST",
+        type: "GET",
         url: table,
       }).done(function (data) {
         $.each(data, function (index,value){
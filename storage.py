@@ -0,0 +1,78 @@
+"""
+SQLite storage profile for SmartChoice Pantry System
+Every connection gets the same tuning (WAL journaling, synchronous level,
+page cache, memory-mapped I/O and a busy timeout). Report and listing routes
+marked @read_only run on a separate pool of query-only connections, so a long
+report never holds a connection the writers are waiting for; under WAL a
+reader never blocks the writer and the writer never blocks readers.
+"""
+import os
+from functools import wraps
+from flask import request
+from sqlalchemy import event
+from database import db
+
+DEFAULT_DATABASE_URI = 'sqlite:///pantry.db'
+
+# PRAGMAs applied to every new connection, in order. journal_mode=WAL is
+# persistent in the database file; the rest are per connection.
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',   # Safe with WAL: a crash can lose the last commits, never corrupt
+    'cache_size': -20000,      # Negative means KiB: about 20 MB of page cache per connection
+    'mmap_size': 268435456,    # Read up to 256 MB of the file through the page cache of the OS
+    'busy_timeout': 10000,     # Wait up to 10 s for another writer instead of "database is locked"
+}
+
+READ_BIND = 'read'
+READ_POOL_SIZE = 8
+
+
+def _sqlite_pragma_listener(pragmas, query_only=False):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if query_only:
+            cursor.execute('PRAGMA query_only = ON')
+        cursor.close()
+    return set_pragmas
+
+
+def init_app(app, database_uri=None):
+    """Configure the database for app and bind db to it
+
+    Use instead of db.init_app(app). The URI comes from database_uri, else
+    the app config, else the DATABASE_URL environment variable.
+    """
+    uri = database_uri or app.config.get('SQLALCHEMY_DATABASE_URI') or os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URI)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    app.config.setdefault('SQLITE_PRAGMAS', dict(DEFAULT_PRAGMAS))
+    app.config.setdefault('SQLITE_READ_POOL_SIZE', READ_POOL_SIZE)
+
+    if uri.startswith('sqlite'):
+        binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(READ_BIND, {'url': uri, 'pool_size': app.config['SQLITE_READ_POOL_SIZE']})
+
+    db.init_app(app)
+
+    if uri.startswith('sqlite'):
+        pragmas = app.config['SQLITE_PRAGMAS']
+        with app.app_context():
+            for bind_key, engine in db.engines.items():
+                event.listen(engine, 'connect', _sqlite_pragma_listener(pragmas, query_only=bind_key == READ_BIND))
+
+
+def read_only(view):
+    """Run a view's queries on the read pool
+
+    The flag lives on the request, so it also covers rows a streamed
+    response reads after the view has returned. The read connections are
+    query-only: a write in a marked view fails loudly.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        request.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
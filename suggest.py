@@ -0,0 +1,249 @@
+"""
+Type-ahead suggestions for SmartChoice Pantry System
+An in-memory prefix index over the product catalog: sorted arrays of
+(key, -nutrition score, product id) searched with bisect, one for whole
+product names and one for the single words in them, plus a sorted list of
+the description terms that several products share.
+
+The index follows the catalog version. When the catalog reloads, only the
+products whose records changed are removed from and re-inserted into the
+arrays; the full sort is only repeated when most of the catalog changed.
+
+Matches are ranked by nutrition score, whole-name matches before word
+matches, and checked for stock best first, in growing rounds, until enough
+are in stock or none are left.
+"""
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+import catalog
+import inventory
+
+DEFAULT_LIMIT = 8
+CANDIDATES_PER_RESULT = 4  # Candidates checked for stock per suggestion returned, in the first round
+MAX_STOCK_CHECK = 2000  # Most candidates checked for stock in one query
+RANKED_PREFIXES = 1024  # Prefixes whose ranked candidates are remembered per index
+COMMON_TERM_PRODUCTS = 2  # Description words in at least this many products are suggested
+MIN_TERM_LENGTH = 3
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    """Lowercase without accents, the way the search index tokenizes"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower().strip()
+
+
+def _name_keys(record):
+    score = -(record.nutrition_score or 0)
+    name = normalize(record.product_id)
+    words = set(_WORD.findall(name))
+    return [(name, score, record.product_id)], [(word, score, record.product_id) for word in words]
+
+
+def _description_terms(record):
+    return {word for word in _WORD.findall(normalize(record.description))
+            if len(word) >= MIN_TERM_LENGTH and not word.isdigit()}
+
+
+def _remove(array, entry):
+    position = bisect_left(array, entry)
+    if position < len(array) and array[position] == entry:
+        del array[position]
+
+
+def _prefix_range(array, prefix):
+    """Entries whose key starts with prefix, in array order"""
+    for position in range(bisect_left(array, (prefix,)), len(array)):
+        entry = array[position]
+        if not entry[0].startswith(prefix):
+            return
+        yield entry
+
+
+class _PrefixIndex:
+    def __init__(self):
+        self.version = None
+        self.records = {}  # product_id -> catalog record the entries were built from
+        self.names = []
+        self.words = []
+        self.term_counts = Counter()
+        self.terms = []  # Sorted description terms shared by COMMON_TERM_PRODUCTS or more
+        self.ranked = {}  # prefix -> candidates(prefix), for this index only
+
+    def rebuild(self, version, products):
+        self.records = {p.product_id: p for p in products}
+        self.names, self.words = [], []
+        self.term_counts = Counter()
+        for record in products:
+            names, words = _name_keys(record)
+            self.names.extend(names)
+            self.words.extend(words)
+            self.term_counts.update(_description_terms(record))
+        self.names.sort()
+        self.words.sort()
+        self.terms = sorted(t for t, n in self.term_counts.items() if n >= COMMON_TERM_PRODUCTS)
+        self.version = version
+
+    def updated(self, version, products):
+        """A new index for products, made by applying only the differences to copies of this one
+
+        Readers keep using this index undisturbed while the new one is built.
+        """
+        index = _PrefixIndex()
+        current = {p.product_id: p for p in products}
+        removed = [r for pid, r in self.records.items() if current.get(pid) != r]
+        added = [r for pid, r in current.items() if self.records.get(pid) != r]
+        if len(removed) + len(added) > len(current) // 2:
+            index.rebuild(version, products)
+        else:
+            index.records = dict(self.records)
+            index.names, index.words, index.terms = list(self.names), list(self.words), list(self.terms)
+            index.term_counts = Counter(self.term_counts)
+            index._apply(version, removed, added)
+        return index
+
+    def _apply(self, version, removed, added):
+        changed_terms = set()
+        for record in removed:
+            names, words = _name_keys(record)
+            for entry in names:
+                _remove(self.names, entry)
+            for entry in words:
+                _remove(self.words, entry)
+            terms = _description_terms(record)
+            self.term_counts.subtract(terms)
+            changed_terms.update(terms)
+            del self.records[record.product_id]
+        for record in added:
+            names, words = _name_keys(record)
+            for entry in names:
+                insort(self.names, entry)
+            for entry in words:
+                insort(self.words, entry)
+            terms = _description_terms(record)
+            self.term_counts.update(terms)
+            changed_terms.update(terms)
+            self.records[record.product_id] = record
+
+        for term in changed_terms:
+            common = self.term_counts[term] >= COMMON_TERM_PRODUCTS
+            position = bisect_left(self.terms, term)
+            listed = position < len(self.terms) and self.terms[position] == term
+            if common and not listed:
+                self.terms.insert(position, term)
+            elif listed and not common:
+                del self.terms[position]
+            if self.term_counts[term] <= 0:
+                del self.term_counts[term]
+        self.version = version
+
+    def candidates(self, prefix):
+        """Product ids whose name, then one of whose name words, starts with prefix
+
+        Best nutrition score first within each of the two groups. Ranking a
+        short prefix means sorting much of the catalog, so results are kept.
+        """
+        found = self.ranked.get(prefix)
+        if found is not None:
+            return found
+        found = []
+        seen = set()
+        for array in (self.names, self.words):
+            group = sorted({(score, product_id) for key, score, product_id in _prefix_range(array, prefix)
+                            if product_id not in seen})
+            for score, product_id in group:
+                seen.add(product_id)
+                found.append(product_id)
+        if len(self.ranked) >= RANKED_PREFIXES:
+            self.ranked = {}
+        self.ranked[prefix] = found
+        return found
+
+    def matching_terms(self, prefix, count):
+        terms = []
+        for position in range(bisect_left(self.terms, prefix), len(self.terms)):
+            term = self.terms[position]
+            if not term.startswith(prefix) or len(terms) >= count:
+                break
+            terms.append(term)
+        return terms
+
+
+_index = _PrefixIndex()
+_lock = threading.Lock()
+_stock = (None, {})  # (stock version, {product_id: available qty} checked at that version)
+
+
+def _current():
+    """The index, brought up to the catalog's version"""
+    global _index
+    version, products = catalog.snapshot()
+    if _index.version != version:
+        with _lock:
+            if _index.version != version:
+                _index = _index.updated(version, products)
+    return _index
+
+
+def _availability(product_ids):
+    """get_availability, remembering answers until the stock version moves on
+
+    Successive keystrokes mostly check the same candidates again.
+    """
+    global _stock
+    version = inventory.stock_version()
+    checked_version, checked = _stock
+    if checked_version != version:
+        checked = {}
+        _stock = (version, checked)
+    missing = [pid for pid in product_ids if pid not in checked]
+    if missing:
+        checked.update(inventory.get_availability(missing))
+    return {pid: checked[pid] for pid in product_ids}
+
+
+def load():
+    """Build the index now (e.g. before forking workers)"""
+    _current()
+
+
+def clear():
+    """Forget the index, e.g. after the database is replaced"""
+    global _index, _stock
+    with _lock:
+        _index = _PrefixIndex()
+        _stock = (None, {})
+
+
+def suggest(query, limit=DEFAULT_LIMIT):
+    """Type-ahead results for a partly typed query
+
+    Returns (products, terms): up to limit in-stock catalog records, each
+    with its available quantity, whose name or a word of it starts with the
+    query, and common description terms that complete the query's last word.
+    """
+    prefix = normalize(query)
+    if not prefix:
+        return [], []
+    index = _current()
+    # Stock is checked for the best limit * CANDIDATES_PER_RESULT candidates,
+    # then for rounds four times larger until limit are found or none are left
+    ranked = index.candidates(prefix)
+    products = []
+    start, window = 0, limit * CANDIDATES_PER_RESULT
+    while len(products) < limit and start < len(ranked):
+        product_ids = ranked[start:start + window]
+        availability = _availability(product_ids)
+        products.extend((index.records[pid], availability[pid]) for pid in product_ids if availability[pid] > 0)
+        start, window = start + window, min(window * 4, MAX_STOCK_CHECK)
+
+    words = _WORD.findall(prefix)
+    terms = []
+    if words and prefix.endswith(words[-1]):
+        lead = prefix[:len(prefix) - len(words[-1])]
+        terms = [lead + term for term in index.matching_terms(words[-1], limit) if term != words[-1]]
+    return products[:limit], terms
@@ -0,0 +1,110 @@
+"""
+Healthier-swap index for SmartChoice Pantry System
+For every category, the catalog's products, best nutrition score first. A
+swap lookup walks its category from the top and stops at the first product
+that is not healthier than the one being swapped, skipping anything with an
+allergen the client avoids.
+
+The index follows the catalog version only. Stock moves with every sale,
+so it is read at lookup time, for the few candidates a lookup walks: one
+availability query per round of CANDIDATES_PER_RESULT candidates per result
+still wanted, usually a single round.
+"""
+import threading
+from itertools import islice
+import catalog
+import inventory
+
+DEFAULT_LIMIT = 3
+CANDIDATES_PER_RESULT = 4  # Candidates checked for stock per swap still wanted
+
+
+class _SwapIndex:
+    """Products per category at one catalog version"""
+
+    def __init__(self, catalog_version, products):
+        self.catalog_version = catalog_version
+        self.by_category = {}
+        for record in products:  # Catalog order: best nutrition score first
+            self.by_category.setdefault(record.category, []).append(record)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def _current():
+    """The index, rebuilt if the catalog has moved on"""
+    global _index
+    catalog_version, products = catalog.snapshot()
+    index = _index
+    if index is not None and index.catalog_version == catalog_version:
+        return index
+    with _lock:
+        index = _index
+        if index is None or index.catalog_version != catalog_version:
+            _index = _SwapIndex(catalog_version, products)
+        return _index
+
+
+def load():
+    """Build the index now (e.g. before forking workers)"""
+    _current()
+
+
+def clear():
+    """Forget the index, e.g. after the database is replaced"""
+    global _index
+    with _lock:
+        _index = None
+
+
+def healthier(product_id, avoid=0, limit=DEFAULT_LIMIT, exclude=()):
+    """In-stock products in the same category with a higher nutrition score, best first
+
+    avoid is a dietary.py allergen mask; products carrying any of those
+    allergens are skipped, as are the product ids in exclude. Returns
+    [(catalog record, available qty)], or None if the product is unknown.
+    """
+    return healthier_many([product_id], avoid, limit, exclude).get(product_id)
+
+
+def _candidates(index, record, avoid, skip):
+    """Healthier products in record's category the client may have, best first"""
+    score = record.nutrition_score or 0
+    for candidate in index.by_category.get(record.category, ()):
+        if (candidate.nutrition_score or 0) <= score:
+            return
+        if candidate.allergen_mask & avoid or candidate.product_id in skip or candidate.product_id == record.product_id:
+            continue
+        yield candidate
+
+
+def healthier_many(product_ids, avoid=0, limit=DEFAULT_LIMIT, exclude=()):
+    """{product_id: healthier() result} for several products, checking stock for all of them at once"""
+    index = _current()
+    skip = set(exclude)
+    results = {}
+    walks = {}
+    for product_id in product_ids:
+        record = catalog.get(product_id)
+        if record is None:
+            continue
+        results[product_id] = []
+        if limit > 0:
+            walks[product_id] = _candidates(index, record, avoid, skip)
+
+    availability = {}
+    while walks:
+        wanted = {product_id: (limit - len(results[product_id])) * CANDIDATES_PER_RESULT for product_id in walks}
+        batch = {product_id: list(islice(walk, wanted[product_id])) for product_id, walk in walks.items()}
+        unknown = {c.product_id for candidates in batch.values() for c in candidates} - availability.keys()
+        availability.update(inventory.get_availability(unknown))
+        for product_id, candidates in batch.items():
+            found = results[product_id]
+            for candidate in candidates:
+                if len(found) < limit and availability[candidate.product_id] > 0:
+                    found.append((candidate, availability[candidate.product_id]))
+            if len(found) >= limit or len(candidates) < wanted[product_id]:
+                del walks[product_id]  # Filled, or the category has no healthier products left
+    return results
@@ -0,0 +1,106 @@
+"""
+Tests for the static asset pipeline (assets.py)
+"""
+import gzip
+import os
+import shutil
+import pytest
+import assets
+
+
+@pytest.fixture
+def built(app, tmp_path, monkeypatch):
+    """A build of a copy of the static folder, served by the test app"""
+    static = tmp_path / 'static'
+    shutil.copytree(app.static_folder, static, ignore=shutil.ignore_patterns('build', 'products'))
+    manifest = assets.build(str(static))
+    monkeypatch.setattr(app, 'static_folder', str(static))
+    monkeypatch.setitem(app.extensions, 'assets', manifest)
+    return static, manifest
+
+
+def test_names_carry_the_content_hash(tmp_path):
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'js' / 'app.js').write_text('var a = 1;')
+    first = assets.build(str(tmp_path))['js/app.js']
+    assert first.startswith('js/app.') and first.endswith('.js')
+
+    (tmp_path / 'js' / 'app.js').write_text('var a = 2;')
+    second = assets.build(str(tmp_path))['js/app.js']
+    assert second != first
+    assert (tmp_path / 'build' / first).exists()  # Pages cached with the old name still load
+
+
+def test_uploads_and_build_output_are_not_fingerprinted(built):
+    static, manifest = built
+    assert 'js/script.js' in manifest
+    assert not [path for path in manifest if path.startswith(('build/', 'images/products/'))]
+
+
+def test_source_maps_point_at_hashed_maps(built):
+    static, manifest = built
+    css = (static / 'build' / manifest['css/bootstrap/mdb.min.css']).read_bytes()
+    hashed_map = os.path.basename(manifest['css/bootstrap/mdb.min.css.map'])
+    assert f'sourceMappingURL={hashed_map}'.encode() in css
+
+
+def test_pages_link_hashed_assets(client, built):
+    static, manifest = built
+    page = client.get('/').get_data(as_text=True)
+    assert f"/static/build/{manifest['css/bootstrap/mdb.min.css']}" in page
+
+
+def test_pages_fall_back_to_plain_files_without_a_build(client, app, monkeypatch):
+    monkeypatch.setitem(app.extensions, 'assets', {})
+    page = client.get('/').get_data(as_text=True)
+    assert '/static/css/bootstrap/mdb.min.css' in page
+
+
+def test_hashed_files_are_immutable_and_served_precompressed(client, built):
+    static, manifest = built
+    url = f"/static/build/{manifest['js/script.js']}"
+    original = (static / 'js' / 'script.js').read_bytes()
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype in ('application/javascript', 'text/javascript')
+    assert gzip.decompress(response.data) == original
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data == original
+
+    refused = client.get(url, headers={'Accept-Encoding': 'gzip;q=0, br;q=0'})
+    assert 'Content-Encoding' not in refused.headers
+    assert refused.data == original
+
+
+def test_brotli_is_preferred_when_built(client, built):
+    if assets.brotli is None:
+        pytest.skip('brotli is not installed')
+    static, manifest = built
+    url = f"/static/build/{manifest['js/script.js']}"
+    response = client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert assets.brotli.decompress(response.data) == (static / 'js' / 'script.js').read_bytes()
+
+
+def test_stale_or_debug_builds_are_not_linked(app, built):
+    from flask import Flask
+    static, manifest = built
+
+    def linked(debug=False):
+        fresh = Flask(__name__, static_folder=str(static))
+        fresh.debug = debug
+        assets.init_app(fresh)
+        return fresh.extensions['assets']
+
+    assert linked() == manifest
+    assert linked(debug=True) == {}
+    built_at = os.stat(static / 'build' / assets.MANIFEST).st_mtime
+    os.utime(static / 'js' / 'script.js', (built_at + 10, built_at + 10))  # Edited after the build
+    assert linked() == {}
@@ -0,0 +1,353 @@
+"""
+Tests for the server-side cart store (carts.py)
+"""
+from datetime import timedelta
+from sqlalchemy import text
+from database import db, Cart, Client, Order, Product
+import carts
+from test_checkout import cart_line
+from test_grid import login_staff
+from test_inventory import move, record_queries
+
+
+def stock(*names, qty=50):
+    for name in names:
+        db.session.add(Product(product_id=name, category='Vegetables', points=2))
+    db.session.commit()
+    for name in names:
+        move(name, qty, to_location='Pantry')
+
+
+def shopper(app, client_id='C00001', name='Test Client'):
+    db.session.add(Client(client_id=client_id, name=name))
+    db.session.commit()
+    client = app.test_client()
+    client.post('/shop/login', data={'client_id': client_id})
+    return client
+
+
+def session_cookie(client):
+    return client.get_cookie('session').value
+
+
+def apply(client, *operations, cart='shop'):
+    return client.post('/cart/apply', json={'cart': cart, 'operations': list(operations)})
+
+
+def test_cookie_stays_small_however_big_the_cart(app):
+    names = [f'Vegetable number {i}' for i in range(40)]
+    stock(*names)
+    client = shopper(app)
+    empty = len(session_cookie(client))
+    for name in names:
+        assert client.post('/shop/add-to-cart', json={'product_id': name, 'quantity': 3}).json['success']
+
+    assert len(session_cookie(client)) < empty + 120
+    cart = Cart.query.one()
+    assert cart.client_id == 'C00001' and cart.revision == 40
+    assert len(cart.get_lines()) == 40
+    page = client.get('/shop/categories').get_data(as_text=True)
+    assert 'Vegetable number 39' in page
+
+
+def test_cached_cart_is_read_without_a_query(app):
+    stock('Kale')
+    client = shopper(app)
+    client.post('/shop/add-to-cart', json={'product_id': 'Kale'})
+
+    statements = record_queries(lambda: client.get('/shop/categories'))
+    assert not [s for s in statements if 'carts' in s]
+
+
+def test_cart_saved_by_another_process_is_reloaded(app):
+    stock('Kale', 'Leek')
+    client = shopper(app)
+    client.post('/shop/add-to-cart', json={'product_id': 'Kale'})
+    client.post('/shop/add-to-cart', json={'product_id': 'Leek'})
+
+    # Another worker still caches the first revision of this cart
+    cart = Cart.query.one()
+    carts._cache.put(cart.cart_id, (1, 'C00001', cart.expires_at, [cart_line('Kale', 1)]))
+    page = client.get('/shop/categories').get_data(as_text=True)
+    assert 'Leek' in page
+
+
+def test_expired_carts_are_hidden_and_swept(app):
+    stock('Kale')
+    client = shopper(app)
+    client.post('/shop/add-to-cart', json={'product_id': 'Kale'})
+    carts.clear()
+    db.session.execute(text("UPDATE carts SET expires_at = '2000-01-01 00:00:00.000000'"))
+    db.session.commit()
+
+    assert 'Kale' not in client.get('/shop/categories').get_data(as_text=True)
+    assert carts.sweep() == 1
+    assert Cart.query.count() == 0
+
+    # The next add starts a new cart
+    assert client.post('/shop/add-to-cart', json={'product_id': 'Kale'}).json['success']
+    assert Cart.query.one().revision == 1
+
+
+def test_cookie_carts_move_into_the_store(app):
+    stock('Kale', 'Leek')
+    client = shopper(app)
+    with client.session_transaction() as sess:
+        sess['cart'] = [cart_line('Kale', 2)]
+    assert 'Kale' in client.get('/shop/categories').get_data(as_text=True)
+
+    client.post('/shop/add-to-cart', json={'product_id': 'Leek'})
+    with client.session_transaction() as sess:
+        assert 'cart' not in sess
+    assert [line['product_id'] for line in Cart.query.one().get_lines()] == ['Kale', 'Leek']
+
+
+def test_checkout_and_logout_discard_the_cart(app):
+    stock('Kale')
+    client = shopper(app)
+    client.post('/shop/add-to-cart', json={'product_id': 'Kale'})
+    response = client.post('/shop/checkout', data={'fulfillment_method': 'Pickup'})
+    assert '/shop/order-confirmation/' in response.location
+    assert Cart.query.count() == 0
+
+    client.post('/shop/add-to-cart', json={'product_id': 'Kale'})
+    client.get('/shop/logout')
+    assert Cart.query.count() == 0
+
+
+def test_another_client_never_sees_the_cart(app):
+    stock('Kale')
+    client = shopper(app)
+    client.post('/shop/add-to-cart', json={'product_id': 'Kale'})
+    db.session.add(Client(client_id='C00002', name='Next Client'))
+    db.session.commit()
+    client.post('/shop/login', data={'client_id': 'C00002'})
+    assert 'Kale' not in client.get('/shop/categories').get_data(as_text=True)
+
+
+def test_staff_see_carts_in_progress(app):
+    stock('Kale', 'Leek')
+    online = shopper(app, 'C00001', 'Ada Online')
+    online.post('/shop/add-to-cart', json={'product_id': 'Kale', 'quantity': 2})
+    db.session.add(Client(client_id='C00002', name='Kim Kiosk'))
+    db.session.commit()
+    kiosk = app.test_client()
+    kiosk.post('/kiosk/start', data={'client_id': 'C00002'})
+    apply(kiosk, {'op': 'add', 'product_id': 'Leek'}, cart='kiosk')
+
+    staff = app.test_client()
+    login_staff(staff)
+    page = staff.get('/carts/').get_data(as_text=True)
+    assert 'Ada Online' in page and 'Kale &times; 2' in page
+    assert 'Kim Kiosk' in page and 'Kiosk' in page
+    assert [cart['points'] for cart in carts.in_progress()] == [2, 4]  # Most recent first
+    assert app.test_client().get('/carts/').status_code == 302
+
+
+def test_kiosk_cart_ttl_is_shorter(app):
+    assert carts.TTL[carts.KIOSK] < carts.TTL[carts.SHOP]
+    with app.test_request_context():
+        from flask import session
+        session['kiosk_client_id'] = 'C00001'
+        carts.save([cart_line('Kale', 1)], carts.KIOSK)
+        cart = Cart.query.one()
+        assert cart.expires_at - cart.updated_at == timedelta(hours=2)
+        assert carts.get(carts.KIOSK) == [cart_line('Kale', 1)]
+        assert carts.get(carts.SHOP) == []
+
+
+def test_evaluate_prices_and_checks_the_whole_cart(app):
+    for name, category, points, allergens in [('Kale', 'Vegetables', 2, []), ('Milk', 'Dairy', 3, ['milk']),
+                                              ('Tofu', 'Soy Foods', 4, ['soybeans'])]:
+        product = Product(product_id=name, category=category, points=points)
+        product.set_allergens(allergens)
+        db.session.add(product)
+    client = Client(client_id='C00001', name='Test Client', points_per_visit=20)
+    client.set_allergens(['Dairy'])
+    db.session.add(client)
+    db.session.commit()
+    move('Kale', 5, to_location='Pantry')
+    move('Milk', 1, to_location='Pantry')
+    lines = [cart_line('Kale', 2), cart_line('Milk', 2), cart_line('Tofu', 1), cart_line('Gone', 1)]
+
+    summary = carts.evaluate(lines, client)
+    assert [line['points'] for line in summary.lines] == [2, 3, 4, 1]  # Repriced from the catalog
+    assert summary.points_used == 15 and summary.points_remaining == 5
+    assert summary.myplate == {'Fruits': 1, 'Vegetables': 4, 'Dairy': 6, 'Proteins': 0, 'Grains': 0, 'Other': 4}
+    assert summary.conflicts == {'Milk': ['milk']}
+    assert summary.shortfalls == [carts.Shortfall('Milk', 2, 1), carts.Shortfall('Tofu', 1, 0),
+                                  carts.Shortfall('Gone', 1, 0)]
+    assert lines[0]['points'] == 1  # The caller's lines are left alone
+    assert carts.evaluate(lines, client, stock=False).shortfalls == []
+
+
+def test_evaluate_runs_the_same_queries_for_any_cart_size(app):
+    names = [f'Vegetable number {i}' for i in range(30)]
+    stock(*names)
+    client = Client(client_id='C00001', name='Test Client')
+    db.session.add(client)
+    db.session.commit()
+
+    def count(lines):
+        return len(record_queries(lambda: carts.evaluate(lines, client)))
+
+    lines = [cart_line(name, 1) for name in names]
+    carts.evaluate(lines, client)  # Loads the catalog
+    assert count(lines[:1]) == count(lines) == 1
+
+
+def test_add_to_cart_warns_of_allergens_by_flag(app):
+    stock('Cheese')
+    client = shopper(app)
+    Product.query.filter_by(product_id='Cheese').one().set_allergens(['Milk'])
+    Client.query.filter_by(client_id='C00001').one().set_allergens(['Dairy'])  # The client form's spelling
+    db.session.commit()
+
+    response = client.post('/shop/add-to-cart', json={'product_id': 'Cheese'})
+    assert response.json['warning'] and response.json['allergens'] == ['milk']
+    response = client.post('/shop/add-to-cart', json={'product_id': 'Cheese', 'quantity': 50})
+    assert response.json['error'] == ('Cannot add 50 more. Only 50 units available total, '
+                                      'and you already have 1 in your cart.')
+
+
+def test_checkout_refuses_a_cart_over_the_points_allowance(app):
+    stock('Kale')
+    client = shopper(app)
+    client.post('/shop/add-to-cart', json={'product_id': 'Kale', 'quantity': 30})  # 60 points
+    Client.query.filter_by(client_id='C00001').one().points_per_visit = 50
+    db.session.commit()
+
+    page = client.get('/shop/checkout').get_data(as_text=True)
+    assert 'Total: 60 points' in page and '10 more than your 50 points per visit' in page
+    assert client.post('/shop/checkout', data={'fulfillment_method': 'Pickup'}).status_code == 409
+    assert Order.query.count() == 0
+
+
+def test_kiosk_shows_lines_out_of_stock(app):
+    stock('Kale', qty=2)
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.commit()
+    kiosk = app.test_client()
+    kiosk.post('/kiosk/start', data={'client_id': 'C00001'})
+    with app.test_request_context():
+        from flask import session
+        session['kiosk_client_id'] = 'C00001'
+        carts.save([cart_line('Kale', 3)], carts.KIOSK)
+        cart_id, revision = session['kiosk_cart_id'], session['kiosk_cart_rev']
+    with kiosk.session_transaction() as sess:
+        sess['kiosk_cart_id'], sess['kiosk_cart_rev'] = cart_id, revision
+
+    page = kiosk.get('/kiosk/categories').get_data(as_text=True)
+    assert 'Only 2 left' in page and 'Points: 6' in page
+    kiosk.post('/kiosk/complete')
+    assert Order.query.count() == 0
+
+
+def test_apply_saves_a_batch_at_once(app):
+    stock('Kale', 'Leek', 'Chard')
+    client = shopper(app)
+    response = apply(client, {'op': 'add', 'product_id': 'Kale', 'quantity': 2},
+                     {'op': 'add', 'product_id': 'Leek'}, {'op': 'add', 'product_id': 'Kale'},
+                     {'op': 'set', 'product_id': 'Chard', 'quantity': 4}, {'op': 'remove', 'product_id': 'Leek'})
+    assert response.json['success']
+    assert [(line['product_id'], line['quantity']) for line in response.json['cart']['lines']] == \
+        [('Kale', 3), ('Chard', 4)]
+    assert response.json['cart']['points_used'] == 14 and response.json['cart']['myplate']['Vegetables'] == 14
+    assert Cart.query.one().revision == 1  # One save for the whole batch
+
+    response = apply(client, {'op': 'set', 'product_id': 'Kale', 'quantity': 0})
+    assert [line['product_id'] for line in response.json['cart']['lines']] == ['Chard']
+
+
+def test_apply_is_all_or_nothing(app):
+    stock('Kale', qty=5)
+    stock('Leek', qty=2)
+    client = shopper(app)
+    apply(client, {'op': 'add', 'product_id': 'Kale', 'quantity': 2})
+
+    response = apply(client, {'op': 'add', 'product_id': 'Kale'}, {'op': 'add', 'product_id': 'Leek', 'quantity': 3})
+    assert response.status_code == 409
+    assert response.json['shortages'] == [{'product_id': 'Leek', 'requested': 3, 'available': 2}]
+    response = apply(client, {'op': 'add', 'product_id': 'Kale'}, {'op': 'add', 'product_id': 'Nope'})
+    assert response.status_code == 400
+    assert response.json['errors'] == [{'index': 1, 'product_id': 'Nope', 'error': 'Product not found'}]
+    assert apply(client, {'op': 'set', 'product_id': 'Kale', 'quantity': -1}).status_code == 400
+    assert apply(client, {'op': 'paint', 'product_id': 'Kale'}).status_code == 400
+
+    assert [line['quantity'] for line in Cart.query.one().get_lines()] == [2]
+    assert response.json['cart']['lines'][0]['quantity'] == 2  # The cart as it still is
+
+
+def test_apply_lets_shoppers_shrink_a_line_that_ran_short(app):
+    stock('Kale', qty=5)
+    client = shopper(app)
+    apply(client, {'op': 'add', 'product_id': 'Kale', 'quantity': 5})
+    move('Kale', 3, from_location='Pantry', to_location='Customer')
+
+    assert apply(client, {'op': 'add', 'product_id': 'Kale'}).status_code == 409
+    response = apply(client, {'op': 'set', 'product_id': 'Kale', 'quantity': 4})
+    assert response.json['success']
+    assert response.json['cart']['shortages'] == [{'product_id': 'Kale', 'requested': 4, 'available': 2}]
+
+
+def test_apply_warns_only_of_allergens_it_added(app):
+    stock('Cheese', 'Kale')
+    client = shopper(app)
+    Product.query.filter_by(product_id='Cheese').one().set_allergens(['milk'])
+    Client.query.filter_by(client_id='C00001').one().set_allergens(['Dairy'])
+    db.session.commit()
+
+    response = apply(client, {'op': 'add', 'product_id': 'Cheese'}, {'op': 'add', 'product_id': 'Kale'})
+    assert [(w['product_id'], w['allergens']) for w in response.json['warnings']] == [('Cheese', ['milk'])]
+    assert apply(client, {'op': 'add', 'product_id': 'Kale'}).json['warnings'] == []
+
+
+def test_apply_queries_do_not_grow_with_the_batch(app):
+    names = [f'Vegetable number {i}' for i in range(20)]
+    stock(*names)
+    client = shopper(app)
+    apply(client, {'op': 'add', 'product_id': names[0]})
+
+    def count(operations):
+        return len(record_queries(lambda: apply(client, *operations)))
+
+    one = count([{'op': 'add', 'product_id': names[0]}])
+    assert count([{'op': 'add', 'product_id': name} for name in names]) == one
+
+
+def test_apply_to_the_kiosk_cart(app):
+    stock('Kale')
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.commit()
+    kiosk = app.test_client()
+    assert not apply(kiosk, {'op': 'add', 'product_id': 'Kale'}, cart='kiosk').json['success']
+    kiosk.post('/kiosk/start', data={'client_id': 'C00001'})
+
+    assert apply(kiosk, {'op': 'add', 'product_id': 'Kale', 'quantity': 2}, cart='kiosk').json['success']
+    assert apply(kiosk, {'op': 'add', 'product_id': 'Kale'}).json['error'] == 'Not logged in'  # No shop login
+    assert Cart.query.one().kind == carts.KIOSK
+    assert 'kiosk-qty-Kale">2<' in kiosk.get('/kiosk/categories').get_data(as_text=True)
+    assert apply(kiosk, cart='pantry').status_code == 400
+
+
+def test_overlapping_batches_do_not_undo_each_other(app):
+    stock('Kale', 'Leek')
+    phone = shopper(app)
+    apply(phone, {'op': 'add', 'product_id': 'Kale'})
+    with phone.session_transaction() as sess:
+        stale = dict(sess)
+
+    # A second tab, still at the first revision, saves after the phone did
+    apply(phone, {'op': 'add', 'product_id': 'Leek'})
+    tab = app.test_client()
+    with tab.session_transaction() as sess:
+        sess.update(stale)
+    response = apply(tab, {'op': 'add', 'product_id': 'Kale', 'quantity': 2})
+    assert response.status_code == 409 and response.json['conflict']
+    assert [line['product_id'] for line in response.json['cart']['lines']] == ['Kale', 'Leek']
+
+    # Sent again, as cart.js does, it applies to the current cart
+    response = apply(tab, {'op': 'add', 'product_id': 'Kale', 'quantity': 2})
+    assert [(line['product_id'], line['quantity']) for line in response.json['cart']['lines']] == \
+        [('Kale', 3), ('Leek', 1)]
+    assert Cart.query.count() == 1 and Cart.query.one().revision == 3
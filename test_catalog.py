@@ -0,0 +1,113 @@
+"""
+Tests for the in-process product catalog (catalog.py)
+"""
+from sqlalchemy import text
+from database import db, Client, Counter, Product, CATALOG_VERSION
+import catalog
+from test_grid import login_staff
+from test_inventory import add_product, move, record_queries
+
+
+def add_decorated_product(name, category='Fruits', nutrition_score=50, upc=''):
+    product = Product(product_id=name, category=category, nutrition_score=nutrition_score, upc=upc)
+    product.set_dietary_indicators(['Vegan'])
+    product.set_allergens(['milk'])
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+def test_catalog_indexes_decoded_products(app):
+    add_decorated_product('Apples', nutrition_score=60, upc='0001')
+    add_decorated_product('Pears', nutrition_score=80)
+    add_decorated_product('Beans', category='Proteins')
+
+    apples = catalog.get('Apples')
+    assert apples.dietary_indicators == ('Vegan',)
+    assert apples.allergens == ('milk',)
+    assert catalog.by_upc('0001') is apples
+    assert [p.product_id for p in catalog.in_category('Fruits')] == ['Pears', 'Apples']
+    assert catalog.categories() == ['Fruits', 'Proteins']
+    assert catalog.get('Missing') is None
+
+
+def test_product_writes_bump_the_version(app):
+    start = catalog.version()
+    product = add_decorated_product('Apples')
+    assert catalog.version() == start + 1
+    assert catalog.get('Apples').nutrition_score == 50
+
+    product.nutrition_score = 90
+    db.session.commit()
+    assert catalog.get('Apples').nutrition_score == 90
+
+    db.session.delete(product)
+    db.session.commit()
+    assert catalog.get('Apples') is None
+    assert catalog.version() == start + 3
+
+    # Writes to other tables leave the catalog alone
+    Counter.get_next_id('orders')
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.commit()
+    assert catalog.version() == start + 3
+
+
+def test_rolled_back_write_keeps_the_version(app):
+    start = catalog.version()
+    db.session.add(Product(product_id='Apples', category='Fruits'))
+    db.session.flush()
+    db.session.rollback()
+    assert catalog.version() == start
+    assert catalog.get('Apples') is None
+
+
+def test_other_processes_writes_are_seen_after_recheck(app, monkeypatch):
+    add_decorated_product('Apples')
+    assert catalog.get('Apples').points == 1
+
+    # Another worker commits through its own connection
+    with db.engine.begin() as connection:
+        connection.execute(text("UPDATE products SET points = 7 WHERE product_id = 'Apples'"))
+        connection.execute(text('UPDATE counter SET value = value + 1 WHERE name = :name'),
+                           {'name': CATALOG_VERSION})
+    assert catalog.get('Apples').points == 1  # Within the recheck interval
+
+    monkeypatch.setattr(catalog, 'RECHECK_SECONDS', 0)
+    assert catalog.get('Apples').points == 7
+
+
+def test_staff_product_form_updates_shop_immediately(client):
+    login_staff(client)
+    client.post('/products/', data={'product_name': 'Kale', 'category': 'Vegetables', 'points': 2,
+                                    'nutrition_score': 95, 'vegan': 'on'})
+    assert catalog.get('Kale').dietary_indicators == ('Vegan',)
+
+    client.post('/update-product/Kale', data={'product_name': 'Kale', 'category': 'Vegetables', 'points': 3,
+                                              'nutrition_score': 95})
+    assert catalog.get('Kale').points == 3
+
+    client.get('/delete-product/Kale')
+    assert catalog.get('Kale') is None
+
+
+def test_shopper_pages_do_not_query_products(client):
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.commit()
+    for i in range(5):
+        add_product(f'Kale {i}', category='Vegetables', nutrition_score=50 + i)
+        move(f'Kale {i}', 5, to_location='Pantry')
+    client.post('/shop/login', data={'client_id': 'C00001'})
+    catalog.load()
+
+    def browse():
+        assert client.get('/shop/category/Vegetables').status_code == 200
+        assert client.get('/shop/search?q=kale').status_code == 200
+        assert client.get('/shop/healthier-swap/Kale 0').json['success']
+        assert client.post('/shop/add-to-cart', json={'product_id': 'Kale 1'}).json['success']
+        assert client.get('/shop/categories').status_code == 200
+
+    statements = record_queries(browse)
+    assert statements
+    # Search is the one product query: a single FTS statement (see test_search.py)
+    assert not [s for s in statements if 'FROM products' in s and 'products_fts' not in s]
@@ -0,0 +1,127 @@
+"""
+Tests for oversell-proof checkout: stock is reserved with a conditional
+decrement in the order's own transaction
+"""
+import multiprocessing
+import random
+from database import db, Client, Movement, Order, StockBalance
+import inventory
+from test_inventory import add_product, move
+
+_app = None
+
+
+def shop_client(app, cart, client_id='C00001'):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['client_id'] = client_id
+        sess['cart'] = cart
+    return client
+
+
+def cart_line(product_id, quantity):
+    return {'product_id': product_id, 'name': product_id, 'quantity': quantity, 'points': 1, 'category': 'Fruits'}
+
+
+def checkout(client, json=False):
+    headers = {'Accept': 'application/json'} if json else {}
+    return client.post('/shop/checkout', data={'fulfillment_method': 'Pickup'}, headers=headers)
+
+
+def _checkout_in_worker(seed):
+    rng = random.Random(seed)
+    with _app.app_context():
+        db.engine.dispose(close=False)  # Never share the parent's SQLite connections
+    outcomes = []
+    for _ in range(30):
+        cart = [cart_line('Apples', rng.randint(1, 3)), cart_line('Beans', rng.randint(1, 2))]
+        response = checkout(shop_client(_app, cart), json=True)
+        if response.status_code == 302 and '/shop/order-confirmation/' in response.location:
+            outcomes.append('placed')
+        elif response.status_code == 409:
+            outcomes.append('short')
+        else:
+            outcomes.append(f'error {response.status_code} {response.location}')
+    return outcomes
+
+
+def setup_pantry(apples=10, beans=10):
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.commit()
+    add_product('Apples')
+    add_product('Beans')
+    move('Apples', apples, to_location='Pantry')
+    move('Beans', beans, to_location='Pantry')
+
+
+def test_checkout_reserves_stock(app):
+    setup_pantry()
+    response = checkout(shop_client(app, [cart_line('Apples', 4), cart_line('Beans', 10)]))
+    assert response.status_code == 302
+    assert '/shop/order-confirmation/' in response.location
+    assert inventory.get_stock('Apples') == {'Pantry': 6, 'Reserved': 4}
+    assert inventory.get_stock('Beans') == {'Pantry': 0, 'Reserved': 10}
+
+
+def test_checkout_reports_each_short_line(app):
+    setup_pantry(apples=3, beans=1)
+    client = shop_client(app, [cart_line('Apples', 4), cart_line('Beans', 1)])
+
+    response = checkout(client, json=True)
+    assert response.status_code == 409
+    assert response.json['shortages'] == [{'product_id': 'Apples', 'requested': 4, 'available': 3}]
+
+    response = checkout(client)
+    assert response.status_code == 409
+    assert b'Only 3 left' in response.data
+
+    # Nothing was written: no order, no reservation, Beans untouched
+    assert Order.query.count() == 0
+    assert inventory.get_stock('Beans') == {'Pantry': 1}
+    with client.session_transaction() as sess:
+        assert len(sess['cart']) == 2
+
+
+def test_kiosk_refuses_short_lines(app):
+    setup_pantry(apples=2)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['kiosk_client_id'] = 'C00001'
+        sess['kiosk_cart'] = [cart_line('Apples', 5)]
+    response = client.post('/kiosk/complete')
+    assert response.status_code == 302
+    assert response.location.endswith('/kiosk/categories')
+    assert inventory.get_stock('Apples') == {'Pantry': 2}
+
+
+def test_concurrent_checkouts_never_oversell(app):
+    global _app
+    _app = app
+    setup_pantry(apples=40, beans=25)
+
+    with multiprocessing.get_context('fork').Pool(8) as pool:
+        outcomes = [o for batch in pool.map(_checkout_in_worker, range(8)) for o in batch]
+
+    assert len(outcomes) == 240
+    assert [o for o in outcomes if o not in ('placed', 'short')] == []
+    assert 'short' in outcomes
+    assert outcomes.count('placed') == Order.query.count()
+
+    # Replay the ledger in write order: the pantry never went below zero
+    running = {'Apples': 0, 'Beans': 0}
+    for movement in Movement.query.order_by(Movement.id):
+        if movement.to_location == 'Pantry':
+            running[movement.product_id] += movement.qty
+        if movement.from_location == 'Pantry':
+            running[movement.product_id] -= movement.qty
+        assert running[movement.product_id] >= 0
+
+    for product_id, stocked in (('Apples', 40), ('Beans', 25)):
+        stock = inventory.get_stock(product_id)
+        assert stock['Pantry'] >= 0
+        assert stock['Pantry'] + stock['Reserved'] == stocked
+    reserved = sum(item['quantity'] for order in Order.query for item in order.get_items()
+                   if item['product_id'] == 'Beans')
+    assert reserved == inventory.get_location_qty('Beans', 'Reserved')
+    assert StockBalance.query.filter(StockBalance.qty < 0).count() == 0
+    assert inventory.check_balances() == []
@@ -0,0 +1,116 @@
+"""
+Tests for conditional GET (conditional.py): ETags, Last-Modified and 304s
+"""
+from sqlalchemy import update
+from database import db, bump_version, Client, Product, StockBalance, CATALOG_VERSION, STOCK_VERSION
+from test_grid import login_staff
+from test_inventory import move, record_queries
+
+
+def stock_shop(client):
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.add(Product(product_id='Kale', category='Vegetables', nutrition_score=40))
+    db.session.add(Product(product_id='Spinach', category='Vegetables', nutrition_score=90))
+    db.session.commit()
+    move('Kale', 5, to_location='Pantry')
+    move('Spinach', 5, to_location='Pantry')
+    client.post('/shop/login', data={'client_id': 'C00001'})
+
+
+def test_unchanged_category_page_is_a_304_without_a_render(client):
+    stock_shop(client)
+    first = client.get('/shop/category/Vegetables')
+    assert first.status_code == 200
+    assert first.headers['ETag'].startswith('"')  # Strong
+    assert 'no-cache' in first.headers['Cache-Control']
+
+    responses = []
+    statements = record_queries(lambda: responses.append(
+        client.get('/shop/category/Vegetables', headers={'If-None-Match': first.headers['ETag']})))
+    assert responses[0].status_code == 304
+    assert responses[0].data == b''
+    assert not [s for s in statements if 'stock_balances' in s or 'FROM products' in s]
+
+
+def test_stock_catalog_and_cart_changes_change_the_etag(client):
+    stock_shop(client)
+    etag = client.get('/shop/category/Vegetables').headers['ETag']
+
+    def revalidate():
+        return client.get('/shop/category/Vegetables', headers={'If-None-Match': etag})
+
+    assert revalidate().status_code == 304
+    move('Kale', 1, from_location='Pantry', to_location='Customer')
+    assert revalidate().status_code == 200
+
+    etag = client.get('/shop/category/Vegetables').headers['ETag']
+    product = Product.query.filter_by(product_id='Kale').one()
+    product.points = 3
+    db.session.commit()
+    assert revalidate().status_code == 200
+
+    etag = client.get('/shop/category/Vegetables').headers['ETag']
+    client.post('/shop/add-to-cart', json={'product_id': 'Kale'})
+    assert revalidate().status_code == 200
+
+
+def test_revalidation_sees_other_workers_commits_at_once(client):
+    stock_shop(client)
+    etag = client.get('/shop/category/Vegetables').headers['ETag']
+
+    def revalidate():
+        return client.get('/shop/category/Vegetables', headers={'If-None-Match': etag})
+
+    # Written through another connection, as another worker would: this
+    # process's cached versions are not told, and are inside their recheck time
+    with db.engine.begin() as connection:
+        connection.execute(update(StockBalance.__table__).values(qty=0))
+        bump_version(connection, STOCK_VERSION)
+    assert revalidate().status_code == 200
+
+    etag = client.get('/shop/category/Vegetables').headers['ETag']
+    with db.engine.begin() as connection:
+        connection.execute(update(Product.__table__).values(points=7))
+        bump_version(connection, CATALOG_VERSION)
+    assert revalidate().status_code == 200
+
+
+def test_healthier_swap_json_revalidates(client):
+    stock_shop(client)
+    first = client.get('/shop/healthier-swap/Kale')
+    assert first.json['alternatives'][0]['product_id'] == 'Spinach'
+    again = client.get('/shop/healthier-swap/Kale', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert 'Last-Modified' not in first.headers  # Depends on the client's allergens too
+
+
+def test_from_locations_honors_if_modified_since(client):
+    login_staff(client)
+    db.session.add(Product(product_id='Kale', category='Vegetables'))
+    db.session.commit()
+    move('Kale', 5, to_location='Pantry')
+
+    first = client.get('/movements/get-from-locations?productId=Kale')
+    assert first.json == {'Pantry': {'qty': 5}}
+    assert 'Last-Modified' in first.headers
+    since = client.get('/movements/get-from-locations?productId=Kale',
+                       headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert since.status_code == 304
+    assert since.headers['ETag'] == first.headers['ETag']
+
+    # POST is still accepted, and never answers 304
+    posted = client.post('/movements/get-from-locations', data={'productId': 'Kale'},
+                         headers={'If-None-Match': first.headers['ETag']})
+    assert posted.json == {'Pantry': {'qty': 5}}
+
+
+def test_old_modified_counter_rows_move_to_version_stamps(app):
+    from migrations import move_version_stamps
+    from database import Counter, VersionStamp, read_version
+    db.session.add(Counter(name='stock_modified', value=1700000000))
+    db.session.commit()
+    move_version_stamps()
+    db.session.commit()
+    assert Counter.query.filter_by(name='stock_modified').first() is None
+    assert db.session.get(VersionStamp, STOCK_VERSION).modified == 1700000000
+    assert read_version(STOCK_VERSION)[1].timestamp() == 1700000000
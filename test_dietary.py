@@ -0,0 +1,104 @@
+"""
+Tests for the dietary and allergen bitmasks (dietary.py)
+"""
+from sqlalchemy import text
+from database import db, Client, Product
+from migrations import add_dietary_masks
+import catalog
+import dietary
+from test_inventory import add_product, move, record_queries
+
+
+def add_dietary_product(name, indicators=(), allergens=(), category='Vegetables', nutrition_score=50):
+    product = Product(product_id=name, category=category, nutrition_score=nutrition_score)
+    product.set_dietary_indicators(list(indicators))
+    product.set_allergens(list(allergens))
+    db.session.add(product)
+    db.session.commit()
+    move(name, 5, to_location='Pantry')
+    return product
+
+
+def test_spellings_share_one_flag():
+    assert dietary.dietary_mask(['vegan', 'gluten-free']) == dietary.dietary_mask(['Vegan', 'Gluten Free'])
+    assert dietary.dietary_mask('["low-sodium"]') == dietary.dietary_mask(['Low Sodium'])
+    assert dietary.dietary_mask(['Paleo']) == 0
+    assert dietary.dietary_keys(dietary.dietary_mask(['Gluten-Free', 'Vegan'])) == ['vegan', 'gluten-free']
+    # Client form spellings map onto the product allergens
+    assert dietary.allergen_keys(dietary.allergen_mask(['Dairy', 'Nuts', 'Soy'])) == [
+        'milk', 'tree-nuts', 'peanuts', 'soybeans']
+    assert dietary.allergen_mask(['tree nuts']) == dietary.allergen_mask(['Tree Nuts'])
+
+
+def test_masks_follow_the_json(app):
+    product = add_dietary_product('Tofu', ['vegan'], ['soybeans'])
+    assert product.dietary_mask == dietary.dietary_mask(['vegan'])
+    product.set_dietary_indicators(['Vegan', 'Gluten-Free'])
+    product.set_allergens([])
+    db.session.commit()
+    assert product.dietary_mask == dietary.dietary_mask(['vegan', 'gluten-free'])
+    assert product.allergen_mask == 0
+
+    client = Client(client_id='C00001', name='Test Client')
+    client.set_allergens(['Soy'])
+    db.session.add(client)
+    db.session.commit()
+    assert client.allergen_mask == dietary.allergen_mask(['soybeans'])
+
+
+def test_backfill_sets_masks_from_existing_json(app):
+    add_dietary_product('Tofu', ['vegan'], ['soybeans'])
+    db.session.execute(text(
+        """UPDATE products SET dietary_indicators = '["Vegan", "gluten-free"]', dietary_mask = 0, allergen_mask = 0"""
+    ))
+    db.session.commit()
+    add_dietary_masks()
+    db.session.commit()
+    row = db.session.execute(text('SELECT dietary_mask, allergen_mask FROM products')).one()
+    assert row == (dietary.dietary_mask(['vegan', 'gluten-free']), dietary.allergen_mask(['soybeans']))
+
+
+def test_category_page_filters_mixed_spellings(client):
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.commit()
+    add_dietary_product('Kale', ['vegan', 'gluten-free'], nutrition_score=90)
+    add_dietary_product('Peas', ['Vegan'], nutrition_score=70)
+    add_dietary_product('Cheese Broccoli', ['Vegetarian'], ['milk'])
+    add_dietary_product('Satay Beans', ['Vegan', 'Gluten Free'], ['peanuts'], nutrition_score=60)
+    client.post('/shop/login', data={'client_id': 'C00001'})
+
+    def listed(query):
+        html = client.get('/shop/category/Vegetables' + query).get_data(as_text=True)
+        return [name for name in ('Kale', 'Peas', 'Cheese Broccoli', 'Satay Beans') if f'>{name}<' in html]
+
+    assert listed('?diet=vegan') == ['Kale', 'Peas', 'Satay Beans']
+    assert listed('?diet=Vegan&diet=gluten-free') == ['Kale', 'Satay Beans']
+    assert listed('?diet=vegan&avoid=Nuts') == ['Kale', 'Peas']
+    assert listed('?avoid=dairy') == ['Kale', 'Peas', 'Satay Beans']
+    assert listed('?diet=paleo') == []
+    assert listed('?diet=vegan&diet=paleo') == []
+    assert listed('?avoid=celery') == ['Kale', 'Peas', 'Cheese Broccoli', 'Satay Beans']
+    assert 'data-dietary="vegan"' in client.get('/shop/category/Vegetables').get_data(as_text=True)
+
+
+def test_filtered_listing_is_queried_once_per_version(app):
+    add_dietary_product('Kale', ['vegan'])
+    add_product('Ham', category='Vegetables')
+    vegan = dietary.dietary_mask(['vegan'])
+
+    statements = record_queries(lambda: [catalog.in_category('Vegetables', diet=vegan) for _ in range(3)])
+    assert len([s for s in statements if 'dietary_mask &' in s]) == 1
+    assert [p.product_id for p in catalog.in_category('Vegetables', diet=vegan)] == ['Kale']
+
+    add_dietary_product('Peas', ['vegan'])
+    assert [p.product_id for p in catalog.in_category('Vegetables', diet=vegan)] == ['Kale', 'Peas']
+
+
+def test_rows_inserted_without_masks_default_to_zero(app):
+    # Maintenance scripts may insert with plain SQL that predates the mask columns
+    db.session.execute(text("INSERT INTO products (product_id, category) VALUES ('Rice', 'Grains')"))
+    db.session.execute(text("INSERT INTO clients (client_id, name) VALUES ('C00001', 'Test Client')"))
+    db.session.commit()
+    product = Product.query.filter_by(product_id='Rice').one()
+    assert (product.dietary_mask, product.allergen_mask) == (0, 0)
+    assert Client.query.filter_by(client_id='C00001').one().allergen_mask == 0
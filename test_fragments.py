@@ -0,0 +1,86 @@
+"""
+Tests for the rendered-fragment cache (fragments.py) on the shopper pages
+"""
+import sys
+from database import db, Client, Product
+import fragments
+from fragments import FragmentCache
+from test_inventory import move, record_queries
+
+
+def test_least_recently_used_evicted_at_the_cap():
+    entry = 'x' * 1000
+    cache = FragmentCache(max_bytes=sys.getsizeof(entry) * 3)
+    for key in 'abc':
+        cache.put(key, entry)
+    assert cache.get('a') == entry  # a is now the most recently used
+    cache.put('d', entry)
+    assert cache.get('b') is None
+    assert [cache.get(key) is not None for key in 'acd'] == [True, True, True]
+    assert cache.size <= cache.max_bytes
+
+    cache.put('huge', 'y' * 10000)  # Bigger than the whole cache: not kept
+    assert cache.get('huge') is None
+    assert len(cache) == 3
+
+
+def test_render_only_on_a_miss():
+    cache = FragmentCache()
+    calls = []
+    render = lambda: calls.append(1) or '<b>grid</b>'
+    assert cache.get_or_render('k', render) == '<b>grid</b>'
+    assert cache.get_or_render('k', render) == '<b>grid</b>'
+    assert len(calls) == 1
+
+
+def shop_with_two_clients(client):
+    db.session.add(Client(client_id='C00001', name='Ann Shopper', points_per_visit=100))
+    db.session.add(Client(client_id='C00002', name='Bo Shopper', points_per_visit=40))
+    for name in ('Kale', 'Leeks'):
+        db.session.add(Product(product_id=name, category='Vegetables', points=2))
+    db.session.commit()
+    move('Kale', 5, to_location='Pantry')
+    move('Leeks', 3, to_location='Pantry')
+
+
+def test_category_grid_is_shared_between_clients(client, app):
+    shop_with_two_clients(client)
+    client.post('/shop/login', data={'client_id': 'C00001'})
+    first = client.get('/shop/category/Vegetables').get_data(as_text=True)
+    assert '<div class="remaining">100</div>' in first
+
+    other = app.test_client()
+    other.post('/shop/login', data={'client_id': 'C00002'})
+    responses = []
+    statements = record_queries(lambda: responses.append(other.get('/shop/category/Vegetables')))
+    html = responses[0].get_data(as_text=True)
+    assert 'Kale' in html and 'Leeks' in html
+    assert '<div class="remaining">40</div>' in html  # Bo's own points, rendered per request
+    assert not [s for s in statements if 'stock_balances' in s or 'FROM products' in s]
+    assert fragments.stats()['hits'] >= 1
+
+
+def test_stock_and_filters_get_their_own_fragments(client):
+    shop_with_two_clients(client)
+    client.post('/shop/login', data={'client_id': 'C00001'})
+    assert 'Available: 3' in client.get('/shop/category/Vegetables').get_data(as_text=True)
+
+    move('Leeks', 3, from_location='Pantry', to_location='Customer')
+    html = client.get('/shop/category/Vegetables').get_data(as_text=True)
+    assert 'Available: 3' not in html and 'Leeks' not in html
+
+    kale = Product.query.filter_by(product_id='Kale').one()
+    kale.set_dietary_indicators(['vegan'])
+    db.session.commit()
+    assert 'Kale' in client.get('/shop/category/Vegetables?diet=Vegan').get_data(as_text=True)
+    leeks = client.get('/shop/category/Vegetables?diet=gluten-free').get_data(as_text=True)
+    assert 'No items available in this category' in leeks
+
+
+def test_search_results_are_cached_per_query(client):
+    shop_with_two_clients(client)
+    client.post('/shop/login', data={'client_id': 'C00001'})
+    assert 'Found 1 item(s)' in client.get('/shop/search?q=kale').get_data(as_text=True)
+    statements = record_queries(lambda: client.get('/shop/search?q=kale'))
+    assert not [s for s in statements if 'products_fts' in s]
+    assert 'Found 1 item(s)' in client.get('/shop/search?q=KALE ').get_data(as_text=True)
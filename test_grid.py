@@ -0,0 +1,111 @@
+"""
+Tests for the server-side staff grid endpoint
+"""
+from database import db, Product, Client, Order, Movement
+
+
+def login_staff(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'admin'
+
+
+def grid_params(column, direction, start=0, length=10, search='', after=None, columns=('movement_id', 'product_id')):
+    params = {'draw': 1, 'start': start, 'length': length, 'search[value]': search,
+              'order[0][column]': columns.index(column), 'order[0][dir]': direction}
+    for i, name in enumerate(columns):
+        params[f'columns[{i}][data]'] = name
+    if after:
+        params['after'] = after
+    return params
+
+
+def add_movements(count):
+    db.session.add(Product(product_id='Apples'))
+    db.session.add(Product(product_id='Bananas'))
+    for i in range(count):
+        db.session.add(Movement(movement_id=1000 + i, product_id='Apples' if i % 3 else 'Bananas',
+                                qty=1, to_location='Pantry'))
+    db.session.commit()
+
+
+def test_grid_requires_staff_login(client):
+    assert client.get('/grid/movements').status_code == 401
+    login_staff(client)
+    assert client.get('/grid/nothing').status_code == 404
+
+
+def test_keyset_pages_match_offset_pages(client):
+    login_staff(client)
+    add_movements(25)
+
+    seen = []
+    cursor = None
+    for start in (0, 10, 20):
+        page = client.get('/grid/movements', query_string=grid_params('product_id', 'asc', start=start, after=cursor)).json
+        offset_page = client.get('/grid/movements', query_string=grid_params('product_id', 'asc', start=start)).json
+        assert page['data'] == offset_page['data']
+        assert page['recordsTotal'] == 25
+        seen.extend(row['movement_id'] for row in page['data'])
+        cursor = page['cursor']
+
+    assert len(seen) == len(set(seen)) == 25
+    products = [row['product_id'] for row in client.get(
+        '/grid/movements', query_string=grid_params('product_id', 'asc', length=25)).json['data']]
+    assert products == sorted(products)
+
+
+def test_keyset_pages_keep_rows_without_a_timestamp(client):
+    login_staff(client)
+    add_movements(25)
+    # Old rows whose movement_time could not be parsed have no created_at
+    Movement.query.filter(Movement.movement_id.in_([1003, 1008, 1011, 1012, 1020, 1024])).update(
+        {'created_at': None})
+    db.session.commit()
+
+    for direction in ('desc', 'asc'):
+        offset_page = client.get('/grid/movements', query_string=grid_params(
+            'movement_time', direction, length=25, columns=('movement_id', 'movement_time'))).json
+        seen = []
+        cursor = None
+        for start in range(0, 25, 4):  # Page boundaries fall inside the NULL rows either way
+            page = client.get('/grid/movements', query_string=grid_params(
+                'movement_time', direction, start=start, length=4, after=cursor,
+                columns=('movement_id', 'movement_time'))).json
+            seen.extend(row['movement_id'] for row in page['data'])
+            cursor = page['cursor']
+        assert seen == [row['movement_id'] for row in offset_page['data']]
+        assert len(set(seen)) == 25
+
+
+def test_cursor_from_another_sort_is_ignored(client):
+    login_staff(client)
+    add_movements(15)
+
+    first = client.get('/grid/movements', query_string=grid_params('movement_id', 'desc')).json
+    assert [row['movement_id'] for row in first['data']] == list(range(1014, 1004, -1))
+    mismatched = client.get('/grid/movements', query_string=grid_params(
+        'product_id', 'asc', start=0, after=first['cursor'])).json
+    assert len(mismatched['data']) == 10
+
+
+def test_search_filters_and_counts(client):
+    login_staff(client)
+    db.session.add(Client(client_id='C00001', name='Maria Garcia'))
+    db.session.add(Client(client_id='C00002', name='John Smith'))
+    db.session.add(Order(order_id=1, client_id='C00001', items='[]', total_points=5))
+    db.session.add(Order(order_id=2, client_id='C00002', items='[]', total_points=7))
+    db.session.commit()
+
+    page = client.get('/grid/orders', query_string=grid_params(
+        'order_id', 'asc', search='maria', columns=('order_id', 'client_name'))).json
+    assert page['recordsTotal'] == 2
+    assert page['recordsFiltered'] == 1
+    assert page['data'][0]['client_name'] == 'Maria Garcia'
+
+
+def test_staff_pages_render_without_rows(client):
+    login_staff(client)
+    for url in ('/movements/', '/orders/', '/clients/', '/products/', '/locations/'):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert b'data-grid=' in response.data
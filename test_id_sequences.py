@@ -0,0 +1,83 @@
+"""
+Tests for block-allocated ID sequences (Counter.get_next_id)
+"""
+import multiprocessing
+import pytest
+from database import db, Counter, ID_BLOCK_SIZE
+
+_app = None
+
+
+def _allocate_in_worker(count):
+    with _app.app_context():
+        db.engine.dispose(close=False)  # Never share the parent's SQLite connections
+        return [Counter.get_next_id('orders') for _ in range(count)]
+
+
+def test_ids_come_from_one_reserved_block(app):
+    start = Counter.get_current_id('orders')
+    ids = [Counter.get_next_id('orders') for _ in range(10)]
+    assert ids == list(range(start + 1, start + 11))
+    assert Counter.get_current_id('orders') == start + ID_BLOCK_SIZE
+
+    more = Counter.get_next_ids('orders', ID_BLOCK_SIZE)
+    assert more == list(range(start + 11, start + 11 + ID_BLOCK_SIZE))
+    assert Counter.get_current_id('orders') == start + 2 * ID_BLOCK_SIZE
+
+
+def test_sequences_are_independent(app):
+    orders = Counter.get_next_ids('orders', 3)
+    movements = Counter.get_next_ids('movements', 3)
+    assert orders == movements  # Both continue from the same seed
+    assert Counter.get_next_id('messages') == orders[0]
+
+
+def test_new_sequence_continues_from_main_counter(app):
+    main = Counter.query.filter_by(name='main').first()
+    if main is None:
+        db.session.add(Counter(name='main', value=5000))
+    else:
+        main.value = 5000
+    db.session.commit()
+    assert Counter.get_next_id('vouchers') == 5001
+
+
+def test_seeded_above_existing_ids(app):
+    from migrations import seed_id_sequences
+    from database import Client
+    db.session.add(Client(client_id='C09000', name='Existing'))
+    db.session.commit()
+    seed_id_sequences()
+    db.session.commit()
+    Counter.forget_blocks()
+    assert Counter.get_next_id('clients') == 9001
+
+
+def test_worker_processes_never_share_ids(app):
+    global _app
+    _app = app
+    parent_ids = [Counter.get_next_id('orders')]  # The forked children inherit this block
+
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        batches = pool.map(_allocate_in_worker, [120] * 8)
+    parent_ids.append(Counter.get_next_id('orders'))
+
+    all_ids = parent_ids + [i for batch in batches for i in batch]
+    assert len(all_ids) == len(set(all_ids))
+    for batch in batches:
+        assert batch == sorted(batch)
+
+
+def test_reserving_after_a_flush_is_refused(app):
+    from database import Product
+    db.session.add(Product(product_id='Apples'))
+    db.session.flush()  # The session now holds the write lock a block refill would wait on
+    with pytest.raises(RuntimeError):
+        Counter.get_next_id('orders')
+    db.session.commit()
+    assert Counter.get_next_id('orders')
+
+    db.session.add(Product(product_id='Pears'))
+    db.session.flush()
+    db.session.rollback()
+    assert Counter.get_next_id('orders')
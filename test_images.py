@@ -0,0 +1,276 @@
+"""
+Tests for product image derivatives (images.py)
+"""
+import hashlib
+import http.server
+import io
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+import pytest
+import catalog
+import images
+from database import db, Client, Product, RemoteImage, StoredImage
+from test_grid import login_staff
+from test_inventory import move
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def png_bytes(width, height, mode='RGBA'):
+    buffer = io.BytesIO()
+    Image.new(mode, (width, height), (200, 80, 40, 128) if mode == 'RGBA' else 'green').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def jpeg_bytes(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def uploads(app, tmp_path, monkeypatch):
+    """Uploads and derivatives go to a temporary static folder"""
+    folder = tmp_path / 'images' / 'products'
+    folder.mkdir(parents=True)
+    monkeypatch.setattr(app, 'static_folder', str(tmp_path))
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(folder))
+    return folder
+
+
+def test_widths_and_formats(tmp_path):
+    source = tmp_path / 'apple.png'
+    source.write_bytes(png_bytes(1200, 800))
+    assert images.make_derivatives(str(source)) == [240, 480, 960]
+
+    sized = tmp_path / images.SIZED_DIR / 'apple'
+    for width in (240, 480, 960):
+        for fmt in ('webp', 'jpg'):
+            with Image.open(sized / f'{width}.{fmt}') as derivative:
+                assert derivative.size == (width, width * 2 // 3)
+                assert derivative.mode == 'RGB'
+    assert json.loads((sized / images.MANIFEST).read_text())['widths'] == [240, 480, 960]
+
+
+def test_small_images_are_not_scaled_up(tmp_path):
+    source = tmp_path / 'pear.png'
+    source.write_bytes(png_bytes(300, 300, 'RGB'))
+    assert images.make_derivatives(str(source)) == [240, 300]
+
+
+def test_variants_only_once_derivatives_exist(uploads):
+    source = uploads / 'kale.png'
+    source.write_bytes(png_bytes(1000, 500))
+    assert images.image_variants('/static/images/products/kale.png', str(uploads.parent.parent)) is None
+    assert images.image_variants('https://example.com/kale.png') is None
+
+    images.make_derivatives(str(source))
+    variants = images.image_variants('/static/images/products/kale.png', str(uploads.parent.parent))
+    assert variants['webp'] == ('/static/images/products/sized/kale/240.webp 240w, '
+                                '/static/images/products/sized/kale/480.webp 480w, '
+                                '/static/images/products/sized/kale/960.webp 960w')
+    assert variants['src'] == '/static/images/products/sized/kale/480.jpg'
+
+
+def test_upload_is_resized_in_the_background_and_shown_with_srcset(client, app, uploads, monkeypatch):
+    jobs = []
+    submit = images.submit
+    monkeypatch.setattr(images, 'submit', lambda *args: jobs.append(args))  # Held back until the page is stocked
+    login_staff(client)
+    client.post('/products/', data={'product_name': 'Kale', 'category': 'Vegetables',
+                                    'product_image': (io.BytesIO(png_bytes(1200, 900)), 'kale.png')},
+                content_type='multipart/form-data')
+    product = Product.query.filter_by(product_id='Kale').one()
+    assert product.image_url.startswith('/static/images/products/')
+    move('Kale', 3, to_location='Pantry')
+    version = catalog.version()
+
+    submit(*jobs[0]).result(timeout=30)
+    db.session.remove()
+    catalog.invalidate()
+    assert catalog.version() > version  # Pages rendered before the derivatives are rebuilt
+
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.commit()
+    client.post('/shop/login', data={'client_id': 'C00001'})
+    stem = os.path.splitext(os.path.basename(product.image_url))[0]
+    page = client.get('/shop/category/Vegetables').get_data(as_text=True)
+    assert f'/static/images/products/sized/{stem}/240.webp 240w' in page
+    assert 'type="image/webp"' in page
+
+
+def test_backfill_skips_images_already_done(tmp_path):
+    (tmp_path / 'a.png').write_bytes(png_bytes(500, 500))
+    (tmp_path / 'b.jpg').write_bytes(b'not an image')
+    (tmp_path / 'notes.txt').write_text('ignored')
+    assert images.backfill(str(tmp_path)) == 2
+    assert (tmp_path / images.SIZED_DIR / 'a' / images.MANIFEST).exists()
+    assert not (tmp_path / images.SIZED_DIR / 'b' / images.MANIFEST).exists()
+    assert images.backfill(str(tmp_path)) == 1  # Only the unreadable one is retried
+
+
+def add_with_image(client, name, content, filename='photo.png'):
+    return client.post('/products/', data={'product_name': name, 'category': 'Vegetables',
+                                           'product_image': (io.BytesIO(content), filename)},
+                       content_type='multipart/form-data')
+
+
+def test_same_photo_is_stored_once(client, uploads, monkeypatch):
+    monkeypatch.setattr(images, 'submit', lambda *args: None)
+    login_staff(client)
+    photo = png_bytes(400, 300)
+    add_with_image(client, 'Kale', photo, 'kale.png')
+    add_with_image(client, 'Chard', photo, 'IMG_0001.PNG')
+    add_with_image(client, 'Leek', png_bytes(400, 300, 'RGB'), 'leek.png')
+
+    urls = {p.product_id: p.image_url for p in Product.query}
+    assert urls['Kale'] == urls['Chard'] == f'/static/images/products/{hashlib.sha256(photo).hexdigest()}.png'
+    assert urls['Leek'] != urls['Kale']
+    assert sorted(os.listdir(uploads)) == sorted(os.path.basename(url) for url in {urls['Kale'], urls['Leek']})
+    assert StoredImage.query.count() == 2
+
+
+def test_gc_removes_images_no_product_uses(client, app, uploads, monkeypatch):
+    monkeypatch.setattr(images, 'submit', lambda *args: None)
+    login_staff(client)
+    add_with_image(client, 'Kale', png_bytes(400, 300))
+    add_with_image(client, 'Leek', png_bytes(400, 300, 'RGB'))
+    kale = Product.query.filter_by(product_id='Kale').one()
+    old = os.path.basename(kale.image_url)
+    images.make_derivatives(str(uploads / old))
+    kale.image_url = 'https://example.com/kale.jpg'  # Replaced by a remote image
+    db.session.commit()
+    (uploads / 'notes.txt').write_text('not an image')
+
+    assert images.collect_garbage(str(uploads)) == (0, 0)  # Still within the grace period
+    removed, freed = images.collect_garbage(str(uploads), grace=timedelta(0), dry_run=True)
+    assert removed == 1 and (uploads / old).exists()
+
+    assert images.collect_garbage(str(uploads), grace=timedelta(0))[0] == 1
+    leek = os.path.basename(Product.query.filter_by(product_id='Leek').one().image_url)
+    assert sorted(os.listdir(uploads)) == sorted([leek, 'notes.txt', images.SIZED_DIR])
+    assert not (uploads / images.SIZED_DIR / os.path.splitext(old)[0]).exists()
+    assert [row.filename for row in StoredImage.query] == [leek]
+
+
+def test_gc_keeps_new_files_whose_row_is_not_committed_yet(app, uploads):
+    (uploads / 'f00d.png').write_bytes(png_bytes(200, 200))  # store_image wrote it; the product has not committed
+    assert images.collect_garbage(str(uploads)) == (0, 0)
+    assert (uploads / 'f00d.png').exists()
+
+    old = time.time() - images.GC_GRACE.total_seconds() - 60
+    os.utime(uploads / 'f00d.png', (old, old))
+    assert images.collect_garbage(str(uploads))[0] == 1
+    assert not (uploads / 'f00d.png').exists()
+
+
+def test_gc_deduplicates_images_uploaded_before_the_store(app, uploads):
+    photo = png_bytes(200, 200)
+    for name in ('0f1e.jpg', '9a8b.jpg'):
+        (uploads / name).write_bytes(photo)
+        db.session.add(Product(product_id=name, category='Vegetables', image_url=f'/static/images/products/{name}'))
+    db.session.commit()
+
+    images.collect_garbage(str(uploads), grace=timedelta(0))
+    assert {p.image_url for p in Product.query} == {'/static/images/products/0f1e.jpg'}
+    assert os.listdir(uploads) == ['0f1e.jpg']
+    assert StoredImage.query.one().sha256 == hashlib.sha256(photo).hexdigest()
+
+
+@pytest.fixture
+def remote():
+    """A local stand-in for a remote image host: {path: (content type, body)}, plus a request log"""
+    files, requests = {}, []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            if self.path not in files:
+                self.send_error(404)
+                return
+            content_type, body = files[self.path]
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    yield base, files, requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_remote_images_are_fetched_once_and_products_repointed(app, uploads, remote, monkeypatch):
+    monkeypatch.setattr(images, 'submit', lambda *args: None)
+    base, files, requests = remote
+    photo = png_bytes(640, 480, 'RGB')
+    files['/kale.png'] = ('image/png', photo)
+    files['/page.html'] = ('text/html', b'<html></html>')
+    for name, url in [('Kale', '/kale.png'), ('Curly Kale', '/kale.png'), ('Leek', '/missing.jpg'),
+                      ('Chard', '/page.html'), ('Beet', '')]:
+        db.session.add(Product(product_id=name, category='Vegetables', image_url=base + url if url else ''))
+    db.session.commit()
+    version = catalog.version()
+
+    assert images.mirror_products(upload_folder=str(uploads)) == 2
+    local = f'/static/images/products/{hashlib.sha256(photo).hexdigest()}.png'
+    urls = {p.product_id: p.image_url for p in Product.query}
+    assert urls['Kale'] == urls['Curly Kale'] == local
+    assert urls['Leek'] == base + '/missing.jpg' and urls['Chard'] == base + '/page.html'
+    assert requests.count('/kale.png') == 1
+    assert (uploads / os.path.basename(local)).read_bytes() == photo
+    catalog.invalidate()
+    assert catalog.version() > version
+
+    failed = db.session.get(RemoteImage, base + '/page.html')
+    assert failed.failures == 1 and 'not an image' in failed.last_error
+
+    # Known copies need no fetch; failures wait for their backoff
+    requests.clear()
+    db.session.add(Product(product_id='Baby Kale', category='Vegetables', image_url=base + '/kale.png'))
+    db.session.commit()
+    assert images.mirror_products(upload_folder=str(uploads)) == 1
+    assert requests == []
+    images.mirror_products(upload_folder=str(uploads), retry=True)
+    assert sorted(requests) == ['/missing.jpg', '/page.html']
+
+
+def test_mirrored_images_survive_gc(app, uploads, remote, monkeypatch):
+    monkeypatch.setattr(images, 'submit', lambda *args: None)
+    base, files, requests = remote
+    files['/placeholder.png'] = ('image/png', png_bytes(300, 300))
+    local = images.mirror([base + '/placeholder.png'], str(uploads))[base + '/placeholder.png']
+    assert images.collect_garbage(str(uploads), grace=timedelta(0)) == (0, 0)
+    assert (uploads / os.path.basename(local)).exists()
+
+
+def test_pages_queue_remote_images_and_then_use_the_copy(client, app, uploads, remote, monkeypatch):
+    monkeypatch.setattr(images, 'submit', lambda *args: None)
+    monkeypatch.setitem(app.config, 'MIRROR_REMOTE_IMAGES', True)
+    jobs = []
+    mirror_later = images.mirror_later
+    monkeypatch.setattr(images, 'mirror_later', lambda *args: jobs.append(mirror_later(*args)))
+    base, files, requests = remote
+    files['/kale.jpg'] = ('image/jpeg', jpeg_bytes(400, 300))
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.add(Product(product_id='Kale', category='Vegetables', image_url=base + '/kale.jpg'))
+    db.session.commit()
+    move('Kale', 3, to_location='Pantry')
+    client.post('/shop/login', data={'client_id': 'C00001'})
+
+    assert f'src="{base}/kale.jpg"' in client.get('/shop/category/Vegetables').get_data(as_text=True)
+    jobs[0].result(timeout=30)
+    db.session.remove()
+    catalog.invalidate()
+    page = client.get('/shop/category/Vegetables').get_data(as_text=True)
+    assert base not in page
+    assert Product.query.one().image_url.startswith('/static/images/products/')
@@ -0,0 +1,226 @@
+"""
+Tests for the stock_balances table and the inventory service
+"""
+from database import db, Product, Movement, StockBalance, Counter
+import inventory
+
+
+def add_product(name, category='Fruits', points=1, nutrition_score=50):
+    product = Product(product_id=name, category=category, points=points, nutrition_score=nutrition_score)
+    db.session.add(product)
+    db.session.commit()
+    return product
+
+
+def move(product_id, qty, from_location=None, to_location=None):
+    movement = Movement(movement_id=Counter.get_next_id('movements'), product_id=product_id, qty=qty,
+                        from_location=from_location, to_location=to_location)
+    db.session.add(movement)
+    db.session.commit()
+    return movement
+
+
+def test_balances_follow_movement_writes(app):
+    add_product('Apples')
+    receive = move('Apples', 50, to_location='Pantry')
+    reserve = move('Apples', 5, from_location='Pantry', to_location='Reserved')
+    assert inventory.get_stock('Apples') == {'Pantry': 45, 'Reserved': 5}
+
+    reserve.qty = 8
+    reserve.to_location = 'Customer'
+    db.session.commit()
+    assert inventory.get_stock('Apples') == {'Pantry': 42, 'Reserved': 0, 'Customer': 8}
+
+    db.session.delete(receive)
+    db.session.commit()
+    assert inventory.get_location_qty('Apples', 'Pantry') == -8
+    assert inventory.check_balances() == []
+
+
+def test_movement_routes_keep_balances(client):
+    add_product('Rice', category='Grains')
+    client.post('/movements/', data={'productId': 'Rice', 'qty': '20', 'fromLocation': '', 'toLocation': 'Pantry'})
+    assert inventory.get_stock('Rice') == {'Pantry': 20}
+
+    movement = Movement.query.filter_by(product_id='Rice').first()
+    client.post(f'/update-movement/{movement.movement_id}',
+                data={'productId': 'Rice', 'qty': '12', 'fromLocation': '', 'toLocation': 'Pantry'})
+    assert inventory.get_stock('Rice') == {'Pantry': 12}
+
+    client.get(f'/delete-movement/{movement.movement_id}')
+    assert inventory.get_stock('Rice') == {'Pantry': 0}
+    assert inventory.check_balances() == []
+
+
+def test_rebuild_repairs_drifted_balances(app):
+    add_product('Beans', category='Proteins')
+    move('Beans', 30, to_location='Pantry')
+    move('Beans', 4, from_location='Pantry', to_location='Customer')
+
+    StockBalance.query.filter_by(product_id='Beans', location_id='Pantry').update({'qty': 99})
+    db.session.commit()
+    assert inventory.check_balances() == [('Beans', 'Pantry', 99, 26)]
+
+    inventory.rebuild_balances()
+    assert inventory.check_balances() == []
+    assert inventory.get_stock('Beans') == {'Pantry': 26, 'Customer': 4}
+
+
+def test_product_balance_report_with_interleaved_movements(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'admin'
+    add_product('Milk', category='Dairy')
+    add_product('Eggs', category='Dairy')
+    move('Milk', 10, to_location='Pantry')
+    move('Eggs', 12, to_location='Pantry')
+    move('Milk', 3, from_location='Pantry', to_location='Reserved')
+
+    levels = inventory.get_stock_levels()
+    assert levels['Milk'] == {'Pantry': 7, 'Reserved': 3}
+    assert levels['Eggs'] == {'Pantry': 12}
+
+    response = client.get('/product-balance/')
+    assert response.status_code == 200
+    assert b'Reserved' in response.data
+
+
+def test_balance_rows_filter_in_sql(app):
+    add_product('Carrots', category='Vegetables')
+    add_product('Yogurt', category='Dairy')
+    move('Carrots', 30, to_location='Pantry')
+    move('Yogurt', 5, to_location='Pantry')
+    move('Carrots', 2, from_location='Pantry', to_location='Reserved')
+
+    def rows(**filters):
+        return [tuple(row) for row in inventory.iter_balance_rows(chunk_size=1, **filters)]
+
+    assert rows() == [('Carrots', 'Vegetables', 'Pantry', 28), ('Carrots', 'Vegetables', 'Reserved', 2),
+                      ('Yogurt', 'Dairy', 'Pantry', 5)]
+    assert rows(location='Pantry', min_qty=6) == [('Carrots', 'Vegetables', 'Pantry', 28)]
+    assert rows(category='Dairy') == [('Yogurt', 'Dairy', 'Pantry', 5)]
+    assert rows(max_qty=5) == [('Carrots', 'Vegetables', 'Reserved', 2), ('Yogurt', 'Dairy', 'Pantry', 5)]
+    assert rows(before=inventory.parse_as_of('2999-12-31'), location='Reserved') == [
+        ('Carrots', 'Vegetables', 'Reserved', 2)
+    ]
+
+
+def test_product_balance_csv_download(client):
+    add_product('Bread', category='Grains')
+    move('Bread', 9, to_location='Pantry')
+
+    response = client.get('/product-balance/csv?category=Grains')
+    assert response.mimetype == 'text/csv'
+    assert response.get_data(as_text=True).splitlines() == ['product,category,location,qty', 'Bread,Grains,Pantry,9']
+
+
+def record_queries(func):
+    """Run func and return the SQL statements it issued, on the writer and the read pool"""
+    from sqlalchemy import event
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', record)
+    try:
+        func()
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', record)
+    return statements
+
+
+def count_queries(app, func):
+    """Run func and return how many SQL statements it issued"""
+    return len(record_queries(func))
+
+
+def test_availability_counts_only_unreserved_pantry_stock(app):
+    add_product('Oats', category='Grains')
+    add_product('Pasta', category='Grains')
+    move('Oats', 10, to_location='Pantry')
+    move('Oats', 4, from_location='Pantry', to_location='Reserved')
+    move('Oats', 2, from_location='Reserved', to_location='Customer')
+
+    assert inventory.get_availability(['Oats', 'Pasta', 'Unknown']) == {'Oats': 6, 'Pasta': 0, 'Unknown': 0}
+
+
+def test_category_page_query_count_does_not_grow_with_products(client):
+    from database import Client
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.commit()
+    client.post('/shop/login', data={'client_id': 'C00001'})
+
+    def category_page_queries(count):
+        for i in range(count):
+            add_product(f'Vegetable {count}-{i}', category='Vegetables')
+            move(f'Vegetable {count}-{i}', 5, to_location='Pantry')
+        db.session.remove()
+        responses = []
+        queries = count_queries(client.application, lambda: responses.append(client.get('/shop/category/Vegetables')))
+        assert responses[0].status_code == 200
+        assert f'Vegetable {count}-0'.encode() in responses[0].data
+        return queries
+
+    few = category_page_queries(2)
+    many = category_page_queries(20)
+    assert few == many
+
+
+def test_snapshot_plus_later_movements_gives_balance_as_of(app):
+    from datetime import datetime
+    from database import StockSnapshot
+    add_product('Soup', category='Other')
+    september = move('Soup', 40, to_location='Pantry')
+    september.created_at = datetime(2026, 9, 15, 10, 0)
+    db.session.commit()
+    inventory.take_snapshot()
+    StockSnapshot.query.update({'taken_at': datetime(2026, 9, 20, 9, 0)})
+    db.session.commit()
+
+    late_september = move('Soup', 5, from_location='Pantry', to_location='Customer')
+    late_september.created_at = datetime(2026, 9, 30, 16, 0)
+    october = move('Soup', 10, from_location='Pantry', to_location='Customer')
+    october.created_at = datetime(2026, 10, 2, 11, 0)
+    db.session.commit()
+
+    assert inventory.get_stock_levels_as_of(inventory.parse_as_of('2026-09-30')) == {
+        'Soup': {'Pantry': 35, 'Customer': 5}
+    }
+    assert inventory.get_stock_levels_as_of(inventory.parse_as_of('2026-09-01')) == {}
+    assert inventory.get_stock('Soup') == {'Pantry': 25, 'Customer': 15}
+    assert inventory.check_balances() == []
+
+
+def test_editing_history_discards_stale_snapshots(app):
+    from database import StockSnapshot
+    add_product('Tea', category='Other')
+    receive = move('Tea', 10, to_location='Pantry')
+    inventory.take_snapshot()
+    move('Tea', 3, to_location='Pantry')
+    inventory.take_snapshot()
+    assert StockSnapshot.query.count() == 2
+
+    receive.qty = 12
+    db.session.commit()
+    assert StockSnapshot.query.count() == 0
+    assert inventory.check_balances() == []
+    assert inventory.take_snapshot().lines[0].qty == 15
+
+
+def test_product_balance_report_as_of(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 'admin'
+    add_product('Honey', category='Other')
+    move('Honey', 7, to_location='Pantry')
+
+    assert b'Honey' in client.get('/product-balance/?as_of=2999-01-01').data
+    assert b'Honey' not in client.get('/product-balance/?as_of=2000-01-01').data
+    page = client.get('/product-balance/?as_of=not-a-date&min_qty=lots').get_data(as_text=True)
+    assert 'Honey' in page
+    assert 'Invalid date &#39;not-a-date&#39;, showing current inventory' in page
+    assert 'Invalid quantity &#39;lots&#39; ignored' in page
+    with client.session_transaction() as sess:
+        assert '_flashes' not in sess
@@ -0,0 +1,82 @@
+"""
+Query-plan regression test: every hot route query must be answered from an
+index, never by a full table scan
+"""
+import re
+import pytest
+from sqlalchemy import func, select
+from database import db, Product, Client, Movement, Order, StaffMessage, StockBalance, StockSnapshot, StockSnapshotLine
+from inventory import AVAILABLE_LOCATIONS
+import dietary
+import grid
+
+HOT_QUERIES = {
+    'category page': lambda: select(Product).where(Product.category == 'Fruits')
+        .order_by(Product.nutrition_score.desc()),
+    'healthier swap': lambda: select(Product).where(
+        Product.category == 'Fruits', Product.nutrition_score > 50, Product.product_id != 'Apples'
+    ).order_by(Product.nutrition_score.desc()),
+    'diet filter': lambda: select(Product.product_id).where(
+        Product.category == 'Fruits', dietary.has_all(Product.dietary_mask, 5), dietary.has_none(Product.allergen_mask, 32)
+    ),
+    'product lookup': lambda: select(Product).where(Product.product_id == 'Apples'),
+    'client lookup': lambda: select(Client).where(Client.client_id == 'C00001'),
+    'availability': lambda: select(StockBalance.product_id, func.sum(StockBalance.qty))
+        .where(StockBalance.product_id.in_(['Apples', 'Bananas']), StockBalance.location_id.in_(AVAILABLE_LOCATIONS))
+        .group_by(StockBalance.product_id),
+    'product stock': lambda: select(StockBalance).where(StockBalance.product_id == 'Apples'),
+    'movements by product': lambda: select(Movement).where(Movement.product_id == 'Apples'),
+    'movements from location': lambda: select(Movement).where(Movement.from_location == 'Pantry'),
+    'movements to location': lambda: select(Movement).where(Movement.to_location == 'Customer'),
+    'movements since snapshot': lambda: select(Movement).where(Movement.id > 100),
+    'latest snapshot': lambda: select(StockSnapshot).where(StockSnapshot.taken_at < '2026-10-01')
+        .order_by(StockSnapshot.watermark.desc()).limit(1),
+    'snapshot lines': lambda: select(StockSnapshotLine).where(StockSnapshotLine.snapshot_id == 1),
+    'pending orders': lambda: select(func.count()).select_from(Order).where(Order.status == 'Pending'),
+    'recent orders': lambda: select(Order).order_by(Order.created_at.desc()).limit(10),
+    'client order history': lambda: select(Order).where(Order.client_id == 'C00001')
+        .order_by(Order.created_at.desc()),
+    'deliveries': lambda: select(Order).where(Order.fulfillment_method == 'Delivery')
+        .order_by(Order.created_at.desc()),
+    'order lookup': lambda: select(Order).where(Order.order_id == 101),
+    'unread messages': lambda: select(func.count()).select_from(StaffMessage).where(StaffMessage.is_read == False),
+    'messages newest first': lambda: select(StaffMessage).order_by(StaffMessage.created_at.desc()),
+    'messages by client': lambda: select(StaffMessage).where(StaffMessage.client_id == 'C00001'),
+}
+
+# Every grid sort column, paged the way grid.query_grid pages it. Sorting by
+# the primary key walks the table b-tree in order, which SQLite reports as a
+# SCAN but stops after one page, so those are left out.
+for _name, _grid in grid.GRIDS.items():
+    for _column_name, _column in _grid.sort_columns.items():
+        if _column is _grid.model.id:
+            continue
+        HOT_QUERIES[f'{_name} grid by {_column_name}'] = (
+            lambda g=_grid, c=_column: select(g.model).order_by(c.desc(), g.model.id.desc()).limit(25)
+        )
+
+FULL_SCAN = re.compile(r'\bSCAN (\w+)$')
+
+
+def query_plan(stmt):
+    sql = str(stmt.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    return [row[3] for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+
+@pytest.mark.parametrize('name', sorted(HOT_QUERIES))
+def test_hot_query_uses_an_index(app, name):
+    tables = set(db.metadata.tables)
+    plan = query_plan(HOT_QUERIES[name]())
+    scans = [step for step in plan if FULL_SCAN.search(step) and FULL_SCAN.search(step).group(1) in tables]
+    assert not scans, f'{name} falls back to a full table scan: {plan}'
+
+
+def test_ordered_queries_need_no_sort_step(app):
+    for name in ('category page', 'client order history', 'deliveries', 'recent orders'):
+        plan = query_plan(HOT_QUERIES[name]())
+        assert not any('TEMP B-TREE' in step for step in plan), f'{name} sorts in a temp b-tree: {plan}'
+
+
+def test_diet_filter_is_answered_from_the_index(app):
+    plan = query_plan(HOT_QUERIES['diet filter']())
+    assert any('COVERING INDEX ix_products_category_diet' in step for step in plan), plan
@@ -0,0 +1,145 @@
+"""
+Tests for full-text product search (search.py)
+"""
+import os
+import random
+import tempfile
+import time
+from database import db, Client, Product
+import search
+from test_inventory import move, record_queries
+from test_startup import run_python
+
+# Best of three searches on a 100k-product catalog. Measured at 1 to 10 ms.
+SEARCH_BUDGET_SECONDS = 0.020
+
+
+def add_searchable_product(name, description='', category='Pantry Staples', nutrition_score=50, stock=5):
+    db.session.add(Product(product_id=name, description=description, category=category,
+                           nutrition_score=nutrition_score))
+    db.session.commit()
+    if stock:
+        move(name, stock, to_location='Pantry')
+
+
+def found(query):
+    return [product_id for product_id, available in search.search_products(query)]
+
+
+def test_match_expression_keeps_only_words():
+    assert search.match_expression('Peanut butt') == '"peanut"* "butt"*'
+    assert search.match_expression('"beans" OR NEAR(') == '"beans"* "or"* "near"*'
+    assert search.match_expression(' *- ') is None
+
+
+def test_ranked_prefix_and_multi_word_matches(app):
+    add_searchable_product('Black Beans', 'Canned beans, low sodium')
+    add_searchable_product('Rice', 'Long grain rice, pairs well with black beans')
+    add_searchable_product('Peanut Butter', 'Creamy peanut butter')
+    add_searchable_product('Crème Fraîche', 'Cultured cream', category='Dairy')
+
+    assert found('beans') == ['Black Beans', 'Rice']  # Name hits outrank description hits
+    assert found('bla bea') == ['Black Beans', 'Rice']
+    assert found('peanut butter') == ['Peanut Butter']
+    assert found('creme') == ['Crème Fraîche']
+    assert found('dairy') == ['Crème Fraîche']
+    assert found('beans peanut') == []
+
+
+def test_only_products_in_stock_are_returned(app):
+    add_searchable_product('Black Beans', stock=3)
+    add_searchable_product('Pinto Beans', stock=0)
+    add_searchable_product('Kidney Beans', stock=2)
+    move('Kidney Beans', 2, from_location='Pantry', to_location='Customer')
+
+    assert search.search_products('beans') == [('Black Beans', 3)]
+
+
+def test_in_stock_matches_beyond_the_ranked_window_are_found(app):
+    for i in range(search.WINDOW_FACTOR + 1):
+        add_searchable_product(f'Beans {i}', stock=0)
+    add_searchable_product('Rice', 'Goes with beans')  # Ranked below every name match
+
+    assert search.search_products('beans', limit=1) == [('Rice', 5)]
+
+
+def test_index_follows_product_changes(app):
+    add_searchable_product('Black Beans', stock=0)
+    product = Product.query.filter_by(product_id='Black Beans').one()
+    product.description = 'Organic'
+    db.session.commit()
+    assert search.match_expression('organic')
+    assert db.session.execute(db.text(
+        "SELECT rowid FROM products_fts WHERE products_fts MATCH 'organic'")).scalar() == product.id
+
+    db.session.delete(product)
+    db.session.commit()
+    assert db.session.execute(db.text(
+        "SELECT rowid FROM products_fts WHERE products_fts MATCH 'organic'")).scalar() is None
+
+
+def test_search_page_is_one_query(client):
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.commit()
+    add_searchable_product('Black Beans', nutrition_score=40)
+    add_searchable_product('Beans and Rice', nutrition_score=90)
+    client.post('/shop/login', data={'client_id': 'C00001'})
+
+    responses = []
+    statements = record_queries(lambda: responses.append(client.get('/shop/search?q=beans')))
+    html = responses[0].get_data(as_text=True)
+    assert html.index('Black Beans') < html.index('Beans and Rice')  # Relevance, not nutrition score
+    assert len([s for s in statements if 'products_fts' in s]) == 1
+    assert not [s for s in statements if 'stock_balances' in s and 'products_fts' not in s]
+
+
+def test_search_within_budget_on_large_catalog(app):
+    rng = random.Random(14)
+    # Two of 200 food words per name, so a common word names about 1,000 products
+    foods = ['apple', 'banana', 'black', 'bean', 'rice', 'pasta', 'peanut', 'butter', 'soup', 'tomato',
+             'corn', 'oat', 'milk', 'cheese', 'bread', 'tuna', 'chicken', 'lentil', 'carrot', 'pea']
+    foods += [f'food{i}' for i in range(180)]
+    words = foods + [f'term{i}' for i in range(5000)]
+    categories = ['Fruits', 'Vegetables', 'Grains', 'Proteins', 'Dairy']
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            'INSERT INTO products (product_id, category, description, nutrition_score, dietary_mask, allergen_mask) '
+            'VALUES (?, ?, ?, ?, 0, 0)',
+            [(f'{" ".join(rng.sample(foods, 2))} {i}', rng.choice(categories),
+              ' '.join(rng.choices(words, k=10)), rng.randint(0, 100)) for i in range(100000)]
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO stock_balances (product_id, location_id, qty) "
+            "SELECT product_id, 'Pantry', id % 3 FROM products"
+        )
+
+    for query in ('peanut butter', 'chick', 'term42 rice', 'dairy tuna'):
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            results = search.search_products(query)
+            timings.append(time.perf_counter() - started)
+        assert results, query
+        assert min(timings) < SEARCH_BUDGET_SECONDS, f'{query!r} took {timings} s'
+
+
+def test_create_all_builds_the_index_without_importing_search():
+    # Maintenance scripts rebuild tables with only the models imported
+    path = os.path.join(tempfile.mkdtemp(), 'rebuilt.db')
+    output = run_python(
+        'import os, sys\n'
+        'from flask import Flask\n'
+        'from database import db, Product\n'
+        'app = Flask(__name__)\n'
+        'app.config["SQLALCHEMY_DATABASE_URI"] = os.environ["DATABASE_URL"]\n'
+        'db.init_app(app)\n'
+        'with app.app_context():\n'
+        '    db.drop_all()\n'
+        '    db.create_all()\n'
+        '    db.session.add(Product(product_id="Black Beans"))\n'
+        '    db.session.commit()\n'
+        '    hits = db.session.execute(db.text("SELECT COUNT(*) FROM products_fts WHERE products_fts MATCH \'beans\'")).scalar()\n'
+        '    print("search" in sys.modules, hits)',
+        'sqlite:///' + path
+    )
+    assert output == 'False 1'
@@ -0,0 +1,88 @@
+"""
+Tests for the production server entry point (serve.py)
+"""
+import json
+import os
+import queue
+import re
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import pytest
+import serve
+
+
+def test_worker_count_follows_cpus(monkeypatch):
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+    assert serve.default_workers() == 9
+    monkeypatch.setenv('WEB_CONCURRENCY', '3')
+    assert serve.default_workers() == 3
+
+
+def test_server_options_preload_the_app():
+    options = serve.server_options('127.0.0.1:9000', workers=2, threads=4)
+    assert options['preload_app'] is True
+    assert options['workers'] == 2
+    assert options['worker_class'] == 'gthread'
+    assert options['post_fork'] is serve.post_fork
+
+
+def test_health_endpoint(client):
+    response = client.get('/healthz')
+    assert response.status_code == 200
+    assert response.json['status'] == 'ok'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def health(port):
+    with urllib.request.urlopen(f'http://127.0.0.1:{port}/healthz', timeout=5) as response:
+        return json.loads(response.read())
+
+
+def test_serve_forks_workers_and_reloads_on_hup():
+    pytest.importorskip('gunicorn')
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'serve.db'))
+    server = subprocess.Popen(
+        [sys.executable, 'serve.py', '--bind', f'127.0.0.1:{port}', '--workers', '2'],
+        cwd=os.path.dirname(os.path.abspath(serve.__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    lines = queue.Queue()
+    threading.Thread(target=lambda: [lines.put(line) for line in server.stderr], daemon=True).start()
+
+    def booted_workers(count):
+        pids = set()
+        deadline = time.monotonic() + 30
+        while len(pids) < count:
+            line = lines.get(timeout=max(deadline - time.monotonic(), 0.1))
+            match = re.search(r'Booting worker with pid: (\d+)', line)
+            if match:
+                pids.add(int(match.group(1)))
+        return pids
+
+    try:
+        first = booted_workers(2)
+        assert health(port)['pid'] in first
+
+        server.send_signal(signal.SIGHUP)
+        second = booted_workers(2)
+        assert not first & second
+        deadline = time.monotonic() + 30
+        while health(port)['pid'] not in second:
+            assert time.monotonic() < deadline
+            time.sleep(0.2)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
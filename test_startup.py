@@ -0,0 +1,53 @@
+"""
+Startup benchmark: importing the app factory, building an app and answering
+the first request must stay within a fixed budget, and none of it may do
+schema work
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from database import db
+
+# Import-to-first-response, best of three runs, on an already bootstrapped
+# database. Measured at about 0.5 s; the margin absorbs slow CI machines.
+STARTUP_BUDGET_SECONDS = 1.5
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+FIRST_REQUEST = '''
+import time
+started = time.perf_counter()
+from main import create_app
+app = create_app()
+response = app.test_client().get('/healthz')
+assert response.status_code == 200, response.data
+print(time.perf_counter() - started)
+'''
+
+
+def run_python(code, database_url):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+
+def test_import_and_create_app_do_no_database_work():
+    path = os.path.join(tempfile.mkdtemp(), 'untouched.db')
+    output = run_python(
+        'import sys, main\n'
+        'loaded = "routes" in sys.modules\n'
+        'main.create_app()\n'
+        'print(loaded, "routes" in sys.modules)',
+        'sqlite:///' + path
+    )
+    assert output == 'False True'  # Routes load with the first app, not with main
+    assert not os.path.exists(path)
+
+
+def test_first_request_within_startup_budget(app):
+    database_url = str(db.engine.url)  # Bootstrapped by the app fixture
+    timings = [float(run_python(FIRST_REQUEST, database_url)) for _ in range(3)]
+    assert min(timings) < STARTUP_BUDGET_SECONDS, f'startup took {timings} s'
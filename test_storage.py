@@ -0,0 +1,74 @@
+"""
+Tests for the SQLite storage profile and the read connection pool
+"""
+import time
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from database import db, Movement
+from storage import DEFAULT_PRAGMAS, READ_BIND
+from test_grid import login_staff
+from test_inventory import add_product, move
+
+
+def pragma(connection, name):
+    return connection.execute(text(f'PRAGMA {name}')).scalar()
+
+
+@pytest.mark.parametrize('bind', [None, READ_BIND])
+def test_every_connection_gets_the_profile(app, bind):
+    with db.engines[bind].connect() as connection:
+        assert pragma(connection, 'journal_mode') == 'wal'
+        assert pragma(connection, 'synchronous') == 1  # NORMAL
+        assert pragma(connection, 'busy_timeout') == DEFAULT_PRAGMAS['busy_timeout']
+        assert pragma(connection, 'cache_size') == DEFAULT_PRAGMAS['cache_size']
+        assert pragma(connection, 'query_only') == (1 if bind == READ_BIND else 0)
+
+
+def test_read_connections_refuse_writes(app):
+    with db.engines[READ_BIND].connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text("INSERT INTO locations (location_id) VALUES ('Nowhere')"))
+
+
+def record_statements(engine):
+    statements = []
+    event.listen(engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_report_routes_run_on_the_read_pool(client):
+    add_product('Apples')
+    move('Apples', 5, to_location='Pantry')
+    login_staff(client)
+
+    reads = record_statements(db.engines[READ_BIND])
+    writes = record_statements(db.engines[None])
+    for url in ('/grid/products', '/product-balance/', '/product-balance/csv'):
+        assert client.get(url).status_code == 200
+    assert reads and not writes
+
+    # Unmarked routes keep using the writer
+    reads.clear()
+    client.post('/movements/', data={'productId': 'Apples', 'qty': 1, 'fromLocation': 'Pantry',
+                                     'toLocation': 'Customer'})
+    assert writes and not reads
+
+
+def test_open_reader_does_not_block_a_commit(app):
+    add_product('Apples')
+    for _ in range(20):
+        move('Apples', 1, to_location='Pantry')
+
+    with db.engines[READ_BIND].connect() as reader:
+        rows = reader.execute(text('SELECT qty FROM movements'))
+        rows.fetchone()  # Read transaction left open mid-scan
+
+        started = time.monotonic()
+        move('Apples', 1, to_location='Pantry')
+        assert time.monotonic() - started < 1
+
+        # The reader keeps the snapshot it started with
+        assert reader.execute(text('SELECT COUNT(*) FROM movements')).scalar() == 20
+        rows.close()
+    assert Movement.query.count() == 21
@@ -0,0 +1,117 @@
+"""
+Tests for type-ahead suggestions (suggest.py)
+"""
+import time
+from database import db, Client, Product
+import catalog
+import suggest
+from test_inventory import move, record_queries
+
+# Best of three suggestions on a 20k-product catalog, index already built
+SUGGEST_BUDGET_SECONDS = 0.005
+
+
+def add_product(name, description='', nutrition_score=50, stock=5):
+    db.session.add(Product(product_id=name, description=description, category='Pantry Staples',
+                           nutrition_score=nutrition_score))
+    db.session.commit()
+    if stock:
+        move(name, stock, to_location='Pantry')
+
+
+def names(query, limit=suggest.DEFAULT_LIMIT):
+    products, terms = suggest.suggest(query, limit)
+    return [record.product_id for record, available in products]
+
+
+def test_name_and_word_prefixes(app):
+    add_product('Peanut Butter', 'Creamy spread', nutrition_score=40)
+    add_product('Peas', 'Sweet green peas in a creamy sauce', nutrition_score=80)
+    add_product('Butter Beans', nutrition_score=60)
+    add_product('Pears', stock=0)
+
+    assert names('pe') == ['Peas', 'Peanut Butter']  # Best score first; out-of-stock Pears left out
+    assert names('peanut bu') == ['Peanut Butter']
+    assert names('BUT') == ['Butter Beans', 'Peanut Butter']  # Name prefix before word prefix
+    assert names('  ') == []
+    assert suggest.suggest('cre')[1] == ['creamy']  # Shared by two descriptions
+    assert suggest.suggest('swe')[1] == []
+
+
+def test_index_is_updated_with_the_catalog(app):
+    add_product('Peas')
+    assert names('pe') == ['Peas']
+    index = suggest._current()
+
+    add_product('Pecans')
+    product = Product.query.filter_by(product_id='Peas').one()
+    product.nutrition_score = 10
+    db.session.commit()
+    assert names('pe') == ['Pecans', 'Peas']  # Peas now scores lower
+    assert suggest._current() is not index
+    assert suggest._current().records['Peas'].nutrition_score == 10
+
+
+def test_update_matches_a_full_rebuild(app):
+    for i in range(10):
+        add_product(f'Bean {i}', f'shared word{i % 3}', stock=0)
+    suggest.load()
+    for product in Product.query.filter(Product.product_id.in_(['Bean 1', 'Bean 2'])):
+        product.product_id = product.product_id.replace('Bean', 'Rice')
+        product.description = 'fresh'
+    db.session.commit()
+
+    version, products = catalog.snapshot()
+    updated = suggest._current()
+    rebuilt = suggest._PrefixIndex()
+    rebuilt.rebuild(version, products)
+    assert (updated.names, updated.words, updated.terms) == (rebuilt.names, rebuilt.words, rebuilt.terms)
+
+
+def test_suggest_endpoint(client):
+    db.session.add(Client(client_id='C00001', name='Test Client'))
+    db.session.commit()
+    add_product('Peanut Butter')
+    assert client.get('/shop/suggest?q=pea').json['success'] is False
+
+    client.post('/shop/login', data={'client_id': 'C00001'})
+    suggest.load()
+    responses = []
+    statements = record_queries(lambda: responses.append(client.get('/shop/suggest?q=pea')))
+    data = responses[0].json
+    assert data['products'] == [{'product_id': 'Peanut Butter', 'category': 'Pantry Staples', 'points': 1,
+                                 'image_url': '', 'available_qty': 5}]
+    assert not [s for s in statements if 'FROM products' in s]
+
+
+def test_in_stock_matches_behind_many_out_of_stock_ones(app):
+    for i in range(40):
+        add_product(f'Pasta {i:02}', nutrition_score=90, stock=0)
+    add_product('Pasta Sauce', nutrition_score=20)
+    add_product('Parsnips', nutrition_score=70)
+    assert names('pa', limit=2) == ['Parsnips', 'Pasta Sauce']
+    assert names('pa', limit=1) == ['Parsnips']
+
+
+def test_suggest_within_budget(app):
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            'INSERT INTO products (product_id, category, description, nutrition_score, dietary_mask, allergen_mask) '
+            'VALUES (?, ?, ?, ?, 0, 0)',
+            [(f'Item {i:05d} brand{i % 97}', 'Pantry Staples', f'term{i % 500} term{i % 311}', i % 100)
+             for i in range(20000)]
+        )
+        connection.exec_driver_sql(
+            "INSERT INTO stock_balances (product_id, location_id, qty) SELECT product_id, 'Pantry', id % 2 FROM products"
+        )
+    catalog.invalidate()
+    suggest.load()
+
+    for query in ('it', 'item 0001', 'brand4', 'term1'):
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            products, terms = suggest.suggest(query)
+            timings.append(time.perf_counter() - started)
+        assert products or terms, query
+        assert min(timings) < SUGGEST_BUDGET_SECONDS, f'{query!r} took {timings} s'
@@ -0,0 +1,100 @@
+"""
+Tests for the healthier-swap index (swaps.py)
+"""
+from sqlalchemy import text
+from database import db, Client, Product, STOCK_VERSION
+import swaps
+from test_inventory import move, record_queries
+
+
+def add_product(name, nutrition_score, allergens=(), category='Grains', stock=5):
+    product = Product(product_id=name, category=category, nutrition_score=nutrition_score)
+    product.set_allergens(list(allergens))
+    db.session.add(product)
+    db.session.commit()
+    if stock:
+        move(name, stock, to_location='Pantry')
+
+
+def swap_ids(product_id, **kwargs):
+    return [record.product_id for record, qty in swaps.healthier(product_id, **kwargs)]
+
+
+def stock_grains():
+    add_product('White Bread', 30)
+    add_product('Wheat Bread', 60, ['gluten'])
+    add_product('Oats', 70)
+    add_product('Quinoa', 90, stock=0)
+    add_product('Granola', 80, ['tree nuts', 'peanuts'])
+    add_product('Brown Rice', 75, category='Rice')
+
+
+def test_best_in_stock_first(app):
+    stock_grains()
+    assert swap_ids('White Bread') == ['Granola', 'Oats', 'Wheat Bread']
+    assert swap_ids('White Bread', limit=1) == ['Granola']
+    assert swap_ids('Oats') == ['Granola']
+    assert swap_ids('Granola') == []
+    assert swaps.healthier('Missing') is None
+
+
+def test_allergens_and_excluded_products_are_skipped(app):
+    stock_grains()
+    from dietary import allergen_mask
+    assert swap_ids('White Bread', avoid=allergen_mask(['Nuts'])) == ['Oats', 'Wheat Bread']
+    assert swap_ids('White Bread', avoid=allergen_mask(['Nuts', 'Gluten'])) == ['Oats']
+    assert swap_ids('White Bread', exclude=['Oats']) == ['Granola', 'Wheat Bread']
+
+
+def test_stock_changes_are_seen_without_a_rebuild(app):
+    stock_grains()
+    assert swap_ids('White Bread') == ['Granola', 'Oats', 'Wheat Bread']
+    index = swaps._index
+
+    move('Granola', 5, from_location='Pantry', to_location='Customer')
+    assert swap_ids('White Bread') == ['Oats', 'Wheat Bread']
+
+    # Another worker restocks Quinoa through its own connection
+    with db.engine.begin() as connection:
+        connection.execute(text("INSERT INTO stock_balances (product_id, location_id, qty) VALUES ('Quinoa', 'Pantry', 2)"))
+        connection.execute(text('UPDATE counter SET value = value + 1 WHERE name = :name'), {'name': STOCK_VERSION})
+    assert swap_ids('White Bread') == ['Quinoa', 'Oats', 'Wheat Bread']
+    assert swaps._index is index  # Sales and restocks never rebuild the index
+
+    product = Product.query.filter_by(product_id='Oats').one()
+    product.nutrition_score = 20
+    db.session.commit()
+    assert swap_ids('White Bread') == ['Quinoa', 'Wheat Bread']
+    assert swaps._index is not index
+
+
+def test_walks_past_out_of_stock_candidates(app):
+    for i in range(20):
+        add_product(f'Sold Out {i:02}', 90 - i, stock=0)
+    add_product('Barley', 50)
+    add_product('White Bread', 30)
+    assert swap_ids('White Bread') == ['Barley']
+
+
+def test_batch_endpoint_covers_the_whole_cart(client):
+    stock_grains()
+    shopper = Client(client_id='C00001', name='Test Client')
+    shopper.set_allergens(['Nuts'])
+    db.session.add(shopper)
+    db.session.commit()
+    client.post('/shop/login', data={'client_id': 'C00001'})
+    client.post('/shop/add-to-cart', json={'product_id': 'White Bread'})
+    client.post('/shop/add-to-cart', json={'product_id': 'Wheat Bread'})
+    swaps.load()
+
+    responses = []
+    statements = record_queries(lambda: responses.append(client.get('/shop/healthier-swaps')))
+    found = responses[0].json['swaps']
+    assert [alt['product_id'] for alt in found['White Bread']['alternatives']] == ['Oats']
+    assert [alt['product_id'] for alt in found['Wheat Bread']['alternatives']] == ['Oats']
+    assert found['White Bread']['current_score'] == 30
+    assert not [s for s in statements if 'FROM products' in s]
+    assert len([s for s in statements if 'stock_balances' in s]) == 1  # One stock read for the whole cart
+
+    single = client.get('/shop/healthier-swap/White Bread').json
+    assert [alt['product_id'] for alt in single['alternatives']] == ['Oats', 'Wheat Bread']
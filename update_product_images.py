@@ -163,6 +163,7 @@ def update_all_images():
         
         db.session.commit()
         print(f"\nUpdated {updated} product images")
+        print("Run 'python images.py mirror' to keep local copies of them")
 
 if __name__ == '__main__':
     update_all_images()